@@ -0,0 +1,364 @@
+# Copyright © 2018 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
+
+DOCUMENTATION = '''
+---
+name: vcd
+plugin_type: inventory
+short_description: vCloud Director inventory source
+version_added: "2.7"
+description:
+    - Build the inventory from the VMs of vCloud Director
+    - The VMs are read with paged vm typed queries, the pages being
+      requested concurrently, and grouped by org, vdc, vApp and metadata
+    - The inventory file name must end with vcd.yml or vcd.yaml
+extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+options:
+    plugin:
+        description:
+            - token that ensures this is a source file for the plugin
+        required: true
+        choices: ['vcd']
+    user:
+        description:
+            - vCloud Director user name
+        required: true
+        env:
+            - name: env_user
+    password:
+        description:
+            - vCloud Director user password
+        required: true
+        env:
+            - name: env_password
+    host:
+        description:
+            - vCloud Director host address
+        required: true
+        env:
+            - name: env_host
+    org:
+        description:
+            - Organization name on vCloud Director to access
+        required: true
+        env:
+            - name: env_org
+    api_version:
+        description:
+            - Pyvcloud API version
+        default: '30.0'
+        env:
+            - name: env_api_version
+    verify_ssl_certs:
+        description:
+            - whether to use secure connection to vCloud Director host
+        type: bool
+        default: false
+        env:
+            - name: env_verify_ssl_certs
+    org_name:
+        description:
+            - Only include the VMs of this organization (system
+              administrators see the VMs of every organization otherwise)
+        required: false
+    metadata_keys:
+        description:
+            - VM metadata keys read along with the VMs, each VM is added
+              to the group <key>_<value> of its value
+        type: list
+        default: []
+    page_size:
+        description:
+            - Number of VMs requested per query page
+        type: int
+        default: 128
+    workers:
+        description:
+            - Number of query pages requested concurrently
+        type: int
+        default: 4
+'''
+
+EXAMPLES = '''
+# vcd.yml, caching the VMs for an hour
+# (run ansible-inventory --flush-cache to refresh them)
+plugin: vcd
+host: vcd.example.com
+org: System
+user: administrator
+password: XXXXXXXXXX
+org_name: Acme
+metadata_keys:
+  - role
+cache: true
+cache_plugin: jsonfile
+cache_connection: ~/.ansible/vcd/inventory
+cache_timeout: 3600
+keyed_groups:
+  - key: vcd_os
+    prefix: os
+'''
+
+import importlib.util
+from collections import Counter
+from urllib.parse import quote
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from pyvcloud.vcd.client import Client
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud.vcd.client import BasicLoginCredentials
+from pyvcloud.vcd.utils import get_non_admin_href
+from ansible.errors import AnsibleError
+from ansible.plugins.inventory import BaseInventoryPlugin
+from ansible.plugins.inventory import Constructable
+from ansible.plugins.inventory import Cacheable
+from ansible.plugins.loader import module_utils_loader
+
+
+# record attribute: host variable
+VM_HOST_VARS = {
+    'name': 'vcd_name',
+    'href': 'vcd_href',
+    'containerName': 'vcd_vapp',
+    'status': 'vcd_status',
+    'guestOs': 'vcd_os',
+    'numberOfCpus': 'vcd_cpus',
+    'memoryMB': 'vcd_memory_mb',
+    'ipAddress': 'vcd_ip_address',
+    'networkName': 'vcd_network',
+    'storageProfileName': 'vcd_storage_profile',
+}
+VM_QUERY_FIELDS = list(VM_HOST_VARS.keys()) + ['container', 'vdc']
+
+
+def import_module_utils(name):
+    '''
+        Inventory plugins run on the controller, where the module_utils
+        configured next to the modules can't be imported as
+        ansible.module_utils.<name>; the module is loaded from its path.
+    '''
+    path = module_utils_loader.find_plugin(name)
+    if path is None:
+        raise AnsibleError('module_utils {0} not found'.format(name))
+    spec = importlib.util.spec_from_file_location(
+        'ansible_vcd_{0}'.format(name), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def get_host_name(vm, level):
+    '''
+        Host name of the VM qualified up to level: its VM name, then its
+        vApp, then its org and vdc, then the id of the VM.
+    '''
+    name = vm['vcd_name']
+    if level >= 1:
+        name = '{0}_{1}'.format(vm['vcd_vapp'], name)
+    if level >= 2:
+        name = '{0}_{1}_{2}'.format(vm['vcd_org'], vm['vcd_vdc'], name)
+    if level >= 3:
+        name = '{0}_{1}'.format(name, (vm['vcd_href'] or '').split('/')[-1])
+
+    return name
+
+
+def get_host_names(vms):
+    '''
+        VMs are named after their VM name, and every VM whose name is
+        shared by another one is qualified one level further, until all
+        the names are unique. Names only depend on the whole list of VMs,
+        not on its order.
+    '''
+    levels = [0] * len(vms)
+    while True:
+        names = [get_host_name(vm, level) for vm, level in zip(vms, levels)]
+        counts = Counter(names)
+        duplicates = [index for index, name in enumerate(names)
+                      if counts[name] > 1 and levels[index] < 3]
+        if not duplicates:
+            return names
+
+        for index in duplicates:
+            levels[index] += 1
+
+
+def get_localname(element):
+    return etree.QName(element.tag).localname
+
+
+def get_record_metadata(record):
+    '''
+        Metadata requested with fields=metadata:<key> come back as
+        Metadata/MetadataEntry children of the record.
+    '''
+    metadata = dict()
+    for element in record.iter():
+        if get_localname(element) != 'MetadataEntry':
+            continue
+        key, value = None, None
+        for child in element.iter():
+            if get_localname(child) == 'Key':
+                key = child.text
+            elif get_localname(child) == 'Value':
+                value = child.text
+        if key is not None:
+            metadata[key] = value
+
+    return metadata
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+    NAME = 'vcd'
+
+    def verify_file(self, path):
+        return (super(InventoryModule, self).verify_file(path) and
+                path.endswith(('vcd.yml', 'vcd.yaml')))
+
+    def login(self):
+        workers = max(self.get_option('workers'), 1)
+        self.client = Client(self.get_option('host'),
+                             api_version=self.get_option('api_version'),
+                             verify_ssl_certs=self.get_option('verify_ssl_certs'))
+        try:
+            self.client.set_credentials(BasicLoginCredentials(
+                self.get_option('user'), self.get_option('org'),
+                self.get_option('password')))
+        except Exception as error:
+            raise AnsibleError('Login failed for user {0} to org {1}: {2}'.format(
+                self.get_option('user'), self.get_option('org'), error))
+
+        # one connection per worker so the pages are not serialized on
+        # the default pool
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.client._session.mount('https://', adapter)
+        self.client._session.mount('http://', adapter)
+        self.is_sysadmin = self.client.is_sysadmin()
+
+    def get_filters(self):
+        org_name = self.get_option('org_name')
+        if not org_name:
+            return None, None
+
+        if not self.is_sysadmin:
+            # the queries of an org user only return that org
+            return None, None
+
+        org_href = get_non_admin_href(
+            self.client.get_org_by_name(org_name).get('href'))
+
+        return 'org=={0}'.format(org_href), 'orgName=={0}'.format(
+            quote(org_name))
+
+    def get_vms(self):
+        '''
+            Return the VMs as plain dicts (which the inventory cache can
+            store) with their org, vdc and requested metadata.
+        '''
+        self.login()
+        vm_type = ResourceType.VM.value
+        vdc_type = ResourceType.ORG_VDC.value
+        if self.is_sysadmin:
+            vm_type = ResourceType.ADMIN_VM.value
+            vdc_type = ResourceType.ADMIN_ORG_VDC.value
+
+        vm_filter = 'isVAppTemplate==false'
+        org_filter, vdc_filter = self.get_filters()
+        if org_filter is not None:
+            vm_filter = '{0};{1}'.format(org_filter, vm_filter)
+
+        fields = None
+        metadata_keys = self.get_option('metadata_keys')
+        if metadata_keys:
+            fields = ','.join(VM_QUERY_FIELDS + [
+                'metadata:{0}'.format(key) for key in metadata_keys])
+
+        vcd_query = import_module_utils('vcd_query')
+        records = vcd_query.run_paged_queries(self.client, {
+            'vdcs': (vdc_type, vdc_filter),
+            'vms': (vm_type, vm_filter, fields)
+        }, page_size=self.get_option('page_size'),
+            workers=self.get_option('workers'))
+        vdcs = dict([
+            (get_non_admin_href(record.get('href')),
+             (record.get('orgName') or self.get_option('org'),
+              record.get('name')))
+            for record in records['vdcs']
+        ])
+
+        vms = list()
+        for record in records['vms']:
+            org, vdc = vdcs.get(get_non_admin_href(record.get('vdc') or ''),
+                                (None, None))
+            if org is None:
+                continue
+            vm = dict([(name, record.get(attribute))
+                       for attribute, name in VM_HOST_VARS.items()])
+            vm['vcd_org'] = org
+            vm['vcd_vdc'] = vdc
+            vm['vcd_metadata'] = get_record_metadata(record)
+            vms.append(vm)
+
+        return vms
+
+    def add_group(self, name, parent=None):
+        group = self.inventory.add_group(self._sanitize_group_name(name))
+        if parent is not None:
+            self.inventory.add_child(parent, group)
+
+        return group
+
+    def populate(self, vms):
+        strict = self.get_option('strict')
+        vms = sorted(vms, key=lambda vm: (
+            vm['vcd_org'], vm['vcd_vdc'], vm['vcd_vapp'] or '',
+            vm['vcd_name'] or '', vm['vcd_href'] or ''))
+        for vm, host in zip(vms, get_host_names(vms)):
+            org_group = self.add_group('org_{0}'.format(vm['vcd_org']))
+            vdc_group = self.add_group('vdc_{0}'.format(vm['vcd_vdc']),
+                                       org_group)
+            vapp_group = self.add_group('vapp_{0}'.format(vm['vcd_vapp']),
+                                        vdc_group)
+            self.inventory.add_host(host, group=vapp_group)
+            for key, value in vm['vcd_metadata'].items():
+                self.inventory.add_host(
+                    host, group=self.add_group('{0}_{1}'.format(key, value)))
+
+            for name, value in vm.items():
+                self.inventory.set_variable(host, name, value)
+            if vm.get('vcd_ip_address'):
+                self.inventory.set_variable(host, 'ansible_host',
+                                            vm.get('vcd_ip_address'))
+
+            self._set_composite_vars(self.get_option('compose'), vm, host,
+                                     strict=strict)
+            self._add_host_to_composed_groups(self.get_option('groups'), vm,
+                                              host, strict=strict)
+            self._add_host_to_keyed_groups(self.get_option('keyed_groups'),
+                                           vm, host, strict=strict)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option('cache') and cache
+        update_cache = self.get_option('cache') and not cache
+
+        vms = None
+        if use_cache:
+            try:
+                vms = self._cache[cache_key]
+            except KeyError:
+                update_cache = True
+
+        if vms is None:
+            vms = self.get_vms()
+
+        if update_cache:
+            self._cache[cache_key] = vms
+
+        self.populate(vms)
@@ -1,40 +1,92 @@
 
-import traceback
+from lxml import etree
+from pyvcloud.vcd.client import EntityType
+from pyvcloud.vcd.client import create_element
 from pyvcloud.vcd.firewall_rule import FirewallRule
-from pyvcloud.vcd.exceptions import BadRequestException
+from pyvcloud.vcd.utils import build_network_url_from_gateway_url
+from pyvcloud.vcd.network_url_constants import FIREWALL_URL_TEMPLATE
 from pyvcloud.vcd.exceptions import EntityNotFoundException
+from pyvcloud.vcd.exceptions import InvalidParameterException
+from ansible.module_utils.gateway_utils import E
+
+
+FIREWALL_PROTOCOLS = ['tcp', 'udp', 'icmp', 'any']
+FIREWALL_GROUP_OBJECTS = ['securitygroup', 'ipset', 'virtualmachine',
+                          'network']
+FIREWALL_VNIC_GROUPS = ['gatewayinterface']
 
 
 class FirewallService():
+    '''
+        Manages the firewall rules of an edge gateway.
+
+        The firewall config (every rule of the edge) is read once per
+        operation and indexed by rule name. Rules are added, edited and
+        removed in that document, which is then sent back to the edge in
+        a single PUT.
+    '''
+
     def __init__(self, gateway, service_params=None):
         self.gateway = gateway
         self.service_params = service_params
+        self.firewall_config = None
+        self.rule_index = None
+        self.firewall_objects = dict()
+
+    def get_firewall_config(self):
+        if self.firewall_config is None:
+            self.firewall_config = self.gateway.get_firewall_rules()
+            self.rule_index = dict()
+            for fw_rule in self.get_rule_elements():
+                self.rule_index.setdefault(str(fw_rule.name), fw_rule)
+
+        return self.firewall_config
+
+    def get_rule_elements(self):
+        firewall_rules = self.get_firewall_config().firewallRules
+        if not hasattr(firewall_rules, 'firewallRule'):
+            return list()
+
+        return list(firewall_rules.firewallRule)
+
+    def get_rule_index(self):
+        self.get_firewall_config()
+
+        return self.rule_index
+
+    def apply_firewall_config(self):
+        firewall_config_href = build_network_url_from_gateway_url(
+            self.gateway.href) + FIREWALL_URL_TEMPLATE
+        self.gateway.client.put_resource(
+            firewall_config_href, self.firewall_config,
+            EntityType.DEFAULT_CONTENT_TYPE.value)
+        # read the config again on next use to pick the ids of new rules
+        self.firewall_config = None
+        self.rule_index = None
 
     def get_firewall_rules(self):
         response = dict()
         response['changed'] = False
         response['msg'] = list()
 
-        fw_rules = self.gateway.get_firewall_rules_list()
-        for fw_rule in fw_rules:
+        for fw_rule in self.get_rule_elements():
             response['msg'].append({
-                "name": str(fw_rule["name"]),
-                "id": int(fw_rule["ID"]),
-                "type": str(fw_rule["ruleType"])
+                "name": str(fw_rule.name),
+                "id": int(fw_rule.id),
+                "type": str(fw_rule.ruleType)
             })
 
         return response
 
     def get_firewall_rule(self, fw_rule_name):
-        fw_rules = self.get_firewall_rules()['msg']
-        for fw_rule in fw_rules:
-            if fw_rule["name"] == fw_rule_name:
-                return FirewallRule(client=self.gateway.client,
-                                    gateway_name=self.gateway.name,
-                                    resource_id=fw_rule["id"])
+        fw_rule = self.get_rule_index().get(fw_rule_name)
+        if fw_rule is None or not hasattr(fw_rule, 'id'):
+            msg = "Firewall rule {0} does not exists"
+            raise EntityNotFoundException(msg.format(fw_rule_name))
 
-        msg = "Firewall rule {0} does not exists"
-        raise EntityNotFoundException(msg.format(fw_rule_name))
+        return FirewallRule(client=self.gateway.client,
+                            gateway_name=self.gateway.name,
+                            resource_id=int(fw_rule.id))
 
     def manage_states(self, state=None):
         if state == "present":
@@ -46,6 +98,9 @@ class FirewallService():
         if state == "absent":
             return self.delete()
 
+        if state == "synced":
+            return self.sync()
+
         raise Exception("Please provide a valid state for the service")
 
     def manage_operations(self, operation=None):
@@ -83,6 +138,155 @@ class FirewallService():
 
         return response
 
+    def get_firewall_objects(self, direction, object_type):
+        key = (direction, object_type)
+        if key not in self.firewall_objects:
+            self.firewall_objects[key] = self.gateway.list_firewall_objects(
+                direction, object_type)
+
+        return self.firewall_objects[key]
+
+    def get_group_element(self, direction, route_value):
+        value, _, object_type = route_value.rpartition(':')
+        if object_type == 'ip':
+            return create_element('ipAddress', value)
+
+        if object_type in FIREWALL_GROUP_OBJECTS:
+            group_type = 'groupingObjectId'
+        elif object_type in FIREWALL_VNIC_GROUPS:
+            group_type = 'vnicGroupId'
+        else:
+            msg = "{0} {1} is not valid, it should be from {2}"
+            raise InvalidParameterException(msg.format(
+                direction, route_value,
+                FIREWALL_GROUP_OBJECTS + FIREWALL_VNIC_GROUPS + ['ip']))
+
+        for firewall_object in self.get_firewall_objects(direction,
+                                                         object_type):
+            if firewall_object.get('name') != value:
+                continue
+            for prop in firewall_object.get('prop'):
+                if prop.get('name') == group_type:
+                    return create_element(group_type, prop.get('value'))
+
+        msg = "{0} {1} {2} does not exists"
+        raise EntityNotFoundException(msg.format(direction, object_type, value))
+
+    def add_route_values(self, fw_rule, direction, route_values):
+        if not route_values:
+            return
+
+        if not hasattr(fw_rule, direction):
+            fw_rule.append(create_element(direction))
+        group = getattr(fw_rule, direction)
+        if not hasattr(group, 'exclude'):
+            group.append(create_element('exclude', False))
+        for route_value in route_values:
+            group.append(self.get_group_element(direction, route_value))
+
+    def add_service_values(self, fw_rule, services):
+        if not services:
+            return
+
+        if not hasattr(fw_rule, 'application'):
+            fw_rule.append(create_element('application'))
+        for service in services:
+            for protocol, ports in service.items():
+                if protocol not in FIREWALL_PROTOCOLS:
+                    msg = "{0} is not valid. It should be from {1}"
+                    raise InvalidParameterException(msg.format(
+                        protocol, ', '.join(FIREWALL_PROTOCOLS)))
+                for source_port, destination_port in ports.items():
+                    service_tag = create_element('service')
+                    service_tag.append(create_element('protocol', protocol))
+                    service_tag.append(create_element('port',
+                                                      destination_port))
+                    service_tag.append(create_element('sourcePort',
+                                                      source_port))
+                    if protocol == 'icmp':
+                        service_tag.append(create_element('icmpType', 'any'))
+                    fw_rule.application.append(service_tag)
+
+    def get_rule_values(self, service_param):
+        services = service_param.get("services") or None
+        source_values = service_param.get("source_values") or None
+        destination_values = service_param.get("destination_values") or None
+
+        return (self._prepare_route_values(source_values),
+                self._prepare_route_values(destination_values),
+                self._prepare_service_values(services))
+
+    def edit_rule(self, fw_rule, service_param):
+        '''
+            Add the sources, destinations and services of service_param to
+            the rule element. Returns False when any source or destination
+            is 'any', in which case the rule is left as it is.
+        '''
+        source_values, destination_values, services = self.get_rule_values(
+            service_param)
+        if 'any' in destination_values or 'any' in source_values:
+            return False
+
+        self.add_route_values(fw_rule, 'source', source_values)
+        self.add_route_values(fw_rule, 'destination', destination_values)
+        self.add_service_values(fw_rule, services)
+
+        return True
+
+    def create_rule(self, service_param):
+        '''
+            New rule element for service_param. A source or destination of
+            'any' is left out of the rule, which matches any of them.
+        '''
+        enabled = service_param.get("enabled")
+        fw_rule = E.firewallRule()
+        fw_rule.append(create_element('name', service_param.get("name")))
+        fw_rule.append(create_element(
+            'ruleType', service_param.get("type") or 'User'))
+        fw_rule.append(create_element(
+            'enabled', True if enabled is None else enabled))
+        fw_rule.append(create_element(
+            'loggingEnabled', service_param.get("logging_enabled") or False))
+        fw_rule.append(create_element(
+            'action', service_param.get("action") or 'accept'))
+
+        source_values, destination_values, services = self.get_rule_values(
+            service_param)
+        if 'any' not in source_values:
+            self.add_route_values(fw_rule, 'source', source_values)
+        if 'any' not in destination_values:
+            self.add_route_values(fw_rule, 'destination', destination_values)
+        self.add_service_values(fw_rule, services)
+
+        return fw_rule
+
+    def get_rule_content(self, fw_rule):
+        '''
+            Comparable content of a rule element, leaving out its id and
+            type as well as the order of its sources, destinations and
+            services.
+        '''
+        def get_children(tag):
+            element = fw_rule.find(tag)
+            if element is None:
+                return tuple()
+
+            return tuple(sorted([
+                (child.tag, etree.tostring(child, method='c14n'))
+                for child in element.iterchildren()
+                if child.tag != 'exclude' or child.text != 'false'
+            ]))
+
+        return (
+            fw_rule.findtext('name'),
+            (fw_rule.findtext('enabled') or 'true').lower(),
+            (fw_rule.findtext('loggingEnabled') or 'false').lower(),
+            (fw_rule.findtext('action') or '').lower(),
+            get_children('source'),
+            get_children('destination'),
+            get_children('application')
+        )
+
     def add(self):
         response = dict()
         response['changed'] = False
@@ -91,30 +295,22 @@ class FirewallService():
         msg = 'Firewall rule(s) {0} have been created'
         warnings = 'Firewall rule(s) {0} are already present'
 
+        rule_index = self.get_rule_index()
+        firewall_rules = self.get_firewall_config().firewallRules
         for service_param in self.service_params:
             name = service_param.get("name")
-            action = service_param.get("action") or 'accept'
-            firewall_type = service_param.get("type") or 'User'
-            enabled = service_param.get("enabled") or True
-            logging_enabled = service_param.get("logging_enabled") or False
-
-            try:
-                self.get_firewall_rule(name)
-            except EntityNotFoundException:
-                self.gateway.add_firewall_rule(name=name, action=action,
-                                               type=firewall_type,
-                                               enabled=enabled,
-                                               logging_enabled=logging_enabled)
-                try:
-                    self.update([service_param])
-                except Exception:
-                    self.delete([service_param])
-                    raise Exception(traceback.format_exc())
-                else:
-                    response['msg'].append(name)
-                    response['changed'] = True
-            else:
+            if name in rule_index:
                 response['warnings'].append(name)
+                continue
+
+            fw_rule = self.create_rule(service_param)
+            firewall_rules.append(fw_rule)
+            rule_index[name] = fw_rule
+            response['msg'].append(name)
+            response['changed'] = True
+
+        if response['changed']:
+            self.apply_firewall_config()
 
         return self._update_response(response, msg, warnings)
 
@@ -126,33 +322,28 @@ class FirewallService():
         msg = 'Firewall rule(s) {0} have been updated'
         warnings = 'Firewall rule(s) {0} are not present'
 
+        rule_index = self.get_rule_index()
         service_params = service_params or self.service_params
         for service_param in service_params:
             name = service_param.get("name")
             new_name = service_param.get("new_name") or name
-            services = service_param.get("services") or None
-            source_values = service_param.get("source_values") or None
-            destination_values = service_param.get(
-                "destination_values") or None
-
-            try:
-                firewall_rule = self.get_firewall_rule(name)
-                services = self._prepare_service_values(services)
-                source_values = self._prepare_route_values(source_values)
-                destination_values = self._prepare_route_values(
-                    destination_values)
-                if 'any' in destination_values or 'any' in source_values:
-                    continue
-                firewall_rule.edit(source_values=source_values,
-                                   services=services,
-                                   destination_values=destination_values,
-                                   new_name=new_name)
-                response['msg'].append(name)
-                response['changed'] = True
-            except EntityNotFoundException:
+            fw_rule = rule_index.get(name)
+            if fw_rule is None:
                 response['warnings'].append(name)
-            except BadRequestException as ex:
-                raise Exception(ex)
+                continue
+
+            if not self.edit_rule(fw_rule, service_param):
+                continue
+
+            if new_name != name:
+                fw_rule.name = new_name
+                del rule_index[name]
+                rule_index[new_name] = fw_rule
+            response['msg'].append(name)
+            response['changed'] = True
+
+        if response['changed']:
+            self.apply_firewall_config()
 
         return self._update_response(response, msg, warnings)
 
@@ -164,16 +355,103 @@ class FirewallService():
         msg = 'Firewall rule(s) {0} have been deleted'
         warnings = 'Firewall rule(s) {0} are not present'
 
+        rule_index = self.get_rule_index()
+        firewall_rules = self.get_firewall_config().firewallRules
         service_params = service_params or self.service_params
         for service_param in service_params:
-            try:
-                name = service_param.get("name")
-                firewall_rule = self.get_firewall_rule(name)
-            except EntityNotFoundException:
+            name = service_param.get("name")
+            fw_rule = rule_index.pop(name, None)
+            if fw_rule is None:
                 response['warnings'].append(name)
-            else:
-                firewall_rule.delete()
-                response['msg'].append(name)
-                response['changed'] = True
+                continue
+
+            firewall_rules.remove(fw_rule)
+            response['msg'].append(name)
+            response['changed'] = True
+
+        if response['changed']:
+            self.apply_firewall_config()
 
         return self._update_response(response, msg, warnings)
+
+    def sync(self):
+        '''
+            Make the user rules of the edge exactly the rules of
+            service_params, in their order.
+
+            Unchanged rules are kept as they are, changed rules are
+            rewritten in place (keeping their id) and the other user rules
+            are removed. The kept rules which move are reported as
+            reordered. System rules keep their position around the user
+            rules. The config is only sent back, in one PUT, when it differs.
+        '''
+        response = dict()
+        response['changed'] = False
+        response['msg'] = dict(added=list(), updated=list(), deleted=list(),
+                               reordered=list())
+
+        rule_elements = self.get_rule_elements()
+        user_rules = [fw_rule for fw_rule in rule_elements
+                      if str(fw_rule.ruleType).lower() == 'user']
+        current_rules = dict([(str(fw_rule.name), fw_rule)
+                              for fw_rule in reversed(user_rules)])
+
+        desired_rules = list()
+        matched_rules = list()
+        for service_param in self.service_params:
+            name = service_param.get("name")
+            desired_rule = self.create_rule(service_param)
+            current_rule = current_rules.pop(name, None)
+            if current_rule is None:
+                response['msg']['added'].append(name)
+                desired_rules.append(desired_rule)
+                continue
+
+            matched_rules.append(current_rule)
+            if (self.get_rule_content(current_rule) !=
+                    self.get_rule_content(desired_rule)):
+                response['msg']['updated'].append(name)
+                desired_rule.insert(0, create_element('id', current_rule.id))
+                desired_rules.append(desired_rule)
+            else:
+                desired_rules.append(current_rule)
+
+        deleted = [fw_rule for fw_rule in user_rules
+                   if not any(fw_rule is matched for matched in matched_rules)]
+        response['msg']['deleted'] = [str(fw_rule.name) for fw_rule in deleted]
+
+        # the kept rules whose order among the kept rules changes
+        current_order = [str(fw_rule.name) for fw_rule in user_rules
+                         if any(fw_rule is matched for matched in matched_rules)]
+        desired_order = [str(fw_rule.name) for fw_rule in matched_rules]
+        response['msg']['reordered'] = [
+            name for name, current in zip(desired_order, current_order)
+            if name != current
+        ]
+
+        if (len(desired_rules) == len(user_rules) and
+                all(desired is current for desired, current in
+                    zip(desired_rules, user_rules))):
+            return response
+
+        # user rules take the place of the first one, system rules stay
+        # before or after them
+        is_user_rule = [str(fw_rule.ruleType).lower() == 'user'
+                        for fw_rule in rule_elements]
+        first_user_index = (is_user_rule.index(True) if any(is_user_rule)
+                            else len(rule_elements))
+        system_head = [fw_rule for index, fw_rule in enumerate(rule_elements)
+                       if not is_user_rule[index] and index < first_user_index]
+        system_tail = [fw_rule for index, fw_rule in enumerate(rule_elements)
+                       if not is_user_rule[index] and index > first_user_index]
+
+        firewall_rules = self.get_firewall_config().firewallRules
+        for fw_rule in rule_elements:
+            firewall_rules.remove(fw_rule)
+        for fw_rule in system_head + desired_rules + system_tail:
+            firewall_rules.append(fw_rule)
+
+        self.apply_firewall_config()
+        response['changed'] = True
+
+        return response
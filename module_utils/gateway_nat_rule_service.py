@@ -1,13 +1,33 @@
 
-from pyvcloud.vcd.nat_rule import NatRule
+from pyvcloud.vcd.client import EntityType
+from pyvcloud.vcd.client import create_element
 from pyvcloud.vcd.utils import build_network_url_from_gateway_url
+from pyvcloud.vcd.network_url_constants import NAT_URL_TEMPLATE
 from pyvcloud.vcd.network_url_constants import NAT_RULE_URL_TEMPLATE
+from ansible.module_utils.gateway_utils import E
+
+
+def get_text(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    return str(value)
 
 
 class NatRuleService():
+    '''
+        Manages the NAT rules of an edge gateway.
+
+        The NAT config is read once per operation. Rules are matched by
+        their content (action, original and translated address and port,
+        protocol and vnic) so that re-adding a rule is a no-op, and all
+        the changes are sent back to the NAT config in a single PUT.
+    '''
+
     def __init__(self, gateway, service_params=None):
         self.gateway = gateway
         self.service_params = service_params
+        self.nat_config = None
 
     def manage_states(self, state=None):
         if state == "present":
@@ -27,114 +47,265 @@ class NatRuleService():
 
         raise Exception("Please provide a valid operation for the service")
 
+    def _update_response(self, response, msg, warnings):
+        if response['msg']:
+            response['msg'] = msg.format(response['msg'])
+        if response['warnings']:
+            response['warnings'] = warnings.format(response['warnings'])
+
+        return response
+
     def get_nat_rule_href(self, nat_rule_id):
         network_url = build_network_url_from_gateway_url(self.gateway.href)
         nat_href = network_url + NAT_RULE_URL_TEMPLATE
 
         return nat_href.format(nat_rule_id)
 
+    def get_nat_config(self):
+        if self.nat_config is None:
+            self.nat_config = self.gateway.get_nat_rules()
+
+        return self.nat_config
+
+    def get_rule_elements(self):
+        nat_rules = self.get_nat_config().natRules
+        if not hasattr(nat_rules, 'natRule'):
+            return list()
+
+        return list(nat_rules.natRule)
+
+    def apply_nat_config(self):
+        network_url = build_network_url_from_gateway_url(self.gateway.href)
+        self.gateway.client.put_resource(
+            network_url + NAT_URL_TEMPLATE, self.nat_config,
+            EntityType.DEFAULT_CONTENT_TYPE.value)
+        self.nat_config = None
+
     def get_nat_rules(self):
         response = dict()
         response['changed'] = False
         response['msg'] = list()
 
-        nat_rules_resource = self.gateway.get_nat_rules()
-        if (hasattr(nat_rules_resource.natRules, 'natRule')):
-            for nat_rule in nat_rules_resource.natRules.natRule:
-                nat_rule_info = {}
-                nat_rule_info['ID'] = int(nat_rule.ruleId)
-                nat_rule_info['Action'] = str(nat_rule.action)
-                nat_rule_info['Enabled'] = str(nat_rule.enabled)
-                if hasattr(nat_rule, 'description'):
-                    nat_rule_info['Description'] = str(nat_rule.description)
-                nat_rule_info['href'] = self.get_nat_rule_href(
-                    nat_rule_info['ID'])
-                response['msg'].append(nat_rule_info)
+        for nat_rule in self.get_rule_elements():
+            nat_rule_info = {}
+            nat_rule_info['ID'] = int(nat_rule.ruleId)
+            nat_rule_info['Action'] = str(nat_rule.action)
+            nat_rule_info['Enabled'] = str(nat_rule.enabled)
+            if hasattr(nat_rule, 'description'):
+                nat_rule_info['Description'] = str(nat_rule.description)
+            nat_rule_info['href'] = self.get_nat_rule_href(
+                nat_rule_info['ID'])
+            response['msg'].append(nat_rule_info)
 
         return response
 
+    def get_rule_values(self, service_param, defaults=False):
+        '''
+            Values of the rule elements given in service_param. With
+            defaults, for new rules, the values not given get the same
+            defaults as the rules created by pyvcloud.
+        '''
+        def get(name, default):
+            value = service_param.get(name)
+            if value is None and defaults:
+                return default
+
+            return value
+
+        action = service_param.get("action")
+        protocol = get("protocol", 'any')
+        values = [
+            ('ruleType', get("access_type", 'User')),
+            ('action', action),
+            ('originalAddress', service_param.get("original_address")),
+            ('translatedAddress', service_param.get("translated_address")),
+            ('loggingEnabled', get("logging_enabled", False)),
+            ('enabled', get("enabled", True)),
+            ('description', service_param.get("description")),
+            ('vnic', get("vnic", 0)),
+        ]
+        # DNAT rules require additional parameters
+        if action == 'dnat' and protocol != 'icmp':
+            values.extend([
+                ('protocol', protocol),
+                ('originalPort', get("original_port", 'any')),
+                ('translatedPort', get("translated_port", 'any'))
+            ])
+        if action == 'dnat' and protocol == 'icmp':
+            values.extend([
+                ('translatedPort', get("translated_port", 'any')),
+                ('protocol', protocol),
+                ('icmpType', get("icmp_type", 'any'))
+            ])
+
+        return [(tag, get_text(value)) for tag, value in values
+                if value is not None]
+
+    def get_rule_key(self, values):
+        '''
+            Identity of a rule: its action, original and translated address
+            and port, protocol and vnic.
+        '''
+        values = dict(values)
+        action = (values.get('action') or '').lower()
+        key = [action, values.get('originalAddress'),
+               values.get('translatedAddress'), values.get('vnic') or '0']
+        if action == 'dnat':
+            key.extend([(values.get('protocol') or 'any').lower(),
+                        values.get('originalPort') or 'any',
+                        values.get('translatedPort') or 'any'])
+
+        return tuple(key)
+
+    def get_element_values(self, nat_rule):
+        return [(child.tag, child.text) for child in nat_rule.iterchildren()]
+
+    def get_user_rules(self):
+        return [nat_rule for nat_rule in self.get_rule_elements()
+                if str(nat_rule.ruleType).lower() == 'user']
+
+    def get_rule_label(self, key):
+        return ' '.join([str(value) for value in key])
+
+    def create_rule(self, values):
+        nat_rule = E.natRule()
+        for tag, value in values:
+            nat_rule.append(create_element(tag, value))
+
+        return nat_rule
+
+    def set_rule_values(self, nat_rule, values):
+        '''
+            Write the values which differ in the rule element, returns
+            whether any did. vCD leaves out empty elements, a missing one
+            equals an empty value.
+        '''
+        changed = False
+        for tag, value in values:
+            current = nat_rule.find(tag)
+            if current is None and not value:
+                continue
+            elif current is None:
+                nat_rule.append(create_element(tag, value))
+            elif (current.text or '').lower() != (value or '').lower():
+                nat_rule.replace(current, create_element(tag, value))
+            else:
+                continue
+            changed = True
+
+        return changed
+
     def add(self):
         response = dict()
         response['changed'] = False
+        response['msg'] = list()
+        response['warnings'] = list()
+
+        nat_rules = self.get_nat_config().natRules
+        rule_index = dict()
+        for nat_rule in self.get_user_rules():
+            key = self.get_rule_key(self.get_element_values(nat_rule))
+            rule_index.setdefault(key, nat_rule)
 
         for service_param in self.service_params:
-            action = service_param.get("action")
-            original_address = service_param.get("original_address")
-            translated_address = service_param.get("translated_address")
-            description = service_param.get("description", '')
-            protocol = service_param.get("protocol", 'any')
-            original_port = service_param.get("original_port", 'any')
-            translated_port = service_param.get("translated_port", 'any')
-            access_type = service_param.get("access_type", 'User')
-            icmp_type = service_param.get("icmp_type", 'any')
-            enabled = service_param.get("enabled", True)
-            logging_enabled = service_param.get("logging_enabled", False)
-            vnic = service_param.get("vnic", 0)
-
-            self.gateway.add_nat_rule(action, original_address,
-                                      translated_address, description,
-                                      protocol, original_port,
-                                      translated_port, access_type,
-                                      icmp_type, logging_enabled,
-                                      enabled, vnic)
-        response['msg'] = 'Nat rule(s) are added'
-        response['changed'] = True
+            values = self.get_rule_values(service_param)
+            key = self.get_rule_key(values)
+            nat_rule = rule_index.get(key)
+            if nat_rule is None:
+                nat_rule = self.create_rule(
+                    self.get_rule_values(service_param, defaults=True))
+                nat_rules.append(nat_rule)
+                rule_index[key] = nat_rule
+                response['msg'].append(self.get_rule_label(key))
+                response['changed'] = True
+            elif self.set_rule_values(nat_rule, values):
+                response['msg'].append(self.get_rule_label(key))
+                response['changed'] = True
+            else:
+                response['warnings'].append(self.get_rule_label(key))
 
-        return response
+        if response['changed']:
+            self.apply_nat_config()
+        msg = 'Nat rule(s) {0} are added/updated'
+        warnings = 'Nat rule(s) {0} are already present'
+
+        return self._update_response(response, msg, warnings)
+
+    def get_rule_by_id(self, nat_rule_id):
+        for nat_rule in self.get_rule_elements():
+            if str(nat_rule.ruleId) == str(nat_rule_id):
+                return nat_rule
+
+        return None
 
     def update(self):
         response = dict()
         response['changed'] = False
         response['msg'] = list()
+        response['warnings'] = list()
 
         for service_param in self.service_params:
             nat_rule_id = service_param.get("nat_rule_id")
-            original_address = service_param.get("original_address")
-            translated_address = service_param.get("translated_address")
-            description = service_param.get("description", '')
-            protocol = service_param.get("protocol", 'any')
-            original_port = service_param.get("original_port", 'any')
-            translated_port = service_param.get("translated_port", 'any')
-            icmp_type = service_param.get("icmp_type", 'any')
-            enabled = service_param.get("enabled", True)
-            logging_enabled = service_param.get("logging_enabled", False)
-            vnic = service_param.get("vnic", 0)
-            nat_rule_obj = NatRule(client=self.gateway.client,
-                                   gateway_name=self.gateway.name,
-                                   rule_id=nat_rule_id)
-            nat_rule_obj.href = self.get_nat_rule_href(nat_rule_id)
-            nat_rule_obj.update_nat_rule(
-                original_address,
-                translated_address,
-                description,
-                protocol,
-                original_port,
-                translated_port,
-                icmp_type,
-                logging_enabled,
-                enabled,
-                vnic
-            )
-            response['msg'].append(nat_rule_id)
-        response['msg'] = 'Nat rule(s) {0} are updated'.format(response['msg'])
-        response['changed'] = True
+            nat_rule = self.get_rule_by_id(nat_rule_id)
+            if nat_rule is None:
+                response['warnings'].append(nat_rule_id)
+                continue
 
-        return response
+            service_param = dict(service_param)
+            service_param['action'] = str(nat_rule.action)
+            # the type and action of a rule are not updated
+            values = [(tag, value) for tag, value in
+                      self.get_rule_values(service_param)
+                      if tag not in ('ruleType', 'action')]
+            if self.set_rule_values(nat_rule, values):
+                response['msg'].append(nat_rule_id)
+                response['changed'] = True
+
+        if response['changed']:
+            self.apply_nat_config()
+        msg = 'Nat rule(s) {0} are updated'
+        warnings = 'Nat rule(s) {0} are not present'
+
+        return self._update_response(response, msg, warnings)
 
     def delete(self):
+        '''
+            Delete the rules of the given nat_rule_id, or the rules matching
+            the content of the parameters which have none.
+        '''
         response = dict()
         response['changed'] = False
         response['msg'] = list()
+        response['warnings'] = list()
 
+        nat_rules = self.get_nat_config().natRules
         for service_param in self.service_params:
             nat_rule_id = service_param.get("nat_rule_id")
-            nat_rule_obj = NatRule(client=self.gateway.client,
-                                   gateway_name=self.gateway.name,
-                                   rule_id=nat_rule_id)
-            nat_rule_obj.href = self.get_nat_rule_href(nat_rule_id)
-            nat_rule_obj.delete_nat_rule()
-            response['msg'].append(nat_rule_id)
-        response['msg'] = 'Nat rule(s) {0} are deleted'.format(response['msg'])
-        response['changed'] = True
+            if nat_rule_id is not None:
+                label = nat_rule_id
+                matches = [self.get_rule_by_id(nat_rule_id)]
+            else:
+                key = self.get_rule_key(self.get_rule_values(service_param))
+                label = self.get_rule_label(key)
+                matches = [
+                    nat_rule for nat_rule in self.get_user_rules()
+                    if self.get_rule_key(
+                        self.get_element_values(nat_rule)) == key
+                ]
 
-        return response
+            matches = [nat_rule for nat_rule in matches if nat_rule is not None]
+            if not matches:
+                response['warnings'].append(label)
+                continue
+
+            for nat_rule in matches:
+                nat_rules.remove(nat_rule)
+            response['msg'].append(label)
+            response['changed'] = True
+
+        if response['changed']:
+            self.apply_nat_config()
+        msg = 'Nat rule(s) {0} are deleted'
+        warnings = 'Nat rule(s) {0} are not present'
+
+        return self._update_response(response, msg, warnings)
@@ -1,11 +1,38 @@
 
-from pyvcloud.vcd.certificate import Certificate
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pyvcloud.vcd.client import E
+from pyvcloud.vcd.client import EntityType
+from pyvcloud.vcd.utils import build_network_url_from_gateway_url
+from pyvcloud.vcd.network_url_constants import CRL_CERTIFICATE_POST
+from pyvcloud.vcd.network_url_constants import SERVICE_CERTIFICATE_POST
+
+
+CERTIFICATE_TYPES = ['service', 'ca', 'crl']
+CERTIFICATE_WORKERS = 4
+
+
+def get_pem_hash(pem):
+    '''
+        Hash of a PEM document regardless of its line breaks.
+    '''
+    return hashlib.sha256(''.join(pem.split()).encode('utf-8')).hexdigest()
 
 
 class SSLCertificates():
+    '''
+        Manages the certificates of the truststore of an edge gateway.
+
+        The certificates and CRLs of the edge are read once per operation,
+        concurrently, into a name to object id index along with the hash
+        of every PEM document. Certificates already in the truststore are
+        not added again and deletes run concurrently against the index.
+    '''
+
     def __init__(self, gateway, service_params=None):
         self.gateway = gateway
         self.service_params = service_params
+        self.certificates = None
 
     def manage_states(self, state=None):
         if state == "present":
@@ -25,35 +52,66 @@ class SSLCertificates():
 
         raise Exception("Please provide a valid operation for the service")
 
-    def get_service_certificates(self):
-        response = list()
-        for certs in self.gateway.list_service_certificates():
-            response.append({
-                'name': str(certs["Name"]),
-                'object_id': str(certs["Object_Id"])
-            })
+    def get_truststore_href(self, truststore_url, object_id=None):
+        network_url = build_network_url_from_gateway_url(self.gateway.href)
+        gateway_id = network_url.split("/")[-1]
+        network_url = network_url[:-len('/edges/' + gateway_id)]
+        href = network_url + truststore_url + gateway_id
+        if object_id is not None:
+            href += ':' + object_id
+
+        return href
+
+    def get_certificate_info(self, certificate):
+        pem = certificate.findtext('pemEncoding')
+
+        return {
+            'name': str(certificate.name),
+            'object_id': certificate.objectId.text.split(':')[-1],
+            'hash': get_pem_hash(pem) if pem else None
+        }
+
+    def get_certificates(self):
+        '''
+            Certificates of every type, the service ones being all the
+            certificates of the truststore (ca ones included) as listed by
+            pyvcloud.
+        '''
+        if self.certificates is not None:
+            return self.certificates
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            certificates = pool.submit(self.gateway.get_certificates)
+            crl_certificates = pool.submit(self.gateway.get_crl_certificates)
+            certificates = certificates.result()
+            crl_certificates = crl_certificates.result()
+
+        self.certificates = dict([(cert_type, list())
+                                  for cert_type in CERTIFICATE_TYPES])
+        if hasattr(certificates, 'certificate'):
+            for certificate in certificates.certificate:
+                info = self.get_certificate_info(certificate)
+                self.certificates['service'].append(info)
+                if certificate.certificateType == 'certificate_ca':
+                    self.certificates['ca'].append(info)
+        if hasattr(crl_certificates, 'crl'):
+            for crl in crl_certificates.crl:
+                self.certificates['crl'].append(self.get_certificate_info(crl))
+
+        return self.certificates
+
+    def get_certificate_list(self, cert_type):
+        return [{'name': cert['name'], 'object_id': cert['object_id']}
+                for cert in self.get_certificates()[cert_type]]
 
-        return response
+    def get_service_certificates(self):
+        return self.get_certificate_list('service')
 
     def get_ca_certificates(self):
-        response = list()
-        for certs in self.gateway.list_ca_certificates():
-            response.append({
-                'name': str(certs["Name"]),
-                'object_id': str(certs["Object_Id"])
-            })
-
-        return response
+        return self.get_certificate_list('ca')
 
     def get_crl_certificates(self):
-        response = list()
-        for certs in self.gateway.list_crl_certificates():
-            response.append({
-                'name': str(certs["Name"]),
-                'object_id': str(certs["Object_Id"])
-            })
-
-        return response
+        return self.get_certificate_list('crl')
 
     def get_ssl_certificates(self):
         response = dict()
@@ -63,6 +121,13 @@ class SSLCertificates():
 
         return response
 
+    def read_file(self, file_path, files):
+        if file_path not in files:
+            with open(file_path, 'r') as cert_file:
+                files[file_path] = cert_file.read()
+
+        return files[file_path]
+
     def add(self):
         response = dict()
         response['changed'] = False
@@ -70,40 +135,69 @@ class SSLCertificates():
         response['msg'] = list()
         msg = 'SSL Certificates have been added'
 
+        files = dict()
+        hashes = dict([
+            (cert_type, set([cert['hash'] for cert in certs]))
+            for cert_type, certs in self.get_certificates().items()
+        ])
         for service_param in self.service_params:
             cert_type = service_param.get("cert_type") or 'service'
+            cert_file_path = service_param.get('cert_file_path')
+            certificate = self.read_file(cert_file_path, files)
+            cert_hash = get_pem_hash(certificate)
+            if cert_hash in hashes.get(cert_type, set()):
+                response['warnings'].append(cert_file_path)
+                continue
+
             if cert_type == 'service':
-                self.add_service_certificate(service_param)
+                self.add_service_certificate(service_param, certificate, files)
             if cert_type == 'ca':
-                self.add_ca_certificate(service_param)
+                self.add_ca_certificate(service_param, certificate)
             if cert_type == 'crl':
-                self.add_crl_certificate(service_param)
+                self.add_crl_certificate(service_param, certificate)
+            hashes.setdefault(cert_type, set()).add(cert_hash)
 
             response['msg'] = msg
             response['changed'] = True
 
-        return response
-
-    def add_service_certificate(self, service_param):
-        cert_file_path = service_param.get('cert_file_path')
-        key_file_path = service_param.get('key_file_path')
-        key_passphrase = service_param.get('key_passphrase')
-        description = service_param.get('description')
-
-        return self.gateway.add_service_certificate(
-            cert_file_path, key_file_path, key_passphrase, description)
-
-    def add_ca_certificate(self, service_param):
-        cert_file_path = service_param.get('cert_file_path')
-        description = service_param.get('description')
-
-        return self.gateway.add_ca_certificate(cert_file_path, description)
+        if response['warnings']:
+            response['warnings'] = 'SSL Certificates {0} are already present'.format(
+                response['warnings'])
 
-    def add_crl_certificate(self, service_param):
-        cert_file_path = service_param.get('cert_file_path')
-        description = service_param.get('description')
+        return response
 
-        return self.gateway.add_crl_certificate(cert_file_path, description)
+    def post_trust_object(self, truststore_url, certificate, description,
+                          private_key=None, key_passphrase=None):
+        trust_object = E.trustObject()
+        trust_object.append(E.pemEncoding(certificate))
+        if private_key is not None:
+            trust_object.append(E.privateKey(private_key))
+        if key_passphrase:
+            trust_object.append(E.passphrase(key_passphrase))
+        if description:
+            trust_object.append(E.description(description))
+
+        return self.gateway.client.post_resource(
+            self.get_truststore_href(truststore_url), trust_object,
+            EntityType.DEFAULT_CONTENT_TYPE.value)
+
+    def add_service_certificate(self, service_param, certificate, files):
+        private_key = self.read_file(service_param.get('key_file_path'), files)
+
+        return self.post_trust_object(
+            SERVICE_CERTIFICATE_POST, certificate,
+            service_param.get('description'), private_key,
+            service_param.get('key_passphrase'))
+
+    def add_ca_certificate(self, service_param, certificate):
+        return self.post_trust_object(
+            SERVICE_CERTIFICATE_POST, certificate,
+            service_param.get('description'))
+
+    def add_crl_certificate(self, service_param, certificate):
+        return self.post_trust_object(
+            CRL_CERTIFICATE_POST, certificate,
+            service_param.get('description'))
 
     def delete(self):
         response = dict()
@@ -112,46 +206,34 @@ class SSLCertificates():
         response['warnings'] = list()
         msg = 'SSL Certificates have been deleted'
 
+        certificates = self.get_certificates()
+        hrefs = list()
         for service_param in self.service_params:
             cert_type = service_param.get("cert_type") or 'service'
-            if cert_type == 'service':
-                self.delete_service_certificate(service_param)
-            if cert_type == 'ca':
-                self.delete_ca_certificate(service_param)
+            cert_name = service_param.get("cert_name")
+            truststore_url = SERVICE_CERTIFICATE_POST
             if cert_type == 'crl':
-                self.delete_crl_certificate(service_param)
-
+                truststore_url = CRL_CERTIFICATE_POST
+            matches = [
+                self.get_truststore_href(truststore_url, cert['object_id'])
+                for cert in certificates.get(cert_type, list())
+                if cert['name'] == cert_name
+            ]
+            if not matches:
+                response['warnings'].append(cert_name)
+            hrefs.extend([href for href in matches if href not in hrefs])
+
+        if hrefs:
+            with ThreadPoolExecutor(max_workers=CERTIFICATE_WORKERS) as pool:
+                for result in [pool.submit(self.gateway.client.delete_resource,
+                                           href) for href in hrefs]:
+                    result.result()
             response['msg'] = msg
             response['changed'] = True
+            self.certificates = None
 
-        return response
+        if response['warnings']:
+            response['warnings'] = 'SSL Certificates {0} are not present'.format(
+                response['warnings'])
 
-    def delete_service_certificate(self, service_param):
-        service_certs = self.get_service_certificates()
-        cert_name = service_param.get("cert_name")
-        for service_cert in service_certs:
-            if service_cert.get("name") == cert_name:
-                cert = Certificate(client=self.gateway.client,
-                                   gateway_name=self.gateway.name,
-                                   resource_id=service_cert.get("object_id"))
-                cert.delete_certificate()
-
-    def delete_ca_certificate(self, service_param):
-        ca_certs = self.get_ca_certificates()
-        cert_name = service_param.get("cert_name")
-        for ca_cert in ca_certs:
-            if ca_cert.get("name") == cert_name:
-                cert = Certificate(client=self.gateway.client,
-                                   gateway_name=self.gateway.name,
-                                   resource_id=ca_cert.get("object_id"))
-                cert.delete_certificate()
-
-    def delete_crl_certificate(self, service_param):
-        crl_certs = self.get_crl_certificates()
-        cert_name = service_param.get("cert_name")
-        for crl_cert in crl_certs:
-            if crl_cert.get("name") == cert_name:
-                cert = Certificate(client=self.gateway.client,
-                                   gateway_name=self.gateway.name,
-                                   resource_id=crl_cert.get("object_id"))
-                cert.delete_certificate()
+        return response
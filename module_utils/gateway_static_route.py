@@ -1,13 +1,25 @@
 
-from pyvcloud.vcd.static_route import StaticRoute
-from pyvcloud.vcd.exceptions import BadRequestException
-from pyvcloud.vcd.exceptions import EntityNotFoundException
+from pyvcloud.vcd.client import EntityType
+from pyvcloud.vcd.client import create_element
+from pyvcloud.vcd.utils import build_network_url_from_gateway_url
+from pyvcloud.vcd.network_url_constants import STATIC_ROUTE_URL_TEMPLATE
+from ansible.module_utils.gateway_utils import E
 
 
 class StaticRoutes():
+    '''
+        Manages the static routes of an edge gateway.
+
+        The static routing config is read once per operation and its
+        routes indexed by network (CIDR). The desired routes are diffed
+        against that index and every change is sent back in a single PUT.
+    '''
+
     def __init__(self, gateway, service_params=None):
         self.gateway = gateway
         self.service_params = service_params
+        self.routing_config = None
+        self.route_index = None
 
     def manage_states(self, state=None):
         if state == "present":
@@ -35,47 +47,112 @@ class StaticRoutes():
 
         return response
 
+    def get_routing_config(self):
+        if self.routing_config is None:
+            self.routing_config = self.gateway.get_static_routes()
+            self.route_index = dict()
+            for route in self.get_route_elements():
+                self.route_index.setdefault(route.network.text, route)
+
+        return self.routing_config
+
+    def get_route_elements(self):
+        static_routes = self.get_routing_config().staticRoutes
+        if not hasattr(static_routes, 'route'):
+            return list()
+
+        return list(static_routes.route)
+
+    def get_route_index(self):
+        self.get_routing_config()
+
+        return self.route_index
+
+    def apply_routing_config(self):
+        network_url = build_network_url_from_gateway_url(self.gateway.href)
+        self.gateway.client.put_resource(
+            network_url + STATIC_ROUTE_URL_TEMPLATE, self.routing_config,
+            EntityType.DEFAULT_CONTENT_TYPE.value)
+        self.routing_config = None
+        self.route_index = None
+
     def get_static_routes(self):
         response = dict()
         response['changed'] = False
+        response['msg'] = list()
+
+        for route in self.get_route_elements():
+            response['msg'].append({
+                'Network': route.network.text,
+                'Next Hop': route.nextHop.text,
+                'MTU': route.mtu.text
+            })
 
-        response['msg'] = self.gateway.list_static_routes()
         return response
 
-    def is_route_present(self, network):
-        for route in self.gateway.list_static_routes():
-            if route['Network'] == network:
-                return True
-        raise EntityNotFoundException()
+    def set_route_values(self, route, values):
+        '''
+            Write the values which differ in the route element, returns
+            whether any did.
+        '''
+        changed = False
+        for tag, value in values:
+            current = route.find(tag)
+            new = create_element(tag, value)
+            if current is None:
+                route.append(new)
+            elif (current.text or '') != (new.text or ''):
+                route.replace(current, new)
+            else:
+                continue
+            changed = True
+
+        return changed
 
     def add(self):
         response = dict()
         response['changed'] = False
         response['warnings'] = list()
         response['msg'] = list()
-        msg = 'Static Route(s) {0} have been created'
-        warnings = 'Static Route(s) {0} may already present'
+        msg = 'Static Route(s) {0} have been created/updated'
+        warnings = 'Static Route(s) {0} are already present'
 
+        route_index = self.get_route_index()
+        static_routes = self.get_routing_config().staticRoutes
         for service_param in self.service_params:
-            try:
-                network = service_param.get("network")
-                next_hop = service_param.get("next_hop")
-                mtu = service_param.get("mtu") or 1500
-                description = service_param.get("description")
-                route_type = service_param.get("route_type") or 'User'
-                vnic = service_param.get("vnic") or 0
-
-                self.gateway.add_static_route(network=network,
-                                              next_hop=next_hop,
-                                              mtu=mtu,
-                                              description=description,
-                                              type=route_type,
-                                              vnic=vnic)
-            except BadRequestException:
+            network = service_param.get("network")
+            values = [
+                ('network', network),
+                ('nextHop', service_param.get("next_hop")),
+                ('mtu', service_param.get("mtu")),
+                ('description', service_param.get("description")),
+                ('vnic', service_param.get("vnic"))
+            ]
+            route = route_index.get(network)
+            if route is None:
+                # the defaults only apply to new routes
+                defaults = {'mtu': 1500, 'vnic': 0}
+                values = [(tag, defaults.get(tag) if value is None else value)
+                          for tag, value in values]
+                values.insert(3, ('type',
+                                  service_param.get("route_type") or 'User'))
+                route = E.route()
+                self.set_route_values(route, [(tag, value)
+                                              for tag, value in values
+                                              if value is not None])
+                static_routes.append(route)
+                route_index[network] = route
+            elif not self.set_route_values(route, [
+                    (tag, value) for tag, value in values
+                    if value is not None]):
                 response['warnings'].append(network)
-            else:
-                response['msg'].append(network)
-                response['changed'] = True
+                continue
+
+            response['msg'].append(network)
+            response['changed'] = True
+
+        if response['changed']:
+            self.apply_routing_config()
 
         return self._update_response(response, msg, warnings)
 
@@ -87,28 +164,32 @@ class StaticRoutes():
         msg = 'Static Route(s) {0} have been updated'
         warnings = 'Static Route(s) {0} are not present'
 
+        route_index = self.get_route_index()
         for service_param in self.service_params:
-            try:
-                network = service_param.get("network")
-                new_network = service_param.get("new_network") or network
-                next_hop = service_param.get("next_hop")
-                mtu = service_param.get("mtu") or 1500
-                description = service_param.get("description")
-                vnic = service_param.get("vnic") or 0
-
-                if self.is_route_present(network):
-                    static_route = StaticRoute(client=self.gateway.client,
-                                               gateway_name=self.gateway.name,
-                                               route_network_id=network)
-                    static_route.update_static_route(network=new_network,
-                                                     next_hop=next_hop,
-                                                     mtu=mtu,
-                                                     description=description,
-                                                     vnic=vnic)
-                    response['msg'].append(network)
-                    response['changed'] = True
-            except EntityNotFoundException:
+            network = service_param.get("network")
+            new_network = service_param.get("new_network") or network
+            route = route_index.get(network)
+            if route is None:
                 response['warnings'].append(network)
+                continue
+
+            # as with pyvcloud, empty values leave the route unchanged
+            values = [
+                ('network', new_network),
+                ('nextHop', service_param.get("next_hop")),
+                ('mtu', service_param.get("mtu") or 1500),
+                ('description', service_param.get("description")),
+                ('vnic', service_param.get("vnic"))
+            ]
+            values = [(tag, value) for tag, value in values if value]
+            if self.set_route_values(route, values):
+                del route_index[network]
+                route_index[new_network] = route
+                response['msg'].append(network)
+                response['changed'] = True
+
+        if response['changed']:
+            self.apply_routing_config()
 
         return self._update_response(response, msg, warnings)
 
@@ -120,17 +201,20 @@ class StaticRoutes():
         msg = 'Static Route(s) {0} have been deleted'
         warnings = 'Static Route(s) {0} are not present'
 
+        route_index = self.get_route_index()
+        static_routes = self.get_routing_config().staticRoutes
         for service_param in self.service_params:
-            try:
-                network = service_param.get("network")
-                if self.is_route_present(network):
-                    static_route = StaticRoute(client=self.gateway.client,
-                                               gateway_name=self.gateway.name,
-                                               route_network_id=network)
-                    static_route.delete_static_route()
-                    response['msg'].append(network)
-                    response['changed'] = True
-            except EntityNotFoundException:
+            network = service_param.get("network")
+            route = route_index.pop(network, None)
+            if route is None:
                 response['warnings'].append(network)
+                continue
+
+            static_routes.remove(route)
+            response['msg'].append(network)
+            response['changed'] = True
+
+        if response['changed']:
+            self.apply_routing_config()
 
         return self._update_response(response, msg, warnings)
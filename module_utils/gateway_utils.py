@@ -0,0 +1,5 @@
+from lxml import objectify
+
+
+# elements of the edge networking API have no namespace
+E = objectify.ElementMaker(annotate=False)
@@ -1,15 +1,41 @@
 # Copyright © 2018 VMware, Inc. All Rights Reserved.
 # SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
 
+import time
+import random
 from lxml import etree
+from lxml import objectify
 from pyvcloud.vcd.client import Client
 from pyvcloud.vcd.client import TaskStatus
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud.vcd.client import QueryResultFormat
 from ansible.module_utils.basic import AnsibleModule, env_fallback
 from pyvcloud.vcd.client import BasicLoginCredentials
 from requests.packages import urllib3
+from ansible.module_utils.vcd_cache import SessionCache
+from ansible.module_utils.vcd_cache import DEFAULT_SESSION_CACHE_TTL
+from ansible.module_utils.vcd_cache import HrefCache
+from ansible.module_utils.vcd_cache import DEFAULT_HREF_CACHE_TTL
+from ansible.module_utils.vcd_http import VcdHTTPAdapter
+from ansible.module_utils.vcd_http import DEFAULT_HTTP_RETRIES
+from ansible.module_utils.vcd_http import DEFAULT_HTTP_POOL_SIZE
+from ansible.module_utils.vcd_broker import BrokerClient
+from ansible.module_utils.vcd_broker import BrokerAdapter
+from ansible.module_utils.vcd_broker import DEFAULT_BROKER_IDLE_TIMEOUT
+from ansible.module_utils.vcd_query import VcdQueryResolver
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+DEFAULT_TASK_TIMEOUT = 600
+DEFAULT_TASK_POLL_MIN = 0.25
+DEFAULT_TASK_POLL_MAX = 10.0
+TASK_TERMINAL_STATUSES = [
+    TaskStatus.SUCCESS.value, TaskStatus.ABORTED.value,
+    TaskStatus.ERROR.value, TaskStatus.CANCELED.value
+]
+# ids filtered on by a single typed query
+QUERY_BATCH_SIZE = 20
+
 
 def vcd_argument_spec():
     return dict(
@@ -18,10 +44,54 @@ def vcd_argument_spec():
         org=dict(type='str', required=True, fallback=(env_fallback, ['env_org'])),
         host=dict(type='str', required=True, fallback=(env_fallback, ['env_host'])),
         api_version=dict(type='str', fallback=(env_fallback, ['env_api_version']), default='30.0'),
-        verify_ssl_certs=dict(type='bool', fallback=(env_fallback, ['env_verify_ssl_certs']), default=False)
+        verify_ssl_certs=dict(type='bool', fallback=(env_fallback, ['env_verify_ssl_certs']), default=False),
+        session_cache=dict(type='bool', fallback=(env_fallback, ['env_session_cache']), default=False),
+        session_cache_ttl=dict(type='int', fallback=(env_fallback, ['env_session_cache_ttl']), default=DEFAULT_SESSION_CACHE_TTL),
+        session_cache_path=dict(type='str', fallback=(env_fallback, ['env_session_cache_path']), default=None),
+        href_cache=dict(type='bool', fallback=(env_fallback, ['env_href_cache']), default=False),
+        href_cache_ttl=dict(type='int', fallback=(env_fallback, ['env_href_cache_ttl']), default=DEFAULT_HREF_CACHE_TTL),
+        href_cache_path=dict(type='str', fallback=(env_fallback, ['env_href_cache_path']), default=None),
+        task_timeout=dict(type='int', fallback=(env_fallback, ['env_task_timeout']), default=DEFAULT_TASK_TIMEOUT),
+        task_poll_min=dict(type='float', fallback=(env_fallback, ['env_task_poll_min']), default=DEFAULT_TASK_POLL_MIN),
+        task_poll_max=dict(type='float', fallback=(env_fallback, ['env_task_poll_max']), default=DEFAULT_TASK_POLL_MAX),
+        http_pool_size=dict(type='int', fallback=(env_fallback, ['env_http_pool_size']), default=DEFAULT_HTTP_POOL_SIZE),
+        http_retries=dict(type='int', fallback=(env_fallback, ['env_http_retries']), default=DEFAULT_HTTP_RETRIES),
+        use_broker=dict(type='bool', fallback=(env_fallback, ['env_use_broker']), default=False),
+        broker_idle_timeout=dict(type='int', fallback=(env_fallback, ['env_broker_idle_timeout']), default=DEFAULT_BROKER_IDLE_TIMEOUT),
+        async_task=dict(type='bool', default=False)
     )
 
 
+def get_task_progress(task):
+    try:
+        return int(task.Progress)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def next_poll_interval(interval, poll_min, poll_max, elapsed=0, progress=None):
+    '''
+        Back off exponentially from the previous interval, capped at
+        poll_max. Once vCD reports some progress of the task, the time
+        left is extrapolated from it and the next poll is scheduled half
+        way through that estimate instead.
+    '''
+    interval = min(interval * 2, poll_max)
+    if progress and 0 < progress < 100 and elapsed > 0:
+        remaining = elapsed * (100 - progress) / float(progress)
+        interval = min(max(remaining / 2, poll_min), poll_max)
+
+    return interval
+
+
+def get_task_uuid(task_href):
+    return task_href.rstrip('/').split('/')[-1]
+
+
+def jitter(interval, poll_min, poll_max):
+    return min(max(interval * random.uniform(0.8, 1.2), poll_min), poll_max)
+
+
 class VcdAnsibleModule(AnsibleModule):
     def __init__(self, *args, **kwargs):
         argument_spec = vcd_argument_spec()
@@ -29,7 +99,26 @@ class VcdAnsibleModule(AnsibleModule):
         kwargs['argument_spec'] = argument_spec
 
         super(VcdAnsibleModule, self).__init__(*args, **kwargs)
+        self.submitted_tasks = list()
+        self.http_adapter = None
         self.login()
+        self.resolver = VcdQueryResolver(self.client)
+        self.href_cache = None
+        if self.params.get('href_cache'):
+            self.href_cache = HrefCache(self.params.get('host'),
+                                        self.params.get('org'),
+                                        self.params.get('user'),
+                                        ttl=self.params.get('href_cache_ttl'),
+                                        path=self.params.get('href_cache_path'))
+
+    def exit_json(self, **kwargs):
+        if self.submitted_tasks:
+            kwargs['tasks'] = self.submitted_tasks
+
+        if self.http_adapter is not None:
+            kwargs['http_connections'] = self.http_adapter.get_stats()
+
+        super(VcdAnsibleModule, self).exit_json(**kwargs)
 
     def login(self):
         try:
@@ -43,26 +132,382 @@ class VcdAnsibleModule(AnsibleModule):
                                  api_version=api_version,
                                  verify_ssl_certs=verify_ssl_certs)
 
-            self.client.set_credentials(BasicLoginCredentials(user, org, password))
+            if self.params.get('use_broker'):
+                return self.login_with_broker()
+
+            session_cache = None
+            if self.params.get('session_cache'):
+                session_cache = SessionCache(
+                    host, org, user, password, api_version,
+                    ttl=self.params.get('session_cache_ttl'),
+                    path=self.params.get('session_cache_path'))
+
+            if session_cache is None or not self.restore_session(session_cache):
+                self.client.set_credentials(BasicLoginCredentials(user, org, password))
+
+                if session_cache is not None:
+                    token, is_jwt_token = self.get_session_token()
+                    if token:
+                        session_cache.put(token, is_jwt_token)
+
+            self.http_adapter = VcdHTTPAdapter(
+                pool_size=self.params.get('http_pool_size'),
+                retries=self.params.get('http_retries'))
+            self.http_adapter.mount_on(self.client._session)
 
         except Exception as error:
             self.fail_json(msg='Login failed for user {} to org {}'.format(user, org))
 
-    def execute_task(self, task):
-        task_monitor = self.client.get_task_monitor()
-        task_state = task_monitor.wait_for_status(
-            task=task,
-            timeout=60,
-            poll_frequency=2,
-            fail_on_statuses=None,
-            expected_target_statuses=[
-                TaskStatus.SUCCESS, TaskStatus.ABORTED, TaskStatus.ERROR,
-                TaskStatus.CANCELED
-            ],
-            callback=None)
+    def login_with_broker(self):
+        '''
+            Share the vCD session and connections of the local broker.
+
+            The broker (started on demand) logs in once per credentials and
+            the client only rehydrates from its token, after which every
+            request of the client is sent through the broker.
+        '''
+        broker = BrokerClient(idle_timeout=self.params.get('broker_idle_timeout'),
+                              pool_size=self.params.get('http_pool_size'),
+                              retries=self.params.get('http_retries'))
+        session = broker.login(self.params.get('host'),
+                               self.params.get('org'),
+                               self.params.get('user'),
+                               self.params.get('password'),
+                               self.params.get('api_version'),
+                               self.params.get('verify_ssl_certs'))
+        if session.get('is_jwt_token'):
+            self.client.rehydrate_from_token(
+                session.get('token'), is_jwt_token=True)
+        else:
+            self.client.rehydrate_from_token(session.get('token'))
+
+        BrokerAdapter(broker, session.get('session')).mount_on(
+            self.client._session)
+
+    def restore_session(self, session_cache):
+        '''
+            Rehydrate the client from a cached authorization token.
+
+            Returns False when there is no usable token; a token rejected by
+            vCD is dropped from the cache so the caller logs in again.
+        '''
+        session = session_cache.get()
+        if session is None:
+            return False
+
+        try:
+            if session.get('is_jwt_token'):
+                self.client.rehydrate_from_token(
+                    session.get('token'), is_jwt_token=True)
+            else:
+                self.client.rehydrate_from_token(session.get('token'))
+        except Exception:
+            session_cache.invalidate()
+            return False
+
+        session_cache.put(session.get('token'), session.get('is_jwt_token'))
+
+        return True
+
+    def get_session_token(self):
+        headers = self.client._session.headers
+        token = headers.get('x-vcloud-authorization')
+        if token:
+            return token, False
+
+        authorization = headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            return authorization[len('Bearer '):], True
+
+        return None, False
+
+    def get_cached_resource(self, names, resolve_href):
+        '''
+            Get the entity known by the names path (e.g. ('vdc', 'vdc1',
+            'vapp', 'vapp1')), calling resolve_href to walk org/vdc/...
+            down to its href only when the href is not cached yet.
+
+            A cached href is read with a conditional GET, so an unchanged
+            entity is answered with a 304 and served from the cache. An
+            href which can not be read anymore is dropped and resolved again.
+        '''
+        if self.href_cache is None:
+            return self.client.get_resource(resolve_href())
+
+        entry = self.href_cache.get(names)
+        if entry is not None:
+            resource = self._get_resource_if_modified(names, entry)
+            if resource is not None:
+                return resource
+            self.href_cache.invalidate(names)
+
+        href = resolve_href()
+        resource = self._get_resource_if_modified(names, {'href': href})
+        if resource is None:
+            # let pyvcloud raise the matching error
+            return self.client.get_resource(href)
+
+        return resource
+
+    def get_cached_vapp_resource(self, org_name, vdc_name, vapp_name):
+        '''
+            Get the vApp vapp_name of the vdc vdc_name of the org org_name
+            (the org logged into by default) through the href cache.
+        '''
+        def get_vapp_href():
+            org_resource = self.client.get_org()
+            if org_name:
+                org_resource = self.client.get_org_by_name(org_name)
+            vdc_href = self.resolver.get_vdc_href(
+                org_resource.get('href'), vdc_name)
+
+            return self.resolver.get_vapp_href(vdc_href, vapp_name)
+
+        return self.get_cached_resource(
+            ('org', org_name, 'vdc', vdc_name, 'vapp', vapp_name),
+            get_vapp_href)
+
+    def _get_resource_if_modified(self, names, entry):
+        headers = {
+            'Accept': 'application/*+xml;version={0}'.format(
+                self.client.get_api_version())
+        }
+        if entry.get('etag') and entry.get('document'):
+            headers['If-None-Match'] = entry.get('etag')
+
+        response = self.client._session.get(
+            entry.get('href'), headers=headers,
+            verify=self.client._verify_ssl_certs)
+        if response.status_code == 304:
+            # the cached entry is unchanged, leave the store unlocked
+            document = entry.get('document')
+        elif response.status_code == 200:
+            document = response.content.decode('utf-8')
+            self.href_cache.put(names, entry.get('href'),
+                                etag=response.headers.get('ETag'),
+                                document=document,
+                                expires=entry.get('expires'))
+        else:
+            return None
+
+        return objectify.fromstring(document.encode('utf-8'))
+
+    def execute_task(self, task, wait=False):
+        '''
+            Wait for the task, or only record it with async_task.
+
+            wait forces the wait even with async_task, for the tasks of an
+            operation which are followed by another task on the same
+            entity: vCD refuses that task while the entity is busy, so
+            only the last task of an operation is left running.
+        '''
+        if self.params.get('async_task') and not wait:
+            self.submitted_tasks.append(task.get('href'))
+            return 1
+
+        task_state = self.wait_for_task(task)
 
         task_status = task_state.get('status')
         if task_status != TaskStatus.SUCCESS.value:
             raise Exception(etree.tostring(task_state, pretty_print=True))
 
         return 1
+
+    def wait_for_task(self, task):
+        timeout = self.params.get('task_timeout')
+        poll_min = self.params.get('task_poll_min')
+        poll_max = max(self.params.get('task_poll_max'), poll_min)
+        task_href = task.get('href')
+        start_time = time.time()
+        interval = poll_min
+
+        while task.get('status') not in TASK_TERMINAL_STATUSES:
+            elapsed = time.time() - start_time
+            if elapsed >= timeout:
+                msg = 'Task {0} has not finished in {1} seconds'
+                raise Exception(msg.format(task_href, timeout))
+
+            time.sleep(min(jitter(interval, poll_min, poll_max),
+                           timeout - elapsed))
+            task = self.client.get_resource(task_href)
+            interval = next_poll_interval(
+                interval, poll_min, poll_max,
+                elapsed=time.time() - start_time,
+                progress=get_task_progress(task))
+
+        return task
+
+    def execute_tasks(self, tasks):
+        if self.params.get('async_task'):
+            hrefs = [task.get('href') for task in tasks]
+            self.submitted_tasks.extend(hrefs)
+            return [{'href': href, 'status': 'submitted'} for href in hrefs]
+
+        results = self.wait_for_tasks(tasks)
+        failed = [result for result in results
+                  if result['status'] != TaskStatus.SUCCESS.value]
+        if failed:
+            raise Exception(failed)
+
+        return results
+
+    def wait_for_tasks(self, tasks):
+        '''
+            Wait for many already submitted tasks at once.
+
+            Unfinished tasks are tracked with "task" typed queries filtered
+            on their ids (QUERY_BATCH_SIZE ids per query), so a poll
+            round costs one request per batch rather than one per task.
+            Returns a result per task, in the order of the given tasks.
+        '''
+        timeout = self.params.get('task_timeout')
+        poll_min = self.params.get('task_poll_min')
+        poll_max = max(self.params.get('task_poll_max'), poll_min)
+        start_time = time.time()
+        interval = poll_min
+        hrefs = [task.get('href') for task in tasks]
+        states = dict()
+        pending = dict()
+        for task in tasks:
+            if task.get('status') in TASK_TERMINAL_STATUSES:
+                states[task.get('href')] = task.get('status')
+            else:
+                pending[get_task_uuid(task.get('href'))] = task
+
+        while pending:
+            elapsed = time.time() - start_time
+            if elapsed >= timeout:
+                msg = 'Tasks {0} have not finished in {1} seconds'
+                raise Exception(msg.format(
+                    [task.get('href') for task in pending.values()], timeout))
+
+            time.sleep(min(jitter(interval, poll_min, poll_max),
+                           timeout - elapsed))
+            progress = list()
+            for uuid, status, task_progress in self._query_task_states(
+                    pending):
+                if status in TASK_TERMINAL_STATUSES:
+                    states[pending.pop(uuid).get('href')] = status
+                elif task_progress is not None:
+                    progress.append(task_progress)
+
+            interval = next_poll_interval(
+                interval, poll_min, poll_max,
+                elapsed=time.time() - start_time,
+                progress=min(progress) if progress else None)
+
+        return [self._get_task_result(href, states[href]) for href in hrefs]
+
+    def poll_tasks(self, tasks):
+        '''
+            Return the current state of the given tasks without waiting,
+            querying them the same way wait_for_tasks does.
+        '''
+        pending = dict()
+        for task in tasks:
+            pending[get_task_uuid(task.get('href'))] = task
+
+        states = dict()
+        for uuid, status, progress in self._query_task_states(pending):
+            states[uuid] = {'status': status, 'progress': progress}
+
+        results = list()
+        for task in tasks:
+            result = {'href': task.get('href')}
+            result.update(states.get(get_task_uuid(task.get('href')), {}))
+            results.append(result)
+
+        return results
+
+    def query_by_ids(self, resource_type, ids,
+                     query_result_format=QueryResultFormat.RECORDS):
+        '''
+            Yield the records of the given entity ids (urns) of one
+            resource type, QUERY_BATCH_SIZE ids per typed query.
+        '''
+        for index in range(0, len(ids), QUERY_BATCH_SIZE):
+            qfilter = ','.join([
+                'id==' + entity_id
+                for entity_id in ids[index:index + QUERY_BATCH_SIZE]
+            ])
+            query = self.client.get_typed_query(
+                resource_type,
+                query_result_format=query_result_format,
+                qfilter=qfilter)
+            for record in query.execute():
+                yield record
+
+    def wait_for_entity_status(self, resource_type, ids, ready_statuses,
+                               failed_statuses, status_field='status'):
+        '''
+            Wait till every entity (by id) of resource_type reaches one of
+            ready_statuses, e.g. catalog items being imported.
+
+            All the entities are polled together with id filtered typed
+            queries, backing off from task_poll_min to task_poll_max. Fails
+            as soon as an entity reaches one of failed_statuses or when they
+            are not ready after task_timeout seconds. Returns the status of
+            each entity by id.
+        '''
+        timeout = self.params.get('task_timeout')
+        poll_min = self.params.get('task_poll_min')
+        poll_max = max(self.params.get('task_poll_max'), poll_min)
+        start_time = time.time()
+        interval = poll_min
+        pending = list(ids)
+        states = dict()
+
+        while True:
+            for record in self.query_by_ids(
+                    resource_type, pending,
+                    query_result_format=QueryResultFormat.ID_RECORDS):
+                status = record.get(status_field)
+                if status in failed_statuses:
+                    msg = '{0} {1} has failed with status {2}'
+                    raise Exception(msg.format(
+                        resource_type, record.get('name'), status))
+
+                if status in ready_statuses:
+                    states[record.get('id')] = status
+
+            pending = [entity_id for entity_id in pending
+                       if entity_id not in states]
+            if not pending:
+                return states
+
+            elapsed = time.time() - start_time
+            if elapsed >= timeout:
+                msg = '{0} {1} not ready in {2} seconds'
+                raise Exception(msg.format(resource_type, pending, timeout))
+
+            time.sleep(min(jitter(interval, poll_min, poll_max),
+                           timeout - elapsed))
+            interval = next_poll_interval(interval, poll_min, poll_max)
+
+    def _query_task_states(self, pending):
+        uuids = list(pending.keys())
+        found = set()
+        task_ids = [pending[uuid].get('id') or 'urn:vcloud:task:' + uuid
+                    for uuid in uuids]
+        for record in self.query_by_ids(ResourceType.TASK.value, task_ids):
+            uuid = get_task_uuid(record.get('href'))
+            if uuid in pending:
+                found.add(uuid)
+                yield uuid, record.get('status', '').lower(), None
+
+        # tasks the query can not see (e.g. owned by another org) are
+        # polled directly
+        for uuid in uuids:
+            if uuid not in found:
+                task = self.client.get_resource(pending[uuid].get('href'))
+                yield uuid, task.get('status'), get_task_progress(task)
+
+    def _get_task_result(self, task_href, status):
+        result = {'href': task_href, 'status': status}
+        if status != TaskStatus.SUCCESS.value:
+            task = self.client.get_resource(task_href)
+            result['operation'] = task.get('operationName')
+            if hasattr(task, 'Error'):
+                result['error'] = task.Error.get('message')
+
+        return result
@@ -0,0 +1,450 @@
+# Copyright © 2018 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
+
+import os
+import json
+import time
+import fcntl
+import errno
+import base64
+import socket
+import struct
+import threading
+import socketserver
+from requests.models import Response
+from requests.adapters import BaseAdapter
+from requests.utils import get_encoding_from_headers
+from requests.structures import CaseInsensitiveDict
+from pyvcloud.vcd.client import Client
+from pyvcloud.vcd.client import BasicLoginCredentials
+from ansible.module_utils.vcd_cache import cache_key
+from ansible.module_utils.vcd_cache import DEFAULT_CACHE_DIR
+from ansible.module_utils.vcd_http import VcdHTTPAdapter
+
+
+BROKER_SOCKET_FILE = 'broker.sock'
+BROKER_LOG_FILE = 'broker_pysdk.log'
+DEFAULT_BROKER_IDLE_TIMEOUT = 300
+BROKER_START_TIMEOUT = 10
+# headers the broker sets itself from its own session
+AUTH_HEADERS = frozenset(['authorization', 'x-vcloud-authorization'])
+# headers which change the response of a GET, part of its coalescing key
+GET_KEY_HEADERS = ('accept', 'if-none-match', 'if-modified-since')
+HEADER_LENGTH = struct.Struct('!I')
+
+
+def get_broker_socket_path():
+    return os.path.join(DEFAULT_CACHE_DIR, BROKER_SOCKET_FILE)
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(HEADER_LENGTH.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError('vCD broker connection closed')
+        data += chunk
+
+    return data
+
+
+def recv_message(sock):
+    size = HEADER_LENGTH.unpack(_recv_exactly(sock, HEADER_LENGTH.size))[0]
+
+    return json.loads(_recv_exactly(sock, size).decode('utf-8'))
+
+
+def encode_body(body):
+    if body is None:
+        return None
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+
+    return base64.b64encode(body).decode('ascii')
+
+
+def decode_body(body):
+    if body is None:
+        return None
+
+    return base64.b64decode(body)
+
+
+class BrokerSession():
+    '''
+        One authenticated vCD session held by the broker.
+
+        Identical GET requests which arrive while one of them is in flight
+        wait for that request and share its response instead of going to
+        vCD again. When the session expires, the first request answered
+        with a 401 logs in again and the others replay with its session.
+    '''
+
+    def __init__(self, host, org, user, password, api_version,
+                 verify_ssl_certs, pool_size, retries):
+        self.credentials = BasicLoginCredentials(user, org, password)
+        self.client = Client(host, api_version=api_version,
+                             verify_ssl_certs=verify_ssl_certs,
+                             log_file=os.path.join(DEFAULT_CACHE_DIR,
+                                                   BROKER_LOG_FILE))
+        self.pool_size = pool_size
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.in_flight = dict()
+        self.login_lock = threading.Lock()
+        self.generation = 0
+        self.login()
+
+    def login(self):
+        self.client.set_credentials(self.credentials)
+        VcdHTTPAdapter(pool_size=self.pool_size,
+                       retries=self.retries).mount_on(self.client._session)
+
+    def get_token(self):
+        headers = self.client._session.headers
+        token = headers.get('x-vcloud-authorization')
+        if token:
+            return token, False
+
+        return headers.get('Authorization', '')[len('Bearer '):], True
+
+    def renew(self, generation):
+        '''
+            Log in again unless another request already did since the
+            session of the given generation was used.
+        '''
+        with self.login_lock:
+            if self.generation == generation:
+                self.login()
+                self.generation += 1
+
+    def send(self, method, url, headers, body):
+        headers = dict([(name, value) for name, value in headers.items()
+                        if name.lower() not in AUTH_HEADERS])
+        generation = self.generation
+        response = self.client._session.request(
+            method, url, headers=headers, data=body,
+            verify=self.client._verify_ssl_certs)
+        if response.status_code == 401:
+            # the broker session has expired, log in again and replay
+            self.renew(generation)
+            response = self.client._session.request(
+                method, url, headers=headers, data=body,
+                verify=self.client._verify_ssl_certs)
+
+        return {
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': dict(response.headers),
+            'body': encode_body(response.content)
+        }
+
+    def request(self, method, url, headers, body):
+        if method != 'GET':
+            return self.send(method, url, headers, body)
+
+        # a plain GET must not share the 304 of a conditional one
+        lower_headers = dict([(name.lower(), value)
+                              for name, value in headers.items()])
+        key = (url, ) + tuple([lower_headers.get(name)
+                               for name in GET_KEY_HEADERS])
+        with self.lock:
+            waiting = key in self.in_flight
+            if not waiting:
+                self.in_flight[key] = {'event': threading.Event()}
+            call = self.in_flight[key]
+
+        if waiting:
+            call['event'].wait()
+            if 'error' in call:
+                raise Exception(call['error'])
+            return call['response']
+
+        try:
+            call['response'] = self.send(method, url, headers, body)
+        except Exception as error:
+            call['error'] = str(error)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            call['event'].set()
+
+        return call['response']
+
+
+class BrokerRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (EOFError, socket.error):
+                return
+
+            self.server.begin_request()
+            try:
+                reply = self.server.dispatch(message)
+            except Exception as error:
+                reply = {'error': str(error)}
+            finally:
+                self.server.end_request()
+            send_message(self.request, reply)
+
+
+class VcdBroker(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+        Local broker multiplexing the REST calls of many module processes
+        over shared vCD sessions and warm connection pools.
+
+        It listens on a Unix socket only the current user can access and
+        exits once no request has been seen for idle_timeout seconds.
+    '''
+    daemon_threads = True
+
+    def __init__(self, socket_path, idle_timeout, pool_size, retries):
+        self.idle_timeout = idle_timeout
+        self.pool_size = pool_size
+        self.retries = retries
+        self.sessions = dict()
+        self.sessions_lock = threading.Lock()
+        self.login_locks = dict()
+        self.activity_lock = threading.Lock()
+        self.active_requests = 0
+        self.last_seen = time.time()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(
+                self, socket_path, BrokerRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def begin_request(self):
+        with self.activity_lock:
+            self.active_requests += 1
+
+    def end_request(self):
+        with self.activity_lock:
+            self.active_requests -= 1
+            self.last_seen = time.time()
+
+    def is_idle(self):
+        with self.activity_lock:
+            return (self.active_requests == 0 and
+                    time.time() - self.last_seen >= self.idle_timeout)
+
+    def watch_idle(self):
+        while not self.is_idle():
+            time.sleep(1)
+        self.shutdown()
+
+    def serve(self):
+        watcher = threading.Thread(target=self.watch_idle)
+        watcher.daemon = True
+        watcher.start()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            os.unlink(self.server_address)
+
+    def dispatch(self, message):
+        if message.get('op') == 'login':
+            return self.login(message)
+
+        if message.get('op') == 'request':
+            session = self.sessions.get(message.get('session'))
+            if session is None:
+                raise Exception('Unknown vCD broker session')
+            return session.request(message.get('method'),
+                                   message.get('url'),
+                                   message.get('headers'),
+                                   decode_body(message.get('body')))
+
+        raise Exception('Unknown vCD broker operation')
+
+    def login(self, message):
+        credentials = [message.get(name) for name in (
+            'host', 'org', 'user', 'password', 'api_version',
+            'verify_ssl_certs')]
+        key = cache_key(*credentials)
+        with self.sessions_lock:
+            login_lock = self.login_locks.setdefault(key, threading.Lock())
+
+        # only the logins with the same credentials wait for each other
+        with login_lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = BrokerSession(*credentials,
+                                        pool_size=self.pool_size,
+                                        retries=self.retries)
+                with self.sessions_lock:
+                    self.sessions[key] = session
+        token, is_jwt_token = session.get_token()
+
+        return {'session': key, 'token': token, 'is_jwt_token': is_jwt_token}
+
+
+def start_broker(socket_path, idle_timeout, pool_size, retries):
+    '''
+        Start the broker as a daemon detached from the module process.
+
+        The daemon must not hold on to any descriptor of the module
+        process, otherwise ansible keeps waiting for the module output.
+    '''
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        return
+
+    try:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.closerange(3, 1024)
+        VcdBroker(socket_path, idle_timeout, pool_size, retries).serve()
+    finally:
+        os._exit(0)
+
+
+class BrokerClient():
+    def __init__(self, socket_path=None,
+                 idle_timeout=DEFAULT_BROKER_IDLE_TIMEOUT,
+                 pool_size=None, retries=None):
+        self.socket_path = socket_path or get_broker_socket_path()
+        self.idle_timeout = idle_timeout
+        self.pool_size = pool_size
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.sock = None
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except socket.error:
+            sock.close()
+            raise
+
+        return sock
+
+    def connect(self):
+        '''
+            Connect to the broker, starting it first when it is not running.
+            A lock file makes sure concurrent modules start a single broker.
+        '''
+        try:
+            return self._connect()
+        except socket.error as error:
+            if error.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                raise
+
+        directory = os.path.dirname(self.socket_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        lock_fd = os.open(self.socket_path + '.lock',
+                          os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                return self._connect()
+            except socket.error:
+                start_broker(self.socket_path, self.idle_timeout,
+                             self.pool_size, self.retries)
+
+            deadline = time.time() + BROKER_START_TIMEOUT
+            while True:
+                try:
+                    return self._connect()
+                except socket.error:
+                    if time.time() > deadline:
+                        raise
+                    time.sleep(0.05)
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+    def call(self, message):
+        with self.lock:
+            if self.sock is None:
+                self.sock = self.connect()
+            try:
+                send_message(self.sock, message)
+                reply = recv_message(self.sock)
+            except (EOFError, socket.error):
+                self.close()
+                raise
+
+        if 'error' in reply:
+            raise Exception(reply['error'])
+
+        return reply
+
+    def login(self, host, org, user, password, api_version,
+              verify_ssl_certs):
+        return self.call({
+            'op': 'login',
+            'host': host,
+            'org': org,
+            'user': user,
+            'password': password,
+            'api_version': api_version,
+            'verify_ssl_certs': verify_ssl_certs
+        })
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class BrokerAdapter(BaseAdapter):
+    '''
+        requests transport adapter sending every request of a pyvcloud
+        Client through the broker instead of opening its own connections.
+    '''
+
+    def __init__(self, broker, session):
+        super(BrokerAdapter, self).__init__()
+        self.broker = broker
+        self.session = session
+
+    def mount_on(self, session):
+        session.mount('https://', self)
+        session.mount('http://', self)
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        reply = self.broker.call({
+            'op': 'request',
+            'session': self.session,
+            'method': request.method,
+            'url': request.url,
+            'headers': dict(request.headers),
+            'body': encode_body(request.body)
+        })
+
+        response = Response()
+        response.status_code = reply['status']
+        response.reason = reply.get('reason')
+        response.headers = CaseInsensitiveDict(reply.get('headers') or {})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = decode_body(reply.get('body')) or b''
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+
+        return response
+
+    def close(self):
+        self.broker.close()
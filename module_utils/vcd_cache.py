@@ -0,0 +1,164 @@
+# Copyright © 2018 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
+
+import os
+import json
+import time
+import fcntl
+import hashlib
+from contextlib import contextmanager
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.ansible', 'vcd')
+SESSION_CACHE_FILE = 'sessions.json'
+DEFAULT_SESSION_CACHE_TTL = 1800
+HREF_CACHE_FILE = 'hrefs.json'
+DEFAULT_HREF_CACHE_TTL = 300
+MAX_CACHED_DOCUMENT_SIZE = 1024 * 1024
+
+
+def cache_key(*parts):
+    key = '|'.join([str(part) for part in parts])
+
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class JsonFileStore():
+    '''
+        A small JSON document on disk shared by concurrent module runs.
+
+        Every access holds a flock on a sibling ".lock" file and writes
+        go through a temporary file which is renamed into place, so
+        readers never see a partially written document. Both files are
+        created with 0600 permissions as they may hold session tokens.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+
+    @contextmanager
+    def _lock(self, mode):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, mode)
+            yield
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+    def _read(self):
+        try:
+            with open(self.path) as store:
+                return json.load(store)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def _write(self, data):
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        tmp_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(tmp_fd, 'w') as store:
+            json.dump(data, store)
+        os.rename(tmp_path, self.path)
+
+    def read(self):
+        with self._lock(fcntl.LOCK_SH):
+            return self._read()
+
+    @contextmanager
+    def update(self):
+        with self._lock(fcntl.LOCK_EX):
+            data = self._read()
+            yield data
+            self._write(data)
+
+
+class SessionCache():
+    '''
+        Keeps vCD authorization tokens between module invocations.
+
+        Entries are keyed by host, org, user and api version. The password
+        is part of the key as well so a wrong password never picks up a
+        session opened with the right one.
+    '''
+
+    def __init__(self, host, org, user, password, api_version,
+                 ttl=DEFAULT_SESSION_CACHE_TTL, path=None):
+        self.key = cache_key(host, org, user, password, api_version)
+        self.ttl = ttl
+        path = path or os.path.join(DEFAULT_CACHE_DIR, SESSION_CACHE_FILE)
+        self.store = JsonFileStore(os.path.expanduser(path))
+
+    def get(self):
+        session = self.store.read().get(self.key)
+        if session is None or session.get('expires', 0) <= time.time():
+            return None
+
+        return session
+
+    def put(self, token, is_jwt_token=False):
+        now = time.time()
+        with self.store.update() as sessions:
+            for key, session in list(sessions.items()):
+                if session.get('expires', 0) <= now:
+                    del sessions[key]
+            sessions[self.key] = {
+                'token': token,
+                'is_jwt_token': is_jwt_token,
+                'expires': now + self.ttl
+            }
+
+    def invalidate(self):
+        with self.store.update() as sessions:
+            sessions.pop(self.key, None)
+
+
+class HrefCache():
+    '''
+        Maps entity names (e.g. vdc/vapp) to their href between module
+        invocations, along with the ETag and document last read from the
+        href so an unchanged entity can be revalidated with a 304.
+
+        Entries expire after ttl seconds, after which the name is resolved
+        again in case it now refers to another entity.
+    '''
+
+    def __init__(self, host, org, user, ttl=DEFAULT_HREF_CACHE_TTL,
+                 path=None):
+        self.scope = cache_key(host, org, user)
+        self.ttl = ttl
+        path = path or os.path.join(DEFAULT_CACHE_DIR, HREF_CACHE_FILE)
+        self.store = JsonFileStore(os.path.expanduser(path))
+
+    def _key(self, names):
+        return cache_key(self.scope, *names)
+
+    def get(self, names):
+        entry = self.store.read().get(self._key(names))
+        if entry is None or entry.get('expires', 0) <= time.time():
+            return None
+
+        return entry
+
+    def put(self, names, href, etag=None, document=None, expires=None):
+        now = time.time()
+        if document is not None and len(document) > MAX_CACHED_DOCUMENT_SIZE:
+            etag, document = None, None
+
+        with self.store.update() as entries:
+            for key, entry in list(entries.items()):
+                if entry.get('expires', 0) <= now:
+                    del entries[key]
+            entries[self._key(names)] = {
+                'href': href,
+                'etag': etag,
+                'document': document,
+                'expires': expires or now + self.ttl
+            }
+
+    def invalidate(self, names):
+        with self.store.update() as entries:
+            entries.pop(self._key(names), None)
@@ -0,0 +1,81 @@
+# Copyright © 2018 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
+
+import socket
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from requests.packages.urllib3.connection import HTTPConnection
+
+
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_HTTP_RETRIES = 3
+DEFAULT_HTTP_KEEPALIVE_IDLE = 30
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+
+def get_retry(retries):
+    kwargs = {
+        'total': retries,
+        'backoff_factor': 0.3,
+        'status_forcelist': RETRY_STATUSES,
+        'raise_on_status': False
+    }
+    try:
+        return Retry(allowed_methods=IDEMPOTENT_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=IDEMPOTENT_METHODS, **kwargs)
+
+
+def get_keepalive_socket_options(idle):
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, idle))
+
+    return HTTPConnection.default_socket_options + options
+
+
+class VcdHTTPAdapter(HTTPAdapter):
+    '''
+        Connection pool for the requests session of a pyvcloud Client.
+
+        Connections are kept alive (with TCP keepalive probes so idle ones
+        survive between calls) and reused by every request of the module.
+        Idempotent requests are retried on connection errors and on
+        502/503/504 responses.
+    '''
+
+    def __init__(self, pool_size=DEFAULT_HTTP_POOL_SIZE,
+                 retries=DEFAULT_HTTP_RETRIES,
+                 keepalive_idle=DEFAULT_HTTP_KEEPALIVE_IDLE):
+        self.socket_options = get_keepalive_socket_options(keepalive_idle)
+        super(VcdHTTPAdapter, self).__init__(pool_connections=pool_size,
+                                             pool_maxsize=pool_size,
+                                             max_retries=get_retry(retries))
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.socket_options
+        super(VcdHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+
+    def mount_on(self, session):
+        session.mount('https://', self)
+        session.mount('http://', self)
+
+    def get_stats(self):
+        requests = 0
+        connections = 0
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                requests += pool.num_requests
+                connections += pool.num_connections
+
+        return {
+            'requests': requests,
+            'connections': connections,
+            'reused': max(requests - connections, 0)
+        }
@@ -0,0 +1,143 @@
+# Copyright © 2018 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
+
+import math
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud.vcd.client import QueryResultFormat
+from pyvcloud.vcd.utils import get_non_admin_href
+from pyvcloud.vcd.exceptions import EntityNotFoundException
+from pyvcloud.vcd.exceptions import MultipleRecordsException
+
+
+# system administrators only see the entities of other orgs through the
+# admin flavour of the queries
+ADMIN_RESOURCE_TYPES = {
+    ResourceType.VAPP.value: ResourceType.ADMIN_VAPP.value,
+    ResourceType.ORG_VDC.value: ResourceType.ADMIN_ORG_VDC.value,
+    ResourceType.CATALOG.value: ResourceType.ADMIN_CATALOG.value,
+    ResourceType.CATALOG_ITEM.value: ResourceType.ADMIN_CATALOG_ITEM.value,
+    ResourceType.VM.value: ResourceType.ADMIN_VM.value,
+}
+DEFAULT_QUERY_PAGE_SIZE = 128
+DEFAULT_QUERY_WORKERS = 4
+
+
+def get_query_page(client, resource_type, page, page_size, qfilter=None,
+                   fields=None):
+    query = client.get_typed_query(
+        resource_type,
+        query_result_format=QueryResultFormat.RECORDS,
+        page=page,
+        page_size=page_size,
+        qfilter=qfilter,
+        fields=fields)
+
+    return query.execute()
+
+
+def run_paged_queries(client, queries, page_size=DEFAULT_QUERY_PAGE_SIZE,
+                      workers=DEFAULT_QUERY_WORKERS):
+    '''
+        Run several typed queries (name: (resource type, filter) or
+        (resource type, filter, fields)) at once.
+
+        The first page of every query is requested concurrently and, once
+        its total is known, the remaining pages of the query are requested
+        concurrently as well. Returns the records of each query by name,
+        in page order.
+    '''
+    queries = dict([(name, (tuple(query) + (None,))[:3])
+                    for name, query in queries.items()])
+    pages = dict()
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        first_pages = dict()
+        for name, (resource_type, qfilter, fields) in queries.items():
+            first_pages[name] = pool.submit(
+                get_query_page, client, resource_type, 1, page_size, qfilter,
+                fields)
+
+        for name, future in first_pages.items():
+            resource_type, qfilter, fields = queries[name]
+            first_page = future.result()
+            page_count = int(math.ceil(
+                first_page['resultTotal'] / float(page_size)))
+            pages[name] = [first_page['values']] + [
+                pool.submit(get_query_page, client, resource_type, page,
+                            page_size, qfilter, fields)
+                for page in range(2, page_count + 1)
+            ]
+
+        records = dict()
+        for name, results in pages.items():
+            records[name] = list(results[0])
+            for future in results[1:]:
+                records[name].extend(future.result()['values'])
+
+    return records
+
+
+class VcdQueryResolver():
+    '''
+        Resolves the href of an entity from its name and parent with a
+        single typed query returning references, instead of downloading
+        the parent document (e.g. a VDC listing every vApp) and scanning it.
+
+        A parent is a (field, value) filter of the query such as
+        ('vdc', vdc_href) or ('orgName', org_name).
+    '''
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_resource_type(self, resource_type):
+        if self.client.is_sysadmin():
+            return ADMIN_RESOURCE_TYPES.get(resource_type, resource_type)
+
+        return resource_type
+
+    def find_references(self, resource_type, name, parent=None):
+        # pyvcloud does not encode the values of the filters, names with
+        # , ; & # + or spaces would break the query otherwise
+        qfilter = 'name=={0}'.format(quote(name))
+        if parent is not None:
+            qfilter += ';{0}=={1}'.format(parent[0], quote(parent[1]))
+
+        query = self.client.get_typed_query(
+            self.get_resource_type(resource_type),
+            query_result_format=QueryResultFormat.REFERENCES,
+            qfilter=qfilter)
+
+        return list(query.execute())
+
+    def get_href(self, resource_type, name, parent=None):
+        references = self.find_references(resource_type, name, parent)
+        if not references:
+            raise EntityNotFoundException(
+                '{0} {1} not found'.format(resource_type, name))
+
+        if len(references) > 1:
+            raise MultipleRecordsException(
+                'Found multiple {0} named {1}'.format(resource_type, name))
+
+        return get_non_admin_href(references[0].get('href'))
+
+    def get_vdc_href(self, org_href, name):
+        return self.get_href(ResourceType.ORG_VDC.value, name,
+                             ('org', get_non_admin_href(org_href)))
+
+    def get_vapp_href(self, vdc_href, name):
+        return self.get_href(ResourceType.VAPP.value, name, ('vdc', vdc_href))
+
+    def get_gateway_href(self, vdc_href, name):
+        return self.get_href(ResourceType.EDGE_GATEWAY.value, name,
+                             ('vdc', vdc_href))
+
+    def get_catalog_href(self, org_name, name):
+        return self.get_href(ResourceType.CATALOG.value, name,
+                             ('orgName', org_name))
+
+    def get_catalog_item_href(self, catalog_href, name):
+        return self.get_href(ResourceType.CATALOG_ITEM.value, name,
+                             ('catalog', catalog_href))
@@ -0,0 +1,365 @@
+# Copyright © 2018 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
+
+import os
+import time
+import mmap
+import tarfile
+import threading
+from lxml import objectify
+from concurrent.futures import ThreadPoolExecutor
+from pyvcloud.vcd.client import E
+from pyvcloud.vcd.client import NSMAP
+from pyvcloud.vcd.client import EntityType
+from pyvcloud.vcd.client import RelationType
+from pyvcloud.vcd.exceptions import UploadException
+from ansible.module_utils.vcd_cache import cache_key
+from ansible.module_utils.vcd_cache import JsonFileStore
+from ansible.module_utils.vcd_cache import DEFAULT_CACHE_DIR
+
+
+UPLOAD_JOURNAL_DIR = 'uploads'
+DEFAULT_UPLOAD_WORKERS = 4
+UPLOAD_LINKS_TIMEOUT = 600
+UPLOAD_LINKS_POLL_MAX = 5.0
+
+
+class UploadJournal():
+    '''
+        Resume journal of one catalog item upload.
+
+        The catalog item being uploaded to is kept in a small JSON document
+        while every byte range acknowledged by vCD is appended to a log, so
+        an interrupted upload only sends the ranges missing from the log.
+    '''
+
+    def __init__(self, *parts):
+        key = cache_key(*parts)
+        directory = os.path.join(DEFAULT_CACHE_DIR, UPLOAD_JOURNAL_DIR)
+        self.store = JsonFileStore(os.path.join(directory, key + '.json'))
+        self.log_path = os.path.join(directory, key + '.log')
+        self.lock = threading.Lock()
+        self.log_fd = None
+
+    def read(self):
+        return self.store.read()
+
+    def start(self, **details):
+        with self.store.update() as journal:
+            journal.clear()
+            journal.update(details)
+        if os.path.exists(self.log_path):
+            os.unlink(self.log_path)
+
+    def update(self, **details):
+        with self.store.update() as journal:
+            journal.update(details)
+
+    def get_uploaded_ranges(self):
+        uploaded = set()
+        try:
+            with open(self.log_path) as log:
+                for line in log:
+                    fields = line.split()
+                    # a partially written last line is simply ignored
+                    if len(fields) == 3:
+                        uploaded.add((fields[0], int(fields[1]), int(fields[2])))
+        except (IOError, OSError):
+            pass
+
+        return uploaded
+
+    def record(self, name, start, end):
+        line = '{0} {1} {2}\n'.format(name, start, end).encode('utf-8')
+        with self.lock:
+            if self.log_fd is None:
+                self.log_fd = os.open(self.log_path,
+                                      os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                                      0o600)
+            os.write(self.log_fd, line)
+
+    def close(self):
+        with self.lock:
+            if self.log_fd is not None:
+                os.close(self.log_fd)
+                self.log_fd = None
+
+    def remove(self):
+        self.close()
+        for path in (self.store.path, self.store.lock_path, self.log_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+class SourceFile():
+    '''
+        A file to upload, stored at offset in path (an OVA is uploaded
+        straight from the archive instead of being extracted first).
+    '''
+
+    def __init__(self, name, path, offset, size, target_offset=0):
+        self.name = name
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self.target_offset = target_offset
+
+
+def get_ova_files(file_name):
+    '''
+        Return the OVF descriptor and the files it references of an OVA,
+        located by their offset in the (uncompressed) tar archive.
+    '''
+    with tarfile.open(file_name) as ova:
+        members = dict([(member.name, member) for member in ova.getmembers()
+                        if member.isfile()])
+        descriptors = [name for name in members if name.endswith('.ovf')]
+        if not descriptors:
+            raise UploadException('OVF descriptor file not found.')
+        descriptor = ova.extractfile(members[descriptors[0]]).read()
+
+    def locate(name):
+        member = members.get(name)
+        if member is None:
+            raise UploadException('File {0} not found in {1}'.format(
+                name, file_name))
+
+        return file_name, member.offset_data, member.size
+
+    return descriptor, locate
+
+
+def get_ovf_files(file_name):
+    with open(file_name, 'rb') as ovf:
+        descriptor = ovf.read()
+    directory = os.path.dirname(os.path.abspath(file_name))
+
+    def locate(name):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            raise UploadException('File {0} not found'.format(path))
+
+        return path, 0, os.path.getsize(path)
+
+    return descriptor, locate
+
+
+def get_referenced_files(descriptor, locate):
+    '''
+        Map every file referenced by the OVF descriptor to its source
+        file(s); files split in chunks (ovf:chunkSize) are made of several
+        parts uploaded at increasing offsets of the same target file.
+    '''
+    ns = '{' + NSMAP['ovf'] + '}'
+    files = list()
+    for reference in objectify.fromstring(descriptor).References.File:
+        name = reference.get(ns + 'href')
+        size = int(reference.get(ns + 'size'))
+        chunk_size = reference.get(ns + 'chunkSize')
+        if chunk_size is None:
+            path, offset, part_size = locate(name)
+            files.append(SourceFile(name, path, offset, part_size))
+            continue
+
+        target_offset = 0
+        part = 0
+        while target_offset < size:
+            path, offset, part_size = locate('{0}.{1:09d}'.format(name, part))
+            files.append(SourceFile(name, path, offset, part_size,
+                                    target_offset=target_offset))
+            target_offset += part_size
+            part += 1
+
+    return files
+
+
+class ParallelUploader():
+    '''
+        Upload catalog items (media files, OVA and OVF templates) sending
+        the chunks of a file concurrently from a pool of workers.
+
+        Files are read through mmap so the workers slice the chunks out of
+        the page cache without sharing a file position, and every range
+        acknowledged by vCD is written to the resume journal.
+    '''
+
+    def __init__(self, client, journal, chunk_size,
+                 workers=DEFAULT_UPLOAD_WORKERS):
+        self.client = client
+        self.journal = journal
+        self.chunk_size = chunk_size
+        self.workers = max(workers, 1)
+        self.uploaded_bytes = 0
+        self.resumed_bytes = 0
+        self.lock = threading.Lock()
+
+    def get_resumable_entity_href(self, journal):
+        entity_href = journal.get('entity_href')
+        if entity_href is None:
+            return None
+
+        try:
+            self.client.get_resource(entity_href)
+        except Exception:
+            # the partially uploaded item is gone, start over
+            return None
+
+        return entity_href
+
+    def upload_media(self, catalog_resource, file_name, item_name,
+                     description=''):
+        journal = self.journal.read()
+        entity_href = self.get_resumable_entity_href(journal)
+        if entity_href is None:
+            media = E.Media(name=item_name,
+                            size=str(os.path.getsize(file_name)),
+                            imageType=os.path.splitext(item_name)[1][1:])
+            media.append(E.Description(description))
+            catalog_item = self.client.post_linked_resource(
+                catalog_resource, RelationType.ADD, EntityType.MEDIA.value,
+                media)
+            entity_href = catalog_item.Entity.get('href')
+            self.journal.start(entity_href=entity_href,
+                               chunk_size=self.chunk_size)
+        else:
+            self.chunk_size = journal.get('chunk_size', self.chunk_size)
+
+        entity = self.client.get_resource(entity_href)
+        size = os.path.getsize(file_name)
+        source = SourceFile(entity.Files.File.get('name'), file_name, 0, size)
+
+        return self.upload_files(
+            [source], {source.name: entity.Files.File.Link.get('href')})
+
+    def upload_ovf(self, catalog_resource, file_name, item_name,
+                   description=''):
+        if tarfile.is_tarfile(file_name):
+            descriptor, locate = get_ova_files(file_name)
+        else:
+            descriptor, locate = get_ovf_files(file_name)
+        files = get_referenced_files(descriptor, locate)
+
+        journal = self.journal.read()
+        entity_href = self.get_resumable_entity_href(journal)
+        if entity_href is None:
+            journal = dict()
+            params = E.UploadVAppTemplateParams(name=item_name)
+            params.append(E.Description(description))
+            catalog_item = self.client.post_linked_resource(
+                catalog_resource, RelationType.ADD,
+                EntityType.UPLOAD_VAPP_TEMPLATE_PARAMS.value, params)
+            entity_href = catalog_item.Entity.get('href')
+            self.journal.start(entity_href=entity_href,
+                               chunk_size=self.chunk_size)
+        else:
+            self.chunk_size = journal.get('chunk_size', self.chunk_size)
+
+        if not journal.get('descriptor_uploaded'):
+            entity = self.client.get_resource(entity_href)
+            self.client.put_resource(entity.Files.File.Link.get('href'),
+                                     objectify.fromstring(descriptor),
+                                     EntityType.TEXT_XML.value)
+            self.journal.update(descriptor_uploaded=True)
+            self.uploaded_bytes += len(descriptor)
+
+        entity = self.wait_for_upload_links(entity_href, len(files))
+        target_uris = dict([(target.get('name'), target.Link.get('href'))
+                            for target in entity.Files.File])
+
+        return self.upload_files(files, target_uris)
+
+    def wait_for_upload_links(self, entity_href, count):
+        '''
+            vCD adds the upload links of the referenced files to the
+            template once it has parsed the descriptor.
+        '''
+        deadline = time.time() + UPLOAD_LINKS_TIMEOUT
+        interval = 0.5
+        while True:
+            entity = self.client.get_resource(entity_href)
+            if not count or len(entity.Files.File) > 1:
+                return entity
+
+            if time.time() > deadline:
+                raise UploadException('Upload links of {0} not ready'.format(
+                    entity_href))
+            time.sleep(interval)
+            interval = min(interval * 2, UPLOAD_LINKS_POLL_MAX)
+
+    def upload_files(self, files, target_uris):
+        total_sizes = dict()
+        for source in files:
+            total_sizes[source.name] = max(
+                total_sizes.get(source.name, 0),
+                source.target_offset + source.size)
+
+        uploaded_ranges = self.journal.get_uploaded_ranges()
+        start_time = time.time()
+        mappings = list()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = list()
+                try:
+                    for source in files:
+                        target_uri = target_uris.get(source.name)
+                        if target_uri is None:
+                            raise UploadException(
+                                'Couldn\'t find uri to upload file {0}'.format(
+                                    source.name))
+                        if source.size == 0:
+                            continue
+
+                        with open(source.path, 'rb') as source_file:
+                            data = mmap.mmap(source_file.fileno(), 0,
+                                             access=mmap.ACCESS_READ)
+                        mappings.append(data)
+                        for start in range(0, source.size, self.chunk_size):
+                            end = min(start + self.chunk_size, source.size)
+                            target_range = (source.name,
+                                            source.target_offset + start,
+                                            source.target_offset + end - 1)
+                            if target_range in uploaded_ranges:
+                                self.resumed_bytes += end - start
+                                continue
+
+                            futures.append(pool.submit(
+                                self.upload_range, target_uri, data,
+                                source.offset + start, source.offset + end,
+                                target_range, total_sizes[source.name]))
+
+                    for future in futures:
+                        future.result()
+                except Exception:
+                    # stop sending the chunks not started yet, the pool
+                    # would otherwise upload them all before failing
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            for data in mappings:
+                data.close()
+            self.journal.close()
+
+        return self.get_stats(time.time() - start_time)
+
+    def upload_range(self, target_uri, data, start, end, target_range,
+                     total_size):
+        range_str = 'bytes {0}-{1}/{2}'.format(
+            target_range[1], target_range[2], total_size)
+        self.client.upload_fragment(target_uri, data[start:end], range_str)
+        self.journal.record(*target_range)
+        with self.lock:
+            self.uploaded_bytes += end - start
+
+    def get_stats(self, seconds):
+        throughput = 0
+        if seconds > 0:
+            throughput = self.uploaded_bytes / seconds / (1024 * 1024)
+
+        return {
+            'uploaded_bytes': self.uploaded_bytes,
+            'resumed_bytes': self.resumed_bytes,
+            'seconds': round(seconds, 2),
+            'throughput_mb_per_second': round(throughput, 2),
+            'workers': self.workers
+        }
@@ -151,6 +151,10 @@ class Catalog(VcdAnsibleModule):
 
         return Org(self.client, resource=org_resource)
 
+    def get_catalog_href(self):
+        return self.resolver.get_catalog_href(
+            self.org.resource.get('name'), self.params.get('catalog_name'))
+
     def create(self):
         catalog_name = self.params.get('catalog_name')
         description = self.params.get('description')
@@ -158,7 +162,7 @@ class Catalog(VcdAnsibleModule):
         response['changed'] = False
 
         try:
-            self.org.get_catalog(name=catalog_name)
+            self.get_catalog_href()
         except EntityNotFoundException:
             self.org.create_catalog(name=catalog_name, description=description)
             msg = 'Catalog {} has been created.'
@@ -176,7 +180,7 @@ class Catalog(VcdAnsibleModule):
         response['changed'] = False
 
         try:
-            self.org.get_catalog(name=catalog_name)
+            self.get_catalog_href()
         except EntityNotFoundException:
             msg = 'Catalog {} is not present.'
             response['warnings'] = msg.format(catalog_name)
@@ -220,12 +224,11 @@ class Catalog(VcdAnsibleModule):
         return response
 
     def read(self):
-        catalog_name = self.params.get('catalog_name')
         response = dict()
         result = dict()
         response['changed'] = False
 
-        catalog = self.org.get_catalog(catalog_name)
+        catalog = self.client.get_resource(self.get_catalog_href())
         result['name'] = str(catalog.get("name"))
         result['description'] = str(catalog.Description)
         result['shared'] = str(catalog.IsPublished)
@@ -65,6 +65,12 @@ options:
         description:
             - Size of chunks in which the file will be uploaded to the catalog
         required: false
+    upload_workers:
+        description:
+            - Number of chunks uploaded concurrently
+            - An interrupted upload resumes from the chunks already
+              uploaded when the module is run again with the same file
+        required: false
     vapp_name:
         description:
             - name of the vapp
@@ -110,21 +116,26 @@ EXAMPLES = '''
 RETURN = '''
 msg: success/failure message corresponding to catalog item state/operation
 changed: true if resource has been changed else false
+upload: uploaded/resumed bytes, duration and throughput of an upload
 '''
 
-import time
-from pyvcloud.vcd.vdc import VDC
+import os
 from pyvcloud.vcd.org import Org
 from pyvcloud.vcd.vapp import VApp
 from pyvcloud.vcd.client import Client
-from pyvcloud.vcd.client import QueryResultFormat
+from pyvcloud.vcd.client import ResourceType
 from ansible.module_utils.vcd import VcdAnsibleModule
+from ansible.module_utils.vcd_upload import UploadJournal
+from ansible.module_utils.vcd_upload import ParallelUploader
+from ansible.module_utils.vcd_upload import DEFAULT_UPLOAD_WORKERS
 from pyvcloud.vcd.exceptions import EntityNotFoundException
 
 
 VCD_CATALOG_ITEM_STATES = ['present', 'absent']
 VCD_CATALOG_ITEM_OPERATIONS = ['capturevapp', 'list_vms']
 DEFAULT_CHUNK_SIZE = 1024 * 1024
+CATALOG_ITEM_READY_STATUSES = ['RESOLVED']
+CATALOG_ITEM_FAILED_STATUSES = ['FAILED_CREATION']
 
 
 def vcd_catalog_item_argument_spec():
@@ -134,6 +145,8 @@ def vcd_catalog_item_argument_spec():
         file_name=dict(type='str', required=False),
         chunk_size=dict(
             type='int', required=False, default=DEFAULT_CHUNK_SIZE),
+        upload_workers=dict(
+            type='int', required=False, default=DEFAULT_UPLOAD_WORKERS),
         vapp_name=dict(type='str', required=False),
         vdc_name=dict(type='str', required=False),
         description=dict(type='str', required=False, default=''),
@@ -175,42 +188,62 @@ class CatalogItem(VcdAnsibleModule):
 
         return Org(self.client, resource=org_resource)
 
-    def is_present(self):
-        params = self.params
-        catalog_name = params.get('catalog_name')
-        item_name = params.get('item_name')
+    def get_catalog_href(self):
+        return self.resolver.get_catalog_href(
+            self.org.resource.get('name'), self.params.get('catalog_name'))
+
+    def get_catalog_item_href(self):
+        return self.resolver.get_catalog_item_href(
+            self.get_catalog_href(), self.params.get('item_name'))
+
+    def get_catalog_item(self):
+        return self.client.get_resource(self.get_catalog_item_href())
 
+    def is_present(self):
         try:
-            self.org.get_catalog_item(catalog_name, item_name)
+            self.get_catalog_item_href()
         except EntityNotFoundException:
             return False
 
         return True
 
+    def get_upload_journal(self):
+        file_name = os.path.abspath(self.params.get('file_name'))
+        stat_info = os.stat(file_name)
+
+        return UploadJournal(self.params.get('host'), self.org.href,
+                             self.params.get('catalog_name'),
+                             self.params.get('item_name'), file_name,
+                             stat_info.st_size, stat_info.st_mtime)
+
     def upload(self):
-        catalog_name = self.params.get('catalog_name')
-        item_name = self.params.get('item_name')
         file_name = self.params.get('file_name')
-        chunk_size = self.params.get('chunk_size')
+        if not self.params.get('item_name'):
+            self.params['item_name'] = os.path.basename(file_name)
+        item_name = self.params.get('item_name')
+        description = self.params.get('description')
         response = dict()
         response['changed'] = False
-        item_details = {
-            "catalog_name": catalog_name,
-            "item_name": item_name,
-            "file_name": file_name,
-            "chunk_size": chunk_size
-        }
-
-        if self.is_present():
+
+        journal = self.get_upload_journal()
+        resuming = journal.read().get('entity_href') is not None
+        if not resuming and self.is_present():
             msg = "Catalog Item {} is already present."
             response['warnings'] = msg.format(item_name)
             return response
 
+        catalog_resource = self.client.get_resource(self.get_catalog_href())
+        uploader = ParallelUploader(self.client, journal,
+                                    self.params.get('chunk_size'),
+                                    self.params.get('upload_workers'))
         if file_name.endswith(".ova") or file_name.endswith(".ovf"):
-            self.org.upload_ovf(**item_details)
-            self.ova_check_resolved()
+            response['upload'] = uploader.upload_ovf(
+                catalog_resource, file_name, item_name, description)
         else:
-            self.org.upload_media(**item_details)
+            response['upload'] = uploader.upload_media(
+                catalog_resource, file_name, item_name, description)
+        journal.remove()
+        self.check_resolved(self.get_catalog_item())
 
         response['msg'] = "Catalog item {} is uploaded.".format(item_name)
         response['changed'] = True
@@ -237,7 +270,6 @@ class CatalogItem(VcdAnsibleModule):
     def capture_vapp(self):
         vapp_name = self.params.get('vapp_name')
         vdc_name = self.params.get('vdc_name')
-        catalog_name = self.params.get('catalog_name')
         item_name = self.params.get('item_name')
         desc = self.params.get('description')
         customize_on_instantiate = self.params.get('customize_on_instantiate')
@@ -245,55 +277,38 @@ class CatalogItem(VcdAnsibleModule):
         response = dict()
         response['changed'] = False
 
-        v = self.org.get_vdc(vdc_name)
-        vdc = VDC(self.client, href=v.get('href'))
-        vapp = vdc.get_vapp(vapp_name)
-        catalog = self.org.get_catalog(catalog_name)
+        vdc_href = self.resolver.get_vdc_href(self.org.href, vdc_name)
+        vapp_href = self.resolver.get_vapp_href(vdc_href, vapp_name)
+        catalog = self.client.get_resource(self.get_catalog_href())
         self.org.capture_vapp(
-            catalog_resource=catalog, vapp_href=vapp.get('href'),
+            catalog_resource=catalog, vapp_href=vapp_href,
             catalog_item_name=item_name, description=desc,
             customize_on_instantiate=customize_on_instantiate,
             overwrite=overwrite)
-        self.ova_check_resolved()
+        self.check_resolved(self.get_catalog_item())
         response['msg'] = "Catalog Item {} has been captured".format(item_name)
         response['changed'] = True
 
         return response
 
-    def ova_check_resolved(self):
-        catalog_name = self.params.get('catalog_name')
-        item_name = self.params.get('item_name')
-        response = False
+    def check_resolved(self, *catalog_items):
+        '''
+            Wait for vCD to import the uploaded/captured catalog items.
+        '''
+        item_ids = [item.get('id') for item in catalog_items]
+        resource_type = self.resolver.get_resource_type(
+            ResourceType.CATALOG_ITEM.value)
 
-        source_ova_item = self.org.get_catalog_item(catalog_name, item_name)
-        self.check_resolved(source_ova_item, catalog_name, item_name)
-        response = True
-
-        return response
-
-    def check_resolved(self, source_ova_item, catalog_name, item_name):
-        item_id = source_ova_item.get('id')
-
-        while True:
-            q = self.client.get_typed_query(
-                'catalogItem',
-                query_result_format=QueryResultFormat.ID_RECORDS,
-                qfilter='id==%s' % item_id
-            )
-            records = list(q.execute())
-            # TODO might have to check when status goes to other state than resolved
-            if records[0].get('status') == 'RESOLVED':
-                break
-            else:
-                time.sleep(5)
+        return self.wait_for_entity_status(
+            resource_type, item_ids, CATALOG_ITEM_READY_STATUSES,
+            CATALOG_ITEM_FAILED_STATUSES)
 
     def list_vms(self):
-        catalog_name = self.params.get('catalog_name')
         item_name = self.params.get('item_name')
         response = dict()
         response['changed'] = False
 
-        catalog_item = self.org.get_catalog_item(catalog_name, item_name)
+        catalog_item = self.get_catalog_item()
         catalog_item_href = catalog_item.Entity.get('href')
         vapp_template_resource = self.client.get_resource(catalog_item_href)
         vapp_template = VApp(
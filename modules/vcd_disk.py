@@ -162,8 +162,9 @@ class Disk(VcdAnsibleModule):
     def __init__(self, **kwargs):
         super(Disk, self).__init__(**kwargs)
         self.org = self.get_org()
-        vdc = self.org.get_vdc(self.params.get('vdc'))
-        self.vdc = VDC(self.client, href=vdc.get('href'))
+        vdc_href = self.resolver.get_vdc_href(
+            self.org.href, self.params.get('vdc'))
+        self.vdc = VDC(self.client, href=vdc_href)
 
     def manage_states(self):
         state = self.params.get('state')
@@ -0,0 +1,330 @@
+# Copyright © 2018 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
+
+# !/usr/bin/python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: vcd_facts
+short_description: Gather the facts of a vCloud Director organization
+version_added: "2.7"
+description:
+    - Gather the vdcs, vApps, VMs, networks, catalogs and gateways of an
+      organization in one pass
+    - The typed queries of every entity run concurrently, page by page,
+      and their records are returned as a compact normalized structure
+
+options:
+    user:
+        description:
+            - vCloud Director user name
+        required: false
+    password:
+        description:
+            - vCloud Director user password
+        required: false
+    host:
+        description:
+            - vCloud Director host address
+        required: false
+    org:
+        description:
+            - Organization name on vCloud Director to access
+        required: false
+    api_version:
+        description:
+            - Pyvcloud API version
+        required: false
+    verify_ssl_certs:
+        description:
+            - whether to use secure connection to vCloud Director host
+        required: false
+    org_name:
+        description:
+            - Organization to gather, defaults to the logged in one
+        required: false
+    entities:
+        description:
+            - Entities to gather (vdcs/vapps/vms/networks/catalogs/gateways)
+            - All of them by default
+        required: false
+        type: list
+    page_size:
+        description:
+            - Number of records requested per query page
+        required: false
+        default: 128
+    workers:
+        description:
+            - Number of query pages requested concurrently
+        required: false
+        default: 4
+author:
+    - mtaneja@vmware.com
+'''
+
+EXAMPLES = '''
+- name: gather the vms and vapps of the org
+  vcd_facts:
+    org_name: "Acme"
+    entities:
+      - vapps
+      - vms
+
+- name: list the vms which are powered off
+  debug:
+    msg: "{{ vcd_facts.vms | selectattr('status', 'equalto', 'POWERED_OFF') | map(attribute='name') | list }}"
+'''
+
+RETURN = '''
+msg: number of records gathered per entity
+ansible_facts: vcd_facts with one list of records per gathered entity
+'''
+
+from urllib.parse import quote
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud.vcd.utils import get_non_admin_href
+from ansible.module_utils.vcd import QUERY_BATCH_SIZE
+from ansible.module_utils.vcd import VcdAnsibleModule
+from ansible.module_utils.vcd_query import run_paged_queries
+from ansible.module_utils.vcd_query import ADMIN_RESOURCE_TYPES
+from ansible.module_utils.vcd_query import DEFAULT_QUERY_WORKERS
+from ansible.module_utils.vcd_query import DEFAULT_QUERY_PAGE_SIZE
+
+
+VCD_FACTS_ENTITIES = ['vdcs', 'vapps', 'vms', 'networks', 'catalogs',
+                      'gateways']
+
+# entities without an org filter, only found through the vdcs of the org
+VDC_ENTITY_TYPES = {
+    'networks': ResourceType.ORG_VDC_NETWORK.value,
+    'gateways': ResourceType.EDGE_GATEWAY.value,
+}
+
+# fact name: record attribute(s), the first one present is used
+VCD_FACTS_FIELDS = {
+    'vdcs': [
+        ('name', 'name'),
+        ('enabled', 'isEnabled'),
+        ('vapps', 'numberOfVApps'),
+        ('status', 'status'),
+    ],
+    'vapps': [
+        ('name', 'name'),
+        ('vdc', 'vdcName'),
+        ('status', 'status'),
+        ('owner', 'ownerName'),
+        ('vms', 'numberOfVMs'),
+        ('deployed', 'isDeployed'),
+    ],
+    'vms': [
+        ('name', 'name'),
+        ('vapp', 'containerName'),
+        ('status', 'status'),
+        ('os', 'guestOs'),
+        ('cpus', 'numberOfCpus'),
+        ('memory_mb', 'memoryMB'),
+        ('ip_address', 'ipAddress'),
+        ('network', 'networkName'),
+        ('storage_profile', 'storageProfileName'),
+    ],
+    'networks': [
+        ('name', 'name'),
+        ('link_type', 'linkType'),
+        ('gateway', 'defaultGateway'),
+        ('netmask', 'netmask'),
+        ('connected_to', 'connectedTo'),
+        ('shared', 'isShared'),
+    ],
+    'catalogs': [
+        ('name', 'name'),
+        ('published', 'isPublished'),
+        ('shared', 'isShared'),
+        ('templates', ('numberOfVAppTemplates', 'numberOfTemplates')),
+        ('media', 'numberOfMedia'),
+        ('owner', 'ownerName'),
+    ],
+    'gateways': [
+        ('name', 'name'),
+        ('status', 'gatewayStatus'),
+        ('ha_status', 'haStatus'),
+        ('external_networks', 'numberOfExtNetworks'),
+        ('org_networks', 'numberOfOrgNetworks'),
+    ],
+}
+
+
+def vcd_facts_argument_spec():
+    return dict(
+        org_name=dict(type='str', required=False),
+        entities=dict(type='list', required=False, choices=VCD_FACTS_ENTITIES,
+                      default=VCD_FACTS_ENTITIES),
+        page_size=dict(type='int', required=False,
+                       default=DEFAULT_QUERY_PAGE_SIZE),
+        workers=dict(type='int', required=False,
+                     default=DEFAULT_QUERY_WORKERS),
+    )
+
+
+def get_value(value):
+    if value in ('true', 'false'):
+        return value == 'true'
+
+    if value is not None and value.lstrip('-').isdigit():
+        return int(value)
+
+    return value
+
+
+def get_record_facts(record, fields):
+    facts = dict()
+    for name, attributes in fields:
+        if not isinstance(attributes, tuple):
+            attributes = (attributes, )
+        values = [record.get(attribute) for attribute in attributes
+                  if record.get(attribute) is not None]
+        facts[name] = get_value(values[0]) if values else None
+
+    return facts
+
+
+class VcdFacts(VcdAnsibleModule):
+    def __init__(self, **kwargs):
+        super(VcdFacts, self).__init__(**kwargs)
+        self.is_sysadmin = self.client.is_sysadmin()
+
+    def get_org_resource(self):
+        org_name = self.params.get('org_name')
+        if org_name:
+            return self.client.get_org_by_name(org_name)
+
+        return self.client.get_org()
+
+    def get_resource_type(self, resource_type):
+        if self.is_sysadmin:
+            return ADMIN_RESOURCE_TYPES.get(resource_type, resource_type)
+
+        return resource_type
+
+    def get_queries(self, org_resource, entities):
+        '''
+            Typed query of every entity to gather. The vdcs of the org are
+            always queried, the other entities being matched against them.
+            Networks and gateways are left out for system administrators,
+            see get_vdc_queries.
+        '''
+        org_filter = None
+        if self.is_sysadmin:
+            org_filter = 'org=={0}'.format(
+                get_non_admin_href(org_resource.get('href')))
+        catalog_filter = 'orgName=={0}'.format(quote(org_resource.get('name')))
+        vm_filter = 'isVAppTemplate==false'
+        if org_filter is not None:
+            vm_filter = '{0};{1}'.format(org_filter, vm_filter)
+
+        queries = {
+            'vdcs': (ResourceType.ORG_VDC.value, org_filter),
+            'vapps': (ResourceType.VAPP.value, org_filter),
+            'vms': (ResourceType.VM.value, vm_filter),
+            'catalogs': (ResourceType.CATALOG.value, catalog_filter),
+        }
+        if not self.is_sysadmin:
+            # the queries of an org user only return that org
+            for name, resource_type in VDC_ENTITY_TYPES.items():
+                queries[name] = (resource_type, None)
+
+        return dict([
+            (name, (self.get_resource_type(resource_type), qfilter))
+            for name, (resource_type, qfilter) in queries.items()
+            if name in entities or name == 'vdcs'
+        ])
+
+    def get_vdc_queries(self, vdc_hrefs, entities):
+        '''
+            Networks and gateways queries of a system administrator are
+            system wide, they are filtered by the vdcs of the org,
+            QUERY_BATCH_SIZE vdcs per query keyed by (entity, batch).
+        '''
+        vdc_filters = [
+            ','.join(['vdc=={0}'.format(vdc_href) for vdc_href in
+                      vdc_hrefs[index:index + QUERY_BATCH_SIZE]])
+            for index in range(0, len(vdc_hrefs), QUERY_BATCH_SIZE)
+        ]
+
+        return dict([
+            ((name, batch), (self.get_resource_type(resource_type),
+                             vdc_filter))
+            for name, resource_type in VDC_ENTITY_TYPES.items()
+            if name in entities
+            for batch, vdc_filter in enumerate(vdc_filters)
+        ])
+
+    def gather(self):
+        response = dict()
+        response['changed'] = False
+
+        entities = self.params.get('entities')
+        org_resource = self.get_org_resource()
+        records = run_paged_queries(self.client,
+                                    self.get_queries(org_resource, entities),
+                                    page_size=self.params.get('page_size'),
+                                    workers=self.params.get('workers'))
+
+        vdc_names = dict([
+            (get_non_admin_href(record.get('href')), record.get('name'))
+            for record in records['vdcs']
+        ])
+        vdc_queries = dict()
+        if self.is_sysadmin and vdc_names:
+            vdc_queries = self.get_vdc_queries(sorted(vdc_names), entities)
+        if vdc_queries:
+            batches = run_paged_queries(
+                self.client, vdc_queries,
+                page_size=self.params.get('page_size'),
+                workers=self.params.get('workers'))
+            for (name, batch) in sorted(batches):
+                records.setdefault(name, list()).extend(batches[(name, batch)])
+
+        facts = dict()
+        for name in entities:
+            facts[name] = list()
+            for record in records.get(name, list()):
+                entity_facts = get_record_facts(record, VCD_FACTS_FIELDS[name])
+                vdc_href = record.get('vdc')
+                if vdc_href is not None:
+                    vdc_href = get_non_admin_href(vdc_href)
+                    if vdc_href not in vdc_names:
+                        # entity of another org
+                        continue
+                    entity_facts['vdc'] = vdc_names[vdc_href]
+                facts[name].append(entity_facts)
+
+        response['ansible_facts'] = {'vcd_facts': facts}
+        response['msg'] = dict([(name, len(facts[name])) for name in entities])
+
+        return response
+
+
+def main():
+    argument_spec = vcd_facts_argument_spec()
+    response = dict(msg=dict(type='str'))
+    module = VcdFacts(argument_spec=argument_spec, supports_check_mode=True)
+
+    try:
+        response = module.gather()
+
+    except Exception as error:
+        response['msg'] = error.__str__()
+        module.fail_json(**response)
+    else:
+        module.exit_json(**response)
+
+
+if __name__ == '__main__':
+    main()
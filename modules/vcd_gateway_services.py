@@ -67,19 +67,36 @@ options:
                 - nat_rule
                 - static_route
                 - ssl_certificates
-        required: true
+            - either service or services is required
+        required: false
         type: str
     service_params:
         description:
             - A list type respective service parameters
         required: false
         type: list
+    services:
+        description:
+            - The service_params of several services of the gateway, by
+              service name, which are applied in a single run
+            - the gateway is resolved once and the services are pushed
+              concurrently, each one with a single update of its config
+            - msg is then a dict of the msg of each service
+            - when some services fail, the module fails after the other
+              services are applied, with the error of each failed service
+              as its msg and the failed services in failed_services
+            - mutually exclusive with service and service_params
+        required: false
+        type: dict
     state:
         description:
             - State of the edge gateway service
+            - synced (firewall only) makes the user rules of the edge
+              exactly the rules of service_params, in their order, with a
+              single update of the edge
         type: string
         required: true
-        choices: ['present', 'update', 'absent']
+        choices: ['present', 'update', 'absent', 'synced']
     operation:
         description:
             - Operation on the edge gateway service
@@ -108,6 +125,52 @@ EXAMPLES = '''
           logging_enabled: False
      state: present
 
+- name: sync the firewall rules of the gateway
+  vcd_gateway_services:
+     vdc: ACME_PAYG
+     gateway: edge-gateway
+     service: firewall
+     service_params:
+        - name: allow_ssh
+          action: accept
+          destination_values:
+            - ip:
+                - "10.0.0.10"
+          services:
+            - tcp:
+                source_port: "any"
+                destination_port: "22"
+        - name: deny_all
+          action: deny
+     state: synced
+
+- name: create firewall rules and nat rules of a gateway
+  vcd_gateway_services:
+     vdc: ACME_PAYG
+     gateway: edge-gateway
+     services:
+        firewall:
+          - name: allow_web
+            action: accept
+            destination_values:
+              - ip:
+                  - "10.0.0.10"
+            services:
+              - tcp:
+                  source_port: "any"
+                  destination_port: "443"
+        nat_rule:
+          - action: dnat
+            original_address: 10.172.17.11
+            translated_address: 10.0.0.10
+            protocol: tcp
+            original_port: 443
+            translated_port: 443
+        static_route:
+          - network: 192.168.2.0/24
+            next_hop: 10.0.0.1
+     state: present
+
 '''
 
 
@@ -116,6 +179,7 @@ msg: success/failure message corresponding to edge gateway state
 changed: true if resource has been changed else false
 '''
 
+from concurrent.futures import ThreadPoolExecutor
 from pyvcloud.vcd.org import Org
 from pyvcloud.vcd.vdc import VDC
 from pyvcloud.vcd.gateway import Gateway
@@ -128,8 +192,15 @@ from ansible.module_utils.gateway_ssl_certificates import SSLCertificates
 
 
 EDGE_SERVICES = ["firewall", "nat_rule", "static_route", "ssl_certificates"]
-EDGE_SERVICES_STATES = ['present', 'update', 'absent']
+EDGE_SERVICES_STATES = ['present', 'update', 'absent', 'synced']
 EDGE_SERVICES_OPERATIONS = ['list']
+EDGE_SERVICES_WORKERS = 4
+EDGE_SERVICE_CLASSES = {
+    "firewall": FirewallService,
+    "nat_rule": NatRuleService,
+    "static_route": StaticRoutes,
+    "ssl_certificates": SSLCertificates
+}
 
 
 def vcd_gateway_services_argument_spec():
@@ -137,7 +208,8 @@ def vcd_gateway_services_argument_spec():
         vdc=dict(type='str', required=True),
         gateway=dict(type='str', required=True),
         service_params=dict(type='list', required=False),
-        service=dict(choices=EDGE_SERVICES, required=True),
+        service=dict(choices=EDGE_SERVICES, required=False),
+        services=dict(type='dict', required=False),
         org_name=dict(type='str', required=False, default=None),
         state=dict(choices=EDGE_SERVICES_STATES, required=False),
         operation=dict(choices=EDGE_SERVICES_OPERATIONS, required=False)
@@ -148,24 +220,22 @@ class EdgeServices(VcdAnsibleModule):
     def __init__(self, **kwargs):
         super(EdgeServices, self).__init__(**kwargs)
         self.org = self.get_org()
-        vdc = self.org.get_vdc(self.params.get('vdc'))
-        self.vdc = VDC(self.client, href=vdc.get('href'))
+        vdc_href = self.resolver.get_vdc_href(
+            self.org.href, self.params.get('vdc'))
+        self.vdc = VDC(self.client, href=vdc_href)
+        self.gateway = None
 
     def manage_states(self):
         state = self.params.get("state")
-        if state == "present":
-            return self.add_service()
-
-        if state == "update":
-            return self.update_service()
+        if state not in EDGE_SERVICES_STATES:
+            raise Exception("Please provide a valid state for the service")
 
-        if state == "absent":
-            return self.delete_service()
+        return self.apply_on_services(state=state)
 
     def manage_operations(self):
         operation = self.params.get("operation")
 
-        return self.apply_operation_on_service(operation)
+        return self.apply_on_services(operation=operation)
 
     def get_org(self):
         org_name = self.params.get('org_name')
@@ -176,76 +246,117 @@ class EdgeServices(VcdAnsibleModule):
         return Org(self.client, resource=org_resource)
 
     def get_gateway(self):
+        '''
+            The gateway is resolved with a single typed query the first
+            time it is needed and shared by all the services.
+        '''
+        if self.gateway is not None:
+            return self.gateway
+
         gateway_name = self.params.get("gateway")
-        gateway = self.vdc.get_gateway(gateway_name)
-        if gateway is None:
+        try:
+            gateway_href = self.resolver.get_gateway_href(
+                self.vdc.href, gateway_name)
+        except EntityNotFoundException:
             msg = "Gateway {0} not found".format(gateway_name)
             raise EntityNotFoundException(msg)
 
-        extra_args = {"name": gateway_name, "href": gateway.get("href")}
-        return Gateway(self.client, **extra_args)
-
-    def add_service(self):
-        service = self.params.get("service")
-        service_params = self.params.get("service_params")
-        if service == "firewall":
-            service = FirewallService(self.get_gateway(), service_params)
-
-        if service == "nat_rule":
-            service = NatRuleService(self.get_gateway(), service_params)
-
-        if service == "static_route":
-            service = StaticRoutes(self.get_gateway(), service_params)
-
-        if service == "ssl_certificates":
-            service = SSLCertificates(self.get_gateway(), service_params)
-
-        return service.manage_states(state="present")
-
-    def delete_service(self):
-        service = self.params.get("service")
-        service_params = self.params.get("service_params")
-        if service == "firewall":
-            service = FirewallService(self.get_gateway(), service_params)
-
-        if service == "nat_rule":
-            service = NatRuleService(self.get_gateway(), service_params)
-
-        if service == "static_route":
-            service = StaticRoutes(self.get_gateway(), service_params)
-
-        if service == "ssl_certificates":
-            service = SSLCertificates(self.get_gateway(), service_params)
+        extra_args = {"name": gateway_name, "href": gateway_href}
+        self.gateway = Gateway(self.client, **extra_args)
 
-        return service.manage_states(state="absent")
+        return self.gateway
 
-    def update_service(self):
-        service = self.params.get("service")
-        service_params = self.params.get("service_params")
-        if service == "firewall":
-            service = FirewallService(self.get_gateway(), service_params)
+    def get_services(self):
+        '''
+            Returns the (service, service_params) to apply, either the
+            single service of the module or every service of services.
+        '''
+        services = self.params.get("services")
+        if services and self.params.get("service"):
+            raise Exception("service and services are mutually exclusive")
 
-        if service == "nat_rule":
-            service = NatRuleService(self.get_gateway(), service_params)
+        if services and self.params.get("service_params"):
+            raise Exception(
+                "service_params and services are mutually exclusive")
 
-        if service == "static_route":
-            service = StaticRoutes(self.get_gateway(), service_params)
+        if services:
+            invalid = [service for service in services
+                       if service not in EDGE_SERVICES]
+            if invalid:
+                raise Exception("Unsupported edge gateway services {0}".format(
+                    invalid))
 
-        return service.manage_states(state="update")
+            return [(service, services.get(service) or [])
+                    for service in EDGE_SERVICES if service in services]
 
-    def apply_operation_on_service(self, operation):
         service = self.params.get("service")
-        if service == "firewall":
-            service = FirewallService(self.get_gateway())
+        if not service:
+            raise Exception("Please provide service or services")
 
-        if service == "nat_rule":
-            service = NatRuleService(self.get_gateway())
+        return [(service, self.params.get("service_params"))]
 
-        if service == "static_route":
-            service = StaticRoutes(self.get_gateway())
+    def get_service(self, service, service_params=None):
+        state = self.params.get("state")
+        if state == "update" and service == "ssl_certificates":
+            raise Exception("update state is not supported for ssl_certificates")
+
+        if state == "synced" and service != "firewall":
+            raise Exception("synced state is only supported for firewall")
+
+        if state == "synced":
+            service_params = service_params or []
+
+        return EDGE_SERVICE_CLASSES[service](self.get_gateway(), service_params)
+
+    def apply_on_services(self, state=None, operation=None):
+        '''
+            Applies the state or operation to every requested service of
+            the gateway. Each service family has its own config on the
+            edge, so several services are pushed concurrently. A failed
+            service does not stop the others, the module fails once they
+            are all applied.
+        '''
+        services = [(name, self.get_service(name, service_params))
+                    for name, service_params in self.get_services()]
+        if not self.params.get("services"):
+            return self.apply_on_service(services[0][1], state, operation)
+
+        workers = min(len(services), EDGE_SERVICES_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = [(name, pool.submit(self.apply_on_service, service,
+                                          state, operation))
+                       for name, service in services]
 
-        if service == "ssl_certificates":
-            service = SSLCertificates(self.get_gateway())
+            response = dict()
+            response['changed'] = False
+            response['msg'] = dict()
+            response['warnings'] = list()
+            failed_services = list()
+            for name, result in results:
+                try:
+                    result = result.result()
+                except Exception as error:
+                    response['msg'][name] = error.__str__()
+                    failed_services.append(name)
+                    continue
+
+                response['changed'] = (response['changed'] or
+                                       result.get('changed'))
+                response['msg'][name] = result.get('msg')
+                warnings = result.get('warnings')
+                if warnings:
+                    response['warnings'].append('{0}: {1}'.format(
+                        name, warnings))
+
+        if failed_services:
+            response['failed_services'] = failed_services
+            self.fail_json(**response)
+
+        return response
+
+    def apply_on_service(self, service, state=None, operation=None):
+        if state:
+            return service.manage_states(state=state)
 
         return service.manage_operations(operation=operation)
 
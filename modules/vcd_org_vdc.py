@@ -244,7 +244,11 @@ changed: true if resource has been changed else false
 
 from pyvcloud.vcd.org import Org
 from pyvcloud.vcd.vdc import VDC
+from pyvcloud.vcd.pvdc import PVDC
+from pyvcloud.vcd.client import E
 from pyvcloud.vcd.system import System
+from pyvcloud.vcd.client import EntityType
+from pyvcloud.vcd.client import RelationType
 from ansible.module_utils.vcd import VcdAnsibleModule
 from pyvcloud.vcd.exceptions import EntityNotFoundException
 from pyvcloud.vcd.exceptions import OperationNotSupportedException
@@ -329,15 +333,14 @@ class Vdc(VcdAnsibleModule):
         return self.client.get_org()
 
     def get_vdc(self):
+        vdc_name = self.params['vdc_name']
         try:
-            vdc_name = self.params['vdc_name']
-            vdc_resource = self.org.get_vdc(vdc_name)
-            assert vdc_resource is not None
-        except AssertionError:
+            vdc_href = self.resolver.get_vdc_href(self.org.href, vdc_name)
+        except EntityNotFoundException:
             msg = "{0} is not found"
             raise EntityNotFoundException(msg.format(vdc_name))
 
-        return VDC(self.client, name=vdc_name, resource=vdc_resource)
+        return VDC(self.client, name=vdc_name, href=vdc_href)
 
     def create(self):
         vdc_name = self.params['vdc_name']
@@ -513,21 +516,25 @@ class Vdc(VcdAnsibleModule):
 
         try:
             vdc = self.get_vdc()
+            profiles_to_add = list()
             for profile in profiles:
                 name = profile['name']
                 if name not in storage_profiles:
                     enabled = profile['enabled']
                     default = profile['default']
-                    kwargs = {
+                    profiles_to_add.append({
+                        'name': name,
                         'enabled': True if enabled == 'true' else False,
                         'default': True if default == 'true' else False,
                         'limit_in_mb': profile['limit']
-                    }
-                    task = vdc.add_storage_profile(name, **kwargs)
-                    self.execute_task(task)
+                    })
                     response['msg'].append(profile['name'])
                     continue
                 response['warnings'].append(name)
+            if profiles_to_add:
+                task = self.add_storage_profiles(vdc, profiles_to_add)
+                self.execute_task(task)
+                response['changed'] = True
             response = self._update_response(response, msg, warning)
         except EntityNotFoundException:
             msg = 'VDC {} is not present'
@@ -535,6 +542,32 @@ class Vdc(VcdAnsibleModule):
 
         return response
 
+    def add_storage_profiles(self, vdc, profiles):
+        '''
+            Add all the given storage profiles to the vdc with a single
+            UpdateVdcStorageProfiles request, i.e. a single vCD task
+            instead of one task per profile.
+        '''
+        vdc_admin_resource = self.client.get_resource(vdc.href_admin)
+        pvdc = PVDC(self.client,
+                    href=vdc_admin_resource.ProviderVdcReference.get('href'))
+        params = E.UpdateVdcStorageProfiles()
+        for profile in profiles:
+            pvdc_profile = pvdc.get_storage_profile(profile['name'])
+            params.append(E.AddStorageProfile(
+                E.Enabled(profile['enabled']),
+                E.Units('MB'),
+                E.Limit(profile['limit_in_mb']),
+                E.Default(profile['default']),
+                E.ProviderVdcStorageProfile(
+                    '', href=pvdc_profile.get('href'))))
+
+        return self.client.post_linked_resource(
+            resource=vdc_admin_resource,
+            rel=RelationType.EDIT,
+            media_type=EntityType.UPDATE_VDC_STORAGE_PROFILES.value,
+            contents=params)
+
     def update_storage_profile(self):
         vdc_name = self.params['vdc_name']
         profiles = self.params['storage_profiles']
@@ -580,11 +613,15 @@ class Vdc(VcdAnsibleModule):
 
         try:
             vdc = self.get_vdc()
-            for profile in profiles:
-                name = profile.get("name")
+            names = [profile.get("name") for profile in profiles]
+            removed = [name for name in names if name in storage_profiles]
+            for name in names:
                 if name in storage_profiles:
                     remove_vdc_task = vdc.remove_storage_profile(name)
-                    self.execute_task(remove_vdc_task)
+                    # the VDC is busy till each removal is done, only the
+                    # last one may be left running with async_task
+                    self.execute_task(remove_vdc_task,
+                                      wait=name != removed[-1])
                     response['msg'].append(name)
                     continue
                 response['warnings'].append(name)
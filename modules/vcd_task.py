@@ -0,0 +1,178 @@
+# Copyright © 2018 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
+
+# !/usr/bin/python
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: vcd_task
+short_description: Wait for, poll or cancel vCloud Director tasks
+version_added: "2.7"
+description:
+    - Wait for, poll or cancel vCloud Director tasks in bulk
+    - Meant to collect the tasks returned by other modules run with
+      async_task set to true
+
+options:
+    user:
+        description:
+            - vCloud Director user name
+        required: false
+    password:
+        description:
+            - vCloud Director user password
+        required: false
+    host:
+        description:
+            - vCloud Director host address
+        required: false
+    org:
+        description:
+            - Organization name on vCloud Director to access
+        required: false
+    api_version:
+        description:
+            - Pyvcloud API version
+        required: false
+    verify_ssl_certs:
+        description:
+            - whether to use secure connection to vCloud Director host
+        required: false
+    task_hrefs:
+        description:
+            - List of task hrefs
+        required: true
+        type: list
+    operation:
+        description:
+            - operation on the tasks (wait/poll/cancel)
+            - wait blocks till all the tasks have finished and fails if
+              any of them has not succeeded
+            - poll returns the current status of the tasks
+            - cancel cancels the tasks which have not finished yet
+        required: true
+author:
+    - mtaneja@vmware.com
+'''
+
+EXAMPLES = '''
+- name: deploy VMs without waiting for them
+  vcd_vapp_vm:
+    target_vm_name: "{{ item }}"
+    target_vapp: "vapp1"
+    target_vdc: "vdc1"
+    source_catalog_name: "catalog1"
+    source_template_name: "template1"
+    async_task: true
+    state: "present"
+  with_items: "{{ vm_names }}"
+  register: deployments
+
+- name: wait for all the deployments
+  vcd_task:
+    task_hrefs: "{{ deployments.results | map(attribute='tasks') | select('defined') | flatten }}"
+    operation: wait
+'''
+
+RETURN = '''
+msg: per task result with href and status
+changed: true if any task has been canceled else false
+'''
+
+from pyvcloud.vcd.client import TaskStatus
+from ansible.module_utils.vcd import VcdAnsibleModule
+from ansible.module_utils.vcd import TASK_TERMINAL_STATUSES
+
+
+VCD_TASK_OPERATIONS = ['wait', 'poll', 'cancel']
+
+
+def vcd_task_argument_spec():
+    return dict(
+        task_hrefs=dict(type='list', required=True),
+        operation=dict(choices=VCD_TASK_OPERATIONS, required=True),
+    )
+
+
+class VcdTask(VcdAnsibleModule):
+    def __init__(self, **kwargs):
+        super(VcdTask, self).__init__(**kwargs)
+        # the task references only need an href to be polled
+        self.tasks = [{'href': href} for href in self.params.get('task_hrefs')]
+
+    def manage_operations(self):
+        operation = self.params.get('operation')
+        if operation == "wait":
+            return self.wait()
+
+        if operation == "poll":
+            return self.poll()
+
+        if operation == "cancel":
+            return self.cancel()
+
+    def wait(self):
+        response = dict()
+        response['changed'] = False
+        response['msg'] = self.wait_for_tasks(self.tasks)
+
+        failed = [result.get('href') for result in response['msg']
+                  if result.get('status') != TaskStatus.SUCCESS.value]
+        if failed:
+            raise Exception('Tasks {0} have not succeeded: {1}'.format(
+                failed, response['msg']))
+
+        return response
+
+    def poll(self):
+        response = dict()
+        response['changed'] = False
+        response['msg'] = self.poll_tasks(self.tasks)
+
+        return response
+
+    def cancel(self):
+        response = dict()
+        response['changed'] = False
+        response['msg'] = list()
+
+        for result in self.poll_tasks(self.tasks):
+            if result.get('status') not in TASK_TERMINAL_STATUSES:
+                self.client.post_resource(
+                    result.get('href') + '/action/cancel', None, None)
+                result['status'] = 'cancel requested'
+                response['changed'] = True
+            response['msg'].append(result)
+
+        return response
+
+
+def main():
+    argument_spec = vcd_task_argument_spec()
+    response = dict(msg=dict(type='str'))
+    module = VcdTask(argument_spec=argument_spec, supports_check_mode=True)
+
+    try:
+        if module.check_mode:
+            response = dict()
+            response['changed'] = False
+            response['msg'] = "skipped, running in check mode"
+            response['skipped'] = True
+        else:
+            response = module.manage_operations()
+
+    except Exception as error:
+        response['msg'] = error.__str__()
+        module.fail_json(**response)
+    else:
+        module.exit_json(**response)
+
+
+if __name__ == '__main__':
+    main()
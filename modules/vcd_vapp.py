@@ -137,6 +137,11 @@ options:
             - shared access for a vapp across the org.
             - Possible values could be 'ReadOnly', 'Change', 'FullControl'
         requried: false
+    vm_details:
+        description:
+            - true to add the cpus, memory and storage profile of every vm
+              to the list_vms operation output
+        required: false
     state:
         description:
             - state of new virtual machines (present/absent).
@@ -197,11 +202,54 @@ VAPP_SHARED_ACCESS = ['ReadOnly', 'Change', 'FullControl']
 VAPP_METADATA_DOMAINS = ['GENERAL', 'SYSTEM']
 VAPP_METADATA_VISIBILITY = ['PRIVATE', 'READONLY', 'READWRITE']
 VAPP_SET_METADATA_VALUE_TYPE = ['String', 'Number', 'Boolean', 'DateTime']
+# rasd:ResourceType of the virtual hardware items
+VM_CPU_RESOURCE_TYPE = 3
+VM_MEMORY_RESOURCE_TYPE = 4
 VAPP_OPERATIONS = ['poweron', 'poweroff', 'list_vms', 'list_networks',
                    'share', 'unshare', 'set_meta', 'get_meta', 'remove_meta',
                    'add_org_network', 'delete_org_network']
 
 
+def get_vm_primary_ip(vm):
+    '''
+        IP address of the primary NIC of a vm element of the vApp document.
+    '''
+    section = vm.find('vcloud:NetworkConnectionSection', NSMAP)
+    if section is None:
+        return None
+
+    primary_index = section.findtext(
+        'vcloud:PrimaryNetworkConnectionIndex', namespaces=NSMAP)
+    ip_addresses = list()
+    for connection in section.findall('vcloud:NetworkConnection', NSMAP):
+        ip_address = connection.findtext('vcloud:IpAddress', namespaces=NSMAP)
+        index = connection.findtext('vcloud:NetworkConnectionIndex',
+                                    namespaces=NSMAP)
+        if index == primary_index:
+            return ip_address
+        ip_addresses.append(ip_address)
+
+    return next((ip for ip in ip_addresses if ip), None)
+
+
+def get_vm_details(vm):
+    details = {'cpus': None, 'memory_mb': None, 'storage_profile': None}
+    items = vm.xpath('ovf:VirtualHardwareSection/ovf:Item', namespaces=NSMAP)
+    for item in items:
+        resource_type = item.findtext('rasd:ResourceType', namespaces=NSMAP)
+        quantity = item.findtext('rasd:VirtualQuantity', namespaces=NSMAP)
+        if resource_type == str(VM_CPU_RESOURCE_TYPE):
+            details['cpus'] = int(quantity)
+        elif resource_type == str(VM_MEMORY_RESOURCE_TYPE):
+            details['memory_mb'] = int(quantity)
+
+    storage_profile = vm.find('vcloud:StorageProfile', NSMAP)
+    if storage_profile is not None:
+        details['storage_profile'] = storage_profile.get('name')
+
+    return details
+
+
 def vapp_argument_spec():
     return dict(
         vapp_name=dict(type='str', required=True),
@@ -232,6 +280,7 @@ def vapp_argument_spec():
         fence_mode=dict(type='str', required=False, default=FenceMode.BRIDGED.value),
         shared_access=dict(type='str', required=False, choices=VAPP_SHARED_ACCESS, default="ReadOnly"),
         org_name=dict(type='str', required=False, default=None),
+        vm_details=dict(type='bool', required=False, default=False),
         state=dict(choices=VAPP_VM_STATES, required=False),
         operation=dict(choices=VAPP_OPERATIONS, required=False),
     )
@@ -241,8 +290,9 @@ class Vapp(VcdAnsibleModule):
     def __init__(self, **kwargs):
         super(Vapp, self).__init__(**kwargs)
         self.org = self.get_org()
-        vdc_resource = self.org.get_vdc(self.params.get('vdc'))
-        self.vdc = VDC(self.client, href=vdc_resource.get('href'))
+        vdc_href = self.resolver.get_vdc_href(
+            self.org.href, self.params.get('vdc'))
+        self.vdc = VDC(self.client, href=vdc_href)
 
     def manage_states(self):
         state = self.params.get('state')
@@ -295,9 +345,13 @@ class Vapp(VcdAnsibleModule):
 
         return Org(self.client, resource=org_resource)
 
+    def get_vapp_href(self):
+        return self.resolver.get_vapp_href(
+            self.vdc.href, self.params.get('vapp_name'))
+
     def get_vapp(self):
         vapp_name = self.params.get('vapp_name')
-        vapp_resource = self.vdc.get_vapp(vapp_name)
+        vapp_resource = self.client.get_resource(self.get_vapp_href())
 
         return VApp(self.client, name=vapp_name, resource=vapp_resource)
 
@@ -327,7 +381,7 @@ class Vapp(VcdAnsibleModule):
         response['changed'] = False
 
         try:
-            self.vdc.get_vapp(vapp_name)
+            self.get_vapp_href()
         except EntityNotFoundException:
             create_vapp_task = self.vdc.instantiate_vapp(
                 name=vapp_name,
@@ -377,7 +431,7 @@ class Vapp(VcdAnsibleModule):
         response['changed'] = False
 
         try:
-            self.vdc.get_vapp(vapp_name)
+            self.get_vapp_href()
         except EntityNotFoundException:
             create_vapp_task = self.vdc.create_vapp(
                 name=vapp_name,
@@ -402,12 +456,12 @@ class Vapp(VcdAnsibleModule):
         response['changed'] = False
 
         try:
-            self.vdc.get_vapp(vapp_name)
+            vapp_href = self.get_vapp_href()
         except EntityNotFoundException:
             response['warnings'] = "Vapp {} is not present.".format(vapp_name)
         else:
-            delete_vapp_task = self.vdc.delete_vapp(
-                name=vapp_name, force=force)
+            delete_vapp_task = self.client.delete_resource(
+                vapp_href, force=force)
             self.execute_task(delete_vapp_task)
             response['msg'] = 'Vapp {} has been deleted.'.format(vapp_name)
             response['changed'] = True
@@ -456,20 +510,21 @@ class Vapp(VcdAnsibleModule):
         response['msg'] = list()
         response['changed'] = False
 
+        vm_details = self.params.get('vm_details')
         try:
+            # every vm (with its nics and hardware) is part of the vApp
+            # document, which is read once
             vapp = self.get_vapp()
             for vm in vapp.get_all_vms():
-                try:
-                    ip = vapp.get_primary_ip(vm.get('name'))
-                except Exception:
-                    ip = None
-                finally:
-                    response['msg'].append({
-                        "name": vm.get('name'),
-                        "status": VM_STATUSES[vm.get('status')],
-                        "deployed": vm.get('deployed') == 'true',
-                        "ip_address": ip
-                    })
+                vm_response = {
+                    "name": vm.get('name'),
+                    "status": VM_STATUSES[vm.get('status')],
+                    "deployed": vm.get('deployed') == 'true',
+                    "ip_address": get_vm_primary_ip(vm)
+                }
+                if vm_details:
+                    vm_response.update(get_vm_details(vm))
+                response['msg'].append(vm_response)
         except EntityNotFoundException as ex:
             response['warnings'] = str(ex)
 
@@ -574,9 +629,13 @@ class Vapp(VcdAnsibleModule):
 
         try:
             vapp = self.get_vapp()
-            for key in metadata:
+            # vCD locks the vApp during each metadata task, so every key is
+            # removed once the previous removal is done
+            keys = list(metadata)
+            for index, key in enumerate(keys):
                 remove_meta_task = vapp.remove_metadata(key, domain=domain)
-                self.execute_task(remove_meta_task)
+                self.execute_task(remove_meta_task,
+                                  wait=index < len(keys) - 1)
             msg = "Metadata {0} have been removed from vApp {1}"
             response["msg"] = msg.format(list(metadata.keys()), vapp_name)
         except EntityNotFoundException as ex:
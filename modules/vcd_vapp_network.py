@@ -132,12 +132,9 @@ msg: success/failure message corresponding to vapp network state
 changed: true if resource has been changed else false
 '''
 
-from pyvcloud.vcd.org import Org
-from pyvcloud.vcd.vdc import VDC
 from pyvcloud.vcd.vapp import VApp
 from collections import defaultdict
 from pyvcloud.vcd.client import NSMAP
-from pyvcloud.vcd.client import EntityType
 from ansible.module_utils.vcd import VcdAnsibleModule
 from pyvcloud.vcd.exceptions import EntityNotFoundException
 from pyvcloud.vcd.exceptions import OperationNotSupportedException
@@ -169,7 +166,6 @@ def vapp_network_argument_spec():
 class VappNetwork(VcdAnsibleModule):
     def __init__(self, **kwargs):
         super(VappNetwork, self).__init__(**kwargs)
-        self.org = self.get_org()
         vapp_resource = self.get_resource()
         self.vapp = VApp(self.client, resource=vapp_resource)
 
@@ -189,23 +185,10 @@ class VappNetwork(VcdAnsibleModule):
         if operation == "read":
             return self.get_all_networks()
 
-    def get_org(self):
-        org_name = self.params.get('org_name')
-        org_resource = self.client.get_org()
-        if org_name:
-            org_resource = self.client.get_org_by_name(org_name)
-
-        return Org(self.client, resource=org_resource)
-
     def get_resource(self):
-        vapp = self.params.get('vapp')
-        vdc = self.params.get('vdc')
-        vdc_resource = VDC(self.client, resource=self.org.get_vdc(vdc))
-        vapp_resource_href = vdc_resource.get_resource_href(
-            name=vapp, entity_type=EntityType.VAPP)
-        vapp_resource = self.client.get_resource(vapp_resource_href)
-
-        return vapp_resource
+        return self.get_cached_vapp_resource(self.params.get('org_name'),
+                                             self.params.get('vdc'),
+                                             self.params.get('vapp'))
 
     def get_network(self):
         network_name = self.params.get('network')
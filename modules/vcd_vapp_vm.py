@@ -51,7 +51,19 @@ options:
     target_vm_name:
         description:
             - target VM name
-        required: true
+            - required unless vms is given
+        required: false
+    vms:
+        description:
+            - list of VMs to create in one recompose of the target vApp
+            - each item takes target_vm_name and optionally any of
+              source_vdc, source_vapp, source_vm_name, source_catalog_name,
+              source_template_name, hostname, vmpassword, vmpassword_auto,
+              vmpassword_reset, cust_script, network, storage_profile and
+              ip_allocation_mode, which default to the module level values
+            - only used with state present
+        required: false
+        type: list
     target_vapp:
         description:
             - target vApp name
@@ -187,6 +199,21 @@ EXAMPLES = '''
     state = "present"
     all_eulas_accepted = "true"
     properties = {"hostname": "vm_name"}
+
+- name: create a tier of VMs in one recompose
+  vcd_vapp_vm:
+    target_vapp: "vapp1"
+    target_vdc: "vdc1"
+    source_catalog_name: "catalog1"
+    source_template_name: "centos7"
+    source_vm_name: "CentOS7"
+    network: "MGMT"
+    vms:
+      - target_vm_name: "web1"
+        hostname: "web1"
+      - target_vm_name: "web2"
+        hostname: "web2"
+    state: "present"
 '''
 
 RETURN = '''
@@ -202,7 +229,6 @@ from pyvcloud.vcd.client import E
 from pyvcloud.vcd.vapp import VApp
 from pyvcloud.vcd.client import E_OVF
 from pyvcloud.vcd.client import NSMAP
-from pyvcloud.vcd.client import EntityType
 from pyvcloud.vcd.client import RelationType
 from pyvcloud.vcd.client import MetadataDomain
 from pyvcloud.vcd.client import MetadataValueType
@@ -218,11 +244,18 @@ VAPP_VM_SET_METADATA_VALUE_TYPE = ['String', 'Number', 'Boolean', 'DateTime']
 VAPP_VM_OPERATIONS = ['poweron', 'poweroff', 'reloadvm',
                       'deploy', 'undeploy', 'list_disks', 'list_nics',
                       'set_meta', 'get_meta', 'remove_meta']
+# module params an item of vms can override
+VAPP_VM_SPEC_PARAMS = ['target_vm_name', 'source_vdc', 'source_vapp',
+                       'source_vm_name', 'source_catalog_name',
+                       'source_template_name', 'hostname', 'vmpassword',
+                       'vmpassword_auto', 'vmpassword_reset', 'cust_script',
+                       'network', 'storage_profile', 'ip_allocation_mode']
 
 
 def vapp_vm_argument_spec():
     return dict(
-        target_vm_name=dict(type='str', required=True),
+        target_vm_name=dict(type='str', required=False),
+        vms=dict(type='list', required=False),
         target_vapp=dict(type='str', required=True),
         target_vdc=dict(type='str', required=True),
         source_vdc=dict(type='str', required=False),
@@ -263,7 +296,7 @@ def vapp_vm_argument_spec():
 class VappVM(VcdAnsibleModule):
     def __init__(self, **kwargs):
         super(VappVM, self).__init__(**kwargs)
-        self.org = self.get_org()
+        self.org = None
         vapp_resource = self.get_target_resource()
         self.vapp = VApp(self.client, resource=vapp_resource)
 
@@ -311,74 +344,99 @@ class VappVM(VcdAnsibleModule):
             return self.remove_meta()
 
     def get_org(self):
-        org_name = self.params.get('org_name')
-        org_resource = self.client.get_org()
-        if org_name:
-            org_resource = self.client.get_org_by_name(org_name)
-
-        return Org(self.client, resource=org_resource)
-
-    def get_source_resource(self):
-        source_catalog_name = self.params.get('source_catalog_name')
-        source_template_name = self.params.get('source_template_name')
-        source_vdc = self.params.get('source_vdc')
-        source_vapp = self.params.get('source_vapp')
+        if self.org is None:
+            org_name = self.params.get('org_name')
+            org_resource = self.client.get_org()
+            if org_name:
+                org_resource = self.client.get_org_by_name(org_name)
+            self.org = Org(self.client, resource=org_resource)
+
+        return self.org
+
+    def get_source_resource(self, params=None):
+        params = params or self.params
+        source_catalog_name = params.get('source_catalog_name')
+        source_template_name = params.get('source_template_name')
+        source_vdc = params.get('source_vdc')
+        source_vapp = params.get('source_vapp')
         source_vapp_resource = None
 
         if source_vapp:
-            source_vdc_resource = VDC(
-                self.client, resource=self.org.get_vdc(source_vdc))
-            source_vapp_resource_href = source_vdc_resource.get_resource_href(
-                name=source_vapp, entity_type=EntityType.VAPP)
+            source_vdc_href = self.resolver.get_vdc_href(
+                self.get_org().href, source_vdc)
+            source_vapp_resource_href = self.resolver.get_vapp_href(
+                source_vdc_href, source_vapp)
             source_vapp_resource = self.client.get_resource(
                 source_vapp_resource_href)
 
         if source_catalog_name:
-            catalog_item = self.org.get_catalog_item(
-                source_catalog_name, source_template_name)
+            source_catalog_href = self.resolver.get_catalog_href(
+                self.get_org().resource.get('name'), source_catalog_name)
+            catalog_item = self.client.get_resource(
+                self.resolver.get_catalog_item_href(
+                    source_catalog_href, source_template_name))
             source_vapp_resource = self.client.get_resource(
                 catalog_item.Entity.get('href'))
 
         return source_vapp_resource
 
     def get_target_resource(self):
-        target_vapp = self.params.get('target_vapp')
-        target_vdc = self.params.get('target_vdc')
-        target_vapp_resource = None
-
-        target_vdc_resource = VDC(
-            self.client, resource=self.org.get_vdc(target_vdc))
-        target_vapp_resource = target_vdc_resource.get_vapp(target_vapp)
-
-        return target_vapp_resource
+        return self.get_cached_vapp_resource(self.params.get('org_name'),
+                                             self.params.get('target_vdc'),
+                                             self.params.get('target_vapp'))
 
     def get_storage_profile(self, profile_name):
         target_vdc = self.params.get('target_vdc')
-        vdc_resource = VDC(
-            self.client, resource=self.org.get_vdc(target_vdc))
+        vdc_resource = VDC(self.client, href=self.resolver.get_vdc_href(
+            self.get_org().href, target_vdc))
 
         return vdc_resource.get_storage_profile(profile_name)
 
     def get_vm(self):
-        vapp_vm_resource = self.vapp.get_vm(self.params.get('target_vm_name'))
+        target_vm_name = self.params.get('target_vm_name')
+        if not target_vm_name:
+            raise Exception('target_vm_name is required')
+
+        vapp_vm_resource = self.vapp.get_vm(target_vm_name)
 
         return VM(self.client, resource=vapp_vm_resource)
 
+    def get_vm_spec(self, params, source_vapp_resource, storage_profile=None):
+        spec = {
+            'source_vm_name': params.get('source_vm_name'),
+            'vapp': source_vapp_resource,
+            'target_vm_name': params.get('target_vm_name'),
+            'hostname': params.get('hostname'),
+            'password': params.get('vmpassword'),
+            'password_auto': params.get('vmpassword_auto'),
+            'password_reset': params.get('vmpassword_reset'),
+            'ip_allocation_mode': params.get('ip_allocation_mode'),
+            'network': params.get('network'),
+            'cust_script': params.get('cust_script')
+        }
+
+        spec = {k: v for k, v in spec.items() if v}
+        if storage_profile is not None:
+            spec['storage_profile'] = storage_profile
+
+        return spec
+
+    def add_vms_to_vapp(self, specs):
+        args = {
+            "specs": specs,
+            "deploy": self.params.get('deploy'),
+            "power_on": self.params.get('power_on'),
+            "all_eulas_accepted": self.params.get('all_eulas_accepted')
+        }
+        add_vms_task = self.vapp.add_vms(**args)
+        self.execute_task(add_vms_task)
+
     def add_vm(self):
+        if self.params.get('vms'):
+            return self.add_vms()
+
         params = self.params
-        source_vapp_resource = self.get_source_resource()
         target_vm_name = params.get('target_vm_name')
-        source_vm_name = params.get('source_vm_name')
-        hostname = params.get('hostname')
-        vmpassword = params.get('vmpassword')
-        vmpassword_auto = params.get('vmpassword_auto')
-        vmpassword_reset = params.get('vmpassword_reset')
-        network = params.get('network')
-        all_eulas_accepted = params.get('all_eulas_accepted')
-        power_on = params.get('power_on')
-        deploy = params.get('deploy')
-        ip_allocation_mode = params.get('ip_allocation_mode')
-        cust_script = params.get('cust_script')
         storage_profile = params.get('storage_profile')
         response = dict()
         response['changed'] = False
@@ -386,31 +444,11 @@ class VappVM(VcdAnsibleModule):
         try:
             self.get_vm()
         except EntityNotFoundException:
-            spec = {
-                'source_vm_name': source_vm_name,
-                'vapp': source_vapp_resource,
-                'target_vm_name': target_vm_name,
-                'hostname': hostname,
-                'password': vmpassword,
-                'password_auto': vmpassword_auto,
-                'password_reset': vmpassword_reset,
-                'ip_allocation_mode': ip_allocation_mode,
-                'network': network,
-                'cust_script': cust_script
-            }
-
-            spec = {k: v for k, v in spec.items() if v}
             if storage_profile:
-                spec['storage_profile'] = self.get_storage_profile(storage_profile)
-            specs = [spec]
-            args = {
-                "specs": specs,
-                "deploy": deploy,
-                "power_on": power_on,
-                "all_eulas_accepted": all_eulas_accepted
-            }
-            add_vms_task = self.vapp.add_vms(**args)
-            self.execute_task(add_vms_task)
+                storage_profile = self.get_storage_profile(storage_profile)
+            spec = self.get_vm_spec(params, self.get_source_resource(),
+                                    storage_profile or None)
+            self.add_vms_to_vapp([spec])
             response['msg'] = 'VM {} has been created.'.format(target_vm_name)
             response['changed'] = True
         else:
@@ -419,6 +457,62 @@ class VappVM(VcdAnsibleModule):
 
         return response
 
+    def add_vms(self):
+        '''
+            Create the missing VMs of the vms list with a single recompose
+            of the target vApp. Every source vApp/template and storage
+            profile is looked up once however many VMs use it.
+        '''
+        response = dict()
+        response['changed'] = False
+
+        present_vms = set([vm.get('name') for vm in self.vapp.get_all_vms()])
+        existing_vms = list()
+        missing_vms = list()
+        for vm in self.params.get('vms'):
+            params = dict([(key, vm.get(key, self.params.get(key)))
+                           for key in VAPP_VM_SPEC_PARAMS])
+            target_vm_name = params.get('target_vm_name')
+            if not target_vm_name:
+                raise Exception('target_vm_name is required for every VM')
+
+            if target_vm_name in present_vms:
+                existing_vms.append(target_vm_name)
+            else:
+                missing_vms.append(params)
+                present_vms.add(target_vm_name)
+
+        sources = dict()
+        storage_profiles = dict()
+        specs = list()
+        for params in missing_vms:
+            source_key = tuple([params.get(key) for key in (
+                'source_vdc', 'source_vapp', 'source_catalog_name',
+                'source_template_name')])
+            if source_key not in sources:
+                sources[source_key] = self.get_source_resource(params)
+
+            storage_profile = params.get('storage_profile')
+            if storage_profile and storage_profile not in storage_profiles:
+                storage_profiles[storage_profile] = self.get_storage_profile(
+                    storage_profile)
+
+            specs.append(self.get_vm_spec(
+                params, sources[source_key],
+                storage_profiles.get(storage_profile)))
+
+        if specs:
+            self.add_vms_to_vapp(specs)
+            response['msg'] = 'VMs {} have been created.'.format(
+                [spec.get('target_vm_name') for spec in specs])
+            response['changed'] = True
+
+        if existing_vms:
+            msg = 'VMs {} are already present.'
+            response['warnings'] = msg.format(existing_vms)
+
+        return response
+
     def delete_vm(self):
         vm_name = self.params.get('target_vm_name')
         response = dict()
@@ -430,7 +524,8 @@ class VappVM(VcdAnsibleModule):
             response['warnings'] = 'VM {} is not present.'.format(vm_name)
         else:
             if not vm.is_powered_off():
-                self.undeploy_vm()
+                # the VM has to be undeployed before it can be deleted
+                self.undeploy_vm(wait=True)
             delete_vms_task = self.vapp.delete_vms([vm_name])
             self.execute_task(delete_vms_task)
             response['msg'] = 'VM {} has been deleted.'.format(vm_name)
@@ -443,46 +538,50 @@ class VappVM(VcdAnsibleModule):
         response = dict()
         response['changed'] = False
 
+        updates = list()
         if self.params.get("virtual_cpus"):
-            self.update_vm_cpu()
-            response['changed'] = True
+            updates.append(self.update_vm_cpu)
 
         if self.params.get("memory"):
-            self.update_vm_memory()
-            response['changed'] = True
+            updates.append(self.update_vm_memory)
 
         if self.params.get('compute_policy_href'):
-            self.update_vm_compute_policy()
+            updates.append(self.update_vm_compute_policy)
+
+        # each update reconfigures the VM, only the last one may be left
+        # running with async_task
+        for index, update in enumerate(updates):
+            update(wait=index < len(updates) - 1)
             response['changed'] = True
 
         response['msg'] = 'VM {} has been updated.'.format(vm_name)
 
         return response
 
-    def update_vm_cpu(self):
+    def update_vm_cpu(self, wait=False):
         virtual_cpus = self.params.get('virtual_cpus')
         cores_per_socket = self.params.get('cores_per_socket')
 
         vm = self.get_vm()
         update_cpu_task = vm.modify_cpu(virtual_cpus, cores_per_socket)
 
-        return self.execute_task(update_cpu_task)
+        return self.execute_task(update_cpu_task, wait=wait)
 
-    def update_vm_memory(self):
+    def update_vm_memory(self, wait=False):
         memory = self.params.get('memory')
 
         vm = self.get_vm()
         update_memory_task = vm.modify_memory(memory)
 
-        return self.execute_task(update_memory_task)
+        return self.execute_task(update_memory_task, wait=wait)
 
-    def update_vm_compute_policy(self):
+    def update_vm_compute_policy(self, wait=False):
         compute_policy_href = self.params.get('compute_policy_href')
 
         vm = self.get_vm()
         update_compute_policy_task = vm.update_compute_policy(compute_policy_href)
 
-        return self.execute_task(update_compute_policy_task)
+        return self.execute_task(update_compute_policy_task, wait=wait)
 
     def power_on_vm(self):
         vm_name = self.params.get('target_vm_name')
@@ -545,7 +644,7 @@ class VappVM(VcdAnsibleModule):
 
         return response
 
-    def undeploy_vm(self):
+    def undeploy_vm(self, wait=False):
         vm_name = self.params.get('target_vm_name')
         response = dict()
         response['changed'] = False
@@ -553,7 +652,7 @@ class VappVM(VcdAnsibleModule):
         vm = self.get_vm()
         if not vm.is_deployed():
             undeploy_vm_task = vm.undeploy(action="powerOff")
-            self.execute_task(undeploy_vm_task)
+            self.execute_task(undeploy_vm_task, wait=wait)
             msg = 'VM {} has been undeployed'
             response['msg'] = msg.format(vm_name)
             response['changed'] = True
@@ -627,9 +726,10 @@ class VappVM(VcdAnsibleModule):
         metadata = self.params.get('metadata')
         domain = MetadataDomain(domain)
         response['msg'] = list()
-        for key in metadata:
+        keys = list(metadata)
+        for index, key in enumerate(keys):
             remove_meta_task = vm.remove_metadata(key, domain=domain)
-            self.execute_task(remove_meta_task)
+            self.execute_task(remove_meta_task, wait=index < len(keys) - 1)
         msg = "Metadata {0} have been removed from vm {1}"
         response["msg"] = msg.format(list(metadata.keys()), vm_name)
 
@@ -51,6 +51,8 @@ options:
     disks:
         description:
             - List of Disk with its size, and attached controller
+            - the disks to update or delete are matched by instance_id
+              when given, by name otherwise
         required: false
     vm_name:
         description:
@@ -103,9 +105,8 @@ changed: true if resource has been changed else false
 '''
 
 import math
+from copy import deepcopy
 from pyvcloud.vcd.vm import VM
-from pyvcloud.vcd.org import Org
-from pyvcloud.vcd.vdc import VDC
 from pyvcloud.vcd.vapp import VApp
 from pyvcloud.vcd.client import NSMAP
 from pyvcloud.vcd.client import EntityType
@@ -115,6 +116,9 @@ from pyvcloud.vcd.exceptions import EntityNotFoundException
 
 VAPP_VM_DISK_STATES = ['present', 'absent', 'update']
 VAPP_VM_DISK_OPERATIONS = ['read']
+SCSI_CONTROLLER_BUS_TYPE = 6
+# supported disk controllers to add, at their default address
+SCSI_DISK_CONTROLLERS = ["VirtualSCSI", "lsilogic", "lsilogicsas", "buslogic"]
 
 
 def vapp_vm_disk_argument_spec():
@@ -132,7 +136,6 @@ def vapp_vm_disk_argument_spec():
 class VappVMDisk(VcdAnsibleModule):
     def __init__(self, **kwargs):
         super(VappVMDisk, self).__init__(**kwargs)
-        self.org = self.get_org()
         vapp_resource = self.get_resource()
         self.vapp = VApp(self.client, resource=vapp_resource)
 
@@ -153,23 +156,10 @@ class VappVMDisk(VcdAnsibleModule):
         if operation == "read":
             return self.read_disks()
 
-    def get_org(self):
-        org_name = self.params.get('org_name')
-        org_resource = self.client.get_org()
-        if org_name:
-            org_resource = self.client.get_org_by_name(org_name)
-
-        return Org(self.client, resource=org_resource)
-
     def get_resource(self):
-        vapp = self.params.get('vapp')
-        vdc = self.params.get('vdc')
-        vdc_resource = VDC(self.client, resource=self.org.get_vdc(vdc))
-        vapp_resource_href = vdc_resource.get_resource_href(
-            name=vapp, entity_type=EntityType.VAPP)
-        vapp_resource = self.client.get_resource(vapp_resource_href)
-
-        return vapp_resource
+        return self.get_cached_vapp_resource(self.params.get('org_name'),
+                                             self.params.get('vdc'),
+                                             self.params.get('vapp'))
 
     def get_vm(self):
         vapp_vm_resource = self.vapp.get_vm(self.params.get('vm_name'))
@@ -191,18 +181,98 @@ class VappVMDisk(VcdAnsibleModule):
 
         return str(round(disk_size / pow_value, 1)) + size_metric
 
+    def get_disks(self):
+        vm = self.get_vm()
+
+        return self.client.get_resource(
+            vm.resource.get('href') + '/virtualHardwareSection/disks')
+
+    def add_disk_items(self, disks, new_disks):
+        '''
+            Append the RASD items of new_disks ((size in MB, controller)
+            pairs) to the disks section of the VM, the same way pyvcloud's
+            VApp.add_disk_to_vm does for a single disk, so that all of them
+            are added with a single PUT.
+        '''
+        rasd = '{' + NSMAP['rasd'] + '}'
+        disk_index = 0
+        last_disk = None
+        scsi_disk_controllers = list(SCSI_DISK_CONTROLLERS)
+        present_controllers = set()
+        for disk in disks.Item:
+            element_name = str(disk[rasd + 'ElementName'])
+            # recording last disk to update as a new disk
+            if disk[rasd + 'Description'] == 'Hard disk':
+                last_disk = disk
+                disk_index += 1
+
+            # updating default disk controller's address with existing
+            # disk controller's address if any
+            if "SCSI Controller" in element_name:
+                addr = int(disk[rasd + 'Address'])
+                bus_type = disk[rasd + 'ResourceSubType']
+                expected_addr = scsi_disk_controllers.index(bus_type)
+                scsi_disk_controllers[addr], scsi_disk_controllers[
+                    expected_addr] = scsi_disk_controllers[expected_addr], \
+                    scsi_disk_controllers[addr]
+
+            if int(disk[rasd + 'ResourceType']) == SCSI_CONTROLLER_BUS_TYPE:
+                present_controllers.add(str(disk[rasd + 'ResourceSubType']))
+
+        if last_disk is None:
+            msg = 'VM {0} has no hard disk to add disks after'
+            raise EntityNotFoundException(msg.format(
+                self.params.get('vm_name')))
+
+        for disk_size, disk_controller in new_disks:
+            new_disk = deepcopy(last_disk)
+            instance_id = int(str(last_disk[rasd + 'InstanceID'])) + 1
+            address = int(str(last_disk[rasd + 'AddressOnParent'])) + 1
+
+            if disk_controller not in present_controllers:
+                # create a new SCSI controller
+                address = scsi_disk_controllers.index(disk_controller)
+                new_disk_controller = deepcopy(last_disk)
+                new_disk_controller[
+                    rasd + 'ResourceType'] = SCSI_CONTROLLER_BUS_TYPE
+                new_disk_controller[rasd + 'ResourceSubType'] = disk_controller
+                new_disk_controller[rasd + 'Address'] = address
+                new_disk[rasd + 'Parent'] = new_disk_controller[
+                    rasd + 'InstanceID']
+                disks.append(new_disk_controller)
+                present_controllers.add(disk_controller)
+
+            new_disk[rasd + 'AddressOnParent'] = address
+            new_disk[rasd + 'ElementName'] = 'Hard disk %s' % disk_index
+            new_disk[rasd + 'InstanceID'] = instance_id
+            new_disk[rasd + 'VirtualQuantity'] = disk_size * 1024 * 1024
+            host_resource = new_disk[rasd + 'HostResource']
+            host_resource.set('{' + NSMAP['vcloud'] + '}capacity',
+                              str(disk_size))
+            host_resource.set('{' + NSMAP['vcloud'] + '}busSubType',
+                              disk_controller)
+            host_resource.set('{' + NSMAP['vcloud'] + '}busType',
+                              str(SCSI_CONTROLLER_BUS_TYPE))
+            disks.append(new_disk)
+            last_disk = new_disk
+            disk_index += 1
+
+        return disks
+
     def add_disk(self):
         disks = self.params.get('disks')
         vm_name = self.params.get('vm_name')
         response = dict()
         response['msg'] = list()
         response['changed'] = False
-        available_disks = self.read_disks().get("disks").keys()
+        vm_disks = self.get_disks()
+        available_disks = self.read_disks(vm_disks).get("disks").keys()
         warnings = list()
+        new_disks = list()
 
         for disk in disks:
             disk_size = int(disk.get("size"))
-            disk_controller = disk.get("controller")
+            disk_controller = disk.get("controller") or 'lsilogic'
             disk_name = disk.get("name")
             '''
             here the condition covers both the situtation
@@ -212,15 +282,22 @@ class VappVMDisk(VcdAnsibleModule):
             add a new disk any way.
             '''
             if disk_name not in available_disks:
-                add_disk_task = self.vapp.add_disk_to_vm(
-                    vm_name, disk_size, disk_controller)
-                self.execute_task(add_disk_task)
+                new_disks.append((disk_size, disk_controller))
                 msg = "A disk with size {0} and controller {1} has been added to VM {2}"
                 msg = msg.format(disk_size, disk_controller, vm_name)
-                response['changed'] = True
                 response['msg'].append(msg)
             else:
                 warnings.append(disk_name)
+
+        if new_disks:
+            # every new disk is added with one reconfiguration of the VM
+            add_disk_task = self.client.put_resource(
+                self.get_vm().resource.get('href') +
+                '/virtualHardwareSection/disks',
+                self.add_disk_items(vm_disks, new_disks),
+                EntityType.RASD_ITEMS_LIST.value)
+            self.execute_task(add_disk_task)
+            response['changed'] = True
         if warnings:
             warnings = ','.join(warnings)
             msg = "Hard disk(s) with name '{0}' are already present"
@@ -228,13 +305,12 @@ class VappVMDisk(VcdAnsibleModule):
 
         return response
 
-    def read_disks(self):
-        vm = self.get_vm()
+    def read_disks(self, disks=None):
         response = dict()
         response['changed'] = False
         response['disks'] = dict()
-        disks = self.client.get_resource(
-            vm.resource.get('href') + '/virtualHardwareSection/disks')
+        if disks is None:
+            disks = self.get_disks()
 
         for disk in disks.Item:
             if disk['{' + NSMAP['rasd'] + '}Description'] == "Hard disk":
@@ -252,65 +328,126 @@ class VappVMDisk(VcdAnsibleModule):
 
         return response
 
+    def get_disk_index(self, disks):
+        '''
+            Index the hard disks of the disks section by key type, one
+            index by ElementName and another one by InstanceID.
+        '''
+        rasd = '{' + NSMAP['rasd'] + '}'
+        disk_index = dict(name=dict(), instance_id=dict())
+        for disk in disks.Item:
+            if disk[rasd + 'Description'] != "Hard disk":
+                continue
+            disk_index['name'].setdefault(str(disk[rasd + 'ElementName']),
+                                          disk)
+            disk_index['instance_id'].setdefault(
+                str(disk[rasd + 'InstanceID']), disk)
+
+        return disk_index
+
+    def get_disk_key(self, disk):
+        '''
+            Returns the (key type, key) a disk of the params is looked up
+            with, its instance_id when given else its name.
+        '''
+        if isinstance(disk, dict):
+            instance_id = disk.get("instance_id")
+            if instance_id is not None:
+                return 'instance_id', str(instance_id)
+
+            return 'name', disk.get("name")
+
+        return 'name', disk
+
+    def get_disk_label(self, key_type, disk_key):
+        return '{0} {1}'.format(key_type.replace('_', ' '), disk_key)
+
+    def set_disk_size(self, disk, disk_size):
+        '''
+            Resize the hard disk item to disk_size MB, returns whether its
+            size differed.
+        '''
+        rasd = '{' + NSMAP['rasd'] + '}'
+        capacity = '{' + NSMAP['vcloud'] + '}capacity'
+        host_resource = disk[rasd + 'HostResource']
+        if host_resource.get(capacity) == str(disk_size):
+            return False
+
+        disk[rasd + 'VirtualQuantity'] = disk_size * 1024 * 1024
+        host_resource.set(capacity, str(disk_size))
+
+        return True
+
     def update_disk(self):
         disks = self.params.get('disks')
         response = dict()
         response['changed'] = False
         response['msg'] = list()
-        vm = self.get_vm()
+        warnings = list()
 
-        vm_disks = self.client.get_resource(
-            vm.resource.get('href') + '/virtualHardwareSection/disks')
-        disk_names = [disk.get("name") for disk in disks]
-        disk_sizes = [disk.get("size", None) for disk in disks]
-        disk_sizes = list(filter(lambda size: size is not None, disk_sizes))
-        assert len(disk_sizes) == len(disk_names)
-
-        for index, disk_name in enumerate(disk_names):
-            for vm_disk_index, disk in enumerate(vm_disks.Item):
-                disk_size = int(disk_sizes[index])
-                if disk['{' + NSMAP['rasd'] + '}ElementName'] == disk_name:
-                    disk[
-                        '{' + NSMAP['rasd'] + '}VirtualQuantity'] = disk_size
-                    disk[
-                        '{' + NSMAP['rasd'] + '}HostResource'].set(
-                        '{' + NSMAP['vcloud'] + '}capacity', str(disk_size))
-                vm_disks.Item[vm_disk_index] = disk
-
-        update_disk_task = self.client.put_resource(
-            vm.resource.get('href') + '/virtualHardwareSection/disks',
-            vm_disks, EntityType.RASD_ITEMS_LIST.value)
-        self.execute_task(update_disk_task)
-        msg = 'Vapp VM disk with name {0} has been updated.'
-        response['msg'].append(msg.format(disk_name))
-        response['changed'] = True
+        vm_disks = self.get_disks()
+        disk_index = self.get_disk_index(vm_disks)
+        for disk in disks:
+            key_type, disk_key = self.get_disk_key(disk)
+            disk_label = self.get_disk_label(key_type, disk_key)
+            if disk.get("size") is None:
+                msg = 'size of the VM disk with {0} is required to update it'
+                raise Exception(msg.format(disk_label))
+
+            vm_disk = disk_index[key_type].get(disk_key)
+            if vm_disk is None:
+                warnings.append(disk_label)
+                continue
+
+            if self.set_disk_size(vm_disk, int(disk.get("size"))):
+                msg = 'Vapp VM disk with {0} has been updated.'
+                response['msg'].append(msg.format(disk_label))
+                response['changed'] = True
+
+        # the disks already of the requested size leave the VM untouched
+        if response['changed']:
+            update_disk_task = self.client.put_resource(
+                self.get_vm().resource.get('href') +
+                '/virtualHardwareSection/disks',
+                vm_disks, EntityType.RASD_ITEMS_LIST.value)
+            self.execute_task(update_disk_task)
+        else:
+            response['msg'] = 'VM disk(s) are already of the requested size.'
+        if warnings:
+            msg = "Hard disk(s) with {0} are not present"
+            response["warnings"] = msg.format(', '.join(warnings))
 
         return response
 
     def delete_disk(self):
-        vm = self.get_vm()
         disks = self.params.get('disks')
-        disks_to_remove = [disk.get("name") for disk in disks]
         response = dict()
         response['changed'] = False
 
-        disks = self.client.get_resource(vm.resource.get(
-            'href') + '/virtualHardwareSection/disks')
-
-        for disk in disks.Item:
-            if disk['{' + NSMAP['rasd'] + '}ElementName'] in disks_to_remove:
-                disks.remove(disk)
-                disks_to_remove.remove(
-                    disk['{' + NSMAP['rasd'] + '}ElementName'])
-
-        if len(disks_to_remove) > 0:
-            error = 'VM disk(s) with name {0} was not found.'
-            error = error.format(','.join(disks_to_remove))
+        vm_disks = self.get_disks()
+        disk_index = self.get_disk_index(vm_disks)
+        disks_to_remove = [self.get_disk_key(disk) for disk in disks]
+        missing_disks = [self.get_disk_label(key_type, disk_key)
+                         for key_type, disk_key in disks_to_remove
+                         if disk_key not in disk_index[key_type]]
+        if missing_disks:
+            error = 'VM disk(s) with {0} was not found.'
+            error = error.format(', '.join(missing_disks))
             raise EntityNotFoundException(error)
 
+        # a disk given both by name and by instance id is removed once
+        removed_disks = list()
+        for key_type, disk_key in disks_to_remove:
+            disk = disk_index[key_type][disk_key]
+            if not any(disk is removed for removed in removed_disks):
+                removed_disks.append(disk)
+        for disk in removed_disks:
+            vm_disks.remove(disk)
+
         remove_disk_task = self.client.put_resource(
-            vm.resource.get('href') + '/virtualHardwareSection/disks',
-            disks, EntityType.RASD_ITEMS_LIST.value)
+            self.get_vm().resource.get('href') +
+            '/virtualHardwareSection/disks',
+            vm_disks, EntityType.RASD_ITEMS_LIST.value)
         self.execute_task(remove_disk_task)
         response['msg'] = 'VM disk(s) has been deleted.'
         response['changed'] = True
@@ -121,13 +121,15 @@ changed: true if resource has been changed else false
 '''
 
 from pyvcloud.vcd.vm import VM
-from pyvcloud.vcd.org import Org
-from pyvcloud.vcd.vdc import VDC
 from pyvcloud.vcd.vapp import VApp
+from pyvcloud.vcd.client import E
+from pyvcloud.vcd.client import NSMAP
 from pyvcloud.vcd.client import EntityType
+from pyvcloud.vcd.client import RelationType
+from pyvcloud.vcd.client import IpAddressMode
 from ansible.module_utils.vcd import VcdAnsibleModule
 from pyvcloud.vcd.exceptions import OperationNotSupportedException
-from pyvcloud.vcd.exceptions import EntityNotFoundException, InvalidParameterException
+from pyvcloud.vcd.exceptions import EntityNotFoundException
 
 
 VAPP_VM_NIC_OPERATIONS = ['read']
@@ -135,6 +137,8 @@ IP_ALLOCATION_MODE = ["DHCP", "POOL", "MANUAL"]
 VAPP_VM_NIC_STATES = ['present', 'absent', 'update']
 NETWORK_ADAPTER_TYPE = ['VMXNET', 'VMXNET2',
                         'VMXNET3', 'E1000', 'E1000E', 'PCNet32']
+# nic indices of a VM, as handled by pyvcloud
+MAX_NICS = 10
 
 
 def vapp_vm_nic_argument_spec():
@@ -158,7 +162,6 @@ def vapp_vm_nic_argument_spec():
 class VappVMNIC(VcdAnsibleModule):
     def __init__(self, **kwargs):
         super(VappVMNIC, self).__init__(**kwargs)
-        self.org = self.get_org()
         vapp_resource = self.get_resource()
         self.vapp = VApp(self.client, resource=vapp_resource)
 
@@ -178,23 +181,10 @@ class VappVMNIC(VcdAnsibleModule):
         if operation == "read":
             return self.read_nics()
 
-    def get_org(self):
-        org_name = self.params.get('org_name')
-        org_resource = self.client.get_org()
-        if org_name:
-            org_resource = self.client.get_org_by_name(org_name)
-
-        return Org(self.client, resource=org_resource)
-
     def get_resource(self):
-        vapp = self.params.get('vapp')
-        vdc = self.params.get('vdc')
-        vdc_resource = VDC(self.client, resource=self.org.get_vdc(vdc))
-        vapp_resource_href = vdc_resource.get_resource_href(
-            name=vapp, entity_type=EntityType.VAPP)
-        vapp_resource = self.client.get_resource(vapp_resource_href)
-
-        return vapp_resource
+        return self.get_cached_vapp_resource(self.params.get('org_name'),
+                                             self.params.get('vdc'),
+                                             self.params.get('vapp'))
 
     def get_vm(self):
         vapp_vm_resource = self.vapp.get_vm(self.params.get('vm_name'))
@@ -207,30 +197,90 @@ class VappVMNIC(VcdAnsibleModule):
         return self.client.get_resource(
             vm.resource.get('href') + '/networkConnectionSection')
 
+    def get_nic_index(self, nic_section):
+        '''
+            The NetworkConnection elements of the section by their
+            NetworkConnectionIndex.
+        '''
+        nic_index = dict()
+        if hasattr(nic_section, 'NetworkConnection'):
+            for nic in nic_section.NetworkConnection:
+                nic_index[int(nic.NetworkConnectionIndex.text)] = nic
+
+        return nic_index
+
+    def set_primary_nic(self, nic_section, nic_id):
+        primary_nic = E.PrimaryNetworkConnectionIndex(nic_id)
+        if hasattr(nic_section, 'PrimaryNetworkConnectionIndex'):
+            nic_section.replace(nic_section.PrimaryNetworkConnectionIndex,
+                                primary_nic)
+        else:
+            nic_section.insert(nic_section.index(
+                nic_section['{' + NSMAP['ovf'] + '}Info']) + 1, primary_nic)
+
+    def apply_nic_section(self, nic_section):
+        '''
+            Send every NIC change of the section with a single PUT, i.e. a
+            single reconfiguration task of the VM.
+        '''
+        update_nic_task = self.client.put_linked_resource(
+            nic_section, RelationType.EDIT,
+            EntityType.NETWORK_CONNECTION_SECTION.value, nic_section)
+        self.execute_task(update_nic_task)
+
+    def add_nic_element(self, nic_section, nic_index, nic):
+        '''
+            Append a NetworkConnection for nic at the first free index, the
+            same way pyvcloud's VM.add_nic does, returns its index.
+        '''
+        free_indices = [index for index in range(MAX_NICS)
+                        if index not in nic_index]
+        if not free_indices:
+            msg = 'VM can not have more than {0} nics'
+            raise OperationNotSupportedException(msg.format(MAX_NICS))
+
+        index = free_indices[0]
+        ip_address_mode = nic.get('ip_allocation_mode')
+        network_connection = E.NetworkConnection(network=nic.get('network'))
+        network_connection.set('needsCustomization', 'true')
+        network_connection.append(E.NetworkConnectionIndex(index))
+        if ip_address_mode == IpAddressMode.MANUAL.value:
+            network_connection.append(E.IpAddress(nic.get('ip_address')))
+        else:
+            network_connection.append(E.IpAddress())
+        network_connection.append(E.IsConnected(nic.get('is_connected')))
+        network_connection.append(E.IpAddressAllocationMode(ip_address_mode))
+        network_connection.append(E.NetworkAdapterType(nic.get('adapter_type')))
+
+        if nic_index:
+            insert_index = max([nic_section.index(connection)
+                                for connection in nic_index.values()]) + 1
+        elif hasattr(nic_section, 'PrimaryNetworkConnectionIndex'):
+            insert_index = nic_section.index(
+                nic_section.PrimaryNetworkConnectionIndex) + 1
+        else:
+            insert_index = nic_section.index(
+                nic_section['{' + NSMAP['ovf'] + '}Info']) + 1
+        nic_section.insert(insert_index, network_connection)
+        nic_index[index] = network_connection
+        if nic.get('is_primary'):
+            self.set_primary_nic(nic_section, index)
+
+        return index
+
     def add_nic(self):
-        vm = self.get_vm()
         vm_name = self.params.get('vm_name')
         nics = self.params.get('nics')
         response = dict()
         response['changed'] = False
         response['msg'] = list()
 
+        nic_section = self.get_vm_nics()
+        nic_index = self.get_nic_index(nic_section)
         for nic in nics:
+            nic_id = nic.get('nic_id')
             try:
-                network = nic.get('network')
-                nic_id = nic.get('nic_id')
-                ip_address = nic.get('ip_address')
-                ip_allocation_mode = nic.get('ip_allocation_mode')
-                adapter_type = nic.get('adapter_type')
-                is_primary = nic.get('is_primary')
-                is_connected = nic.get('is_connected')
-                add_nic_task = vm.add_nic(adapter_type=adapter_type,
-                                          is_primary=is_primary,
-                                          is_connected=is_connected,
-                                          network_name=network,
-                                          ip_address_mode=ip_allocation_mode,
-                                          ip_address=ip_address)
-                self.execute_task(add_nic_task)
+                self.add_nic_element(nic_section, nic_index, nic)
                 msg = 'Nic {0} has been added to VM {1}'
                 msg = msg.format(nic_id, vm_name)
                 response['changed'] = True
@@ -239,30 +289,50 @@ class VappVMNIC(VcdAnsibleModule):
                 msg = msg.format(nic_id, error.__str__())
             response['msg'].append(msg)
 
+        if response['changed']:
+            self.apply_nic_section(nic_section)
+
         return response
 
+    def update_nic_element(self, nic_section, nic_index, nic):
+        '''
+            Update the NetworkConnection of the nic_id of nic, which has to
+            be connected to its network as with pyvcloud's VM.update_nic.
+        '''
+        network = nic.get('network')
+        nic_id = nic.get('nic_id')
+        network_connection = nic_index.get(int(nic_id or 0))
+        if network_connection is None or \
+                network_connection.get('network') != network:
+            raise EntityNotFoundException(
+                'VM Network with name \'{0}\' not found.'.format(network))
+
+        if nic.get('ip_address') is not None:
+            network_connection.IpAddress = E.IpAddress(nic.get('ip_address'))
+        if nic.get('is_connected') is not None:
+            network_connection.IsConnected = E.IsConnected(
+                nic.get('is_connected'))
+        if nic.get('ip_allocation_mode') is not None:
+            network_connection.IpAddressAllocationMode = \
+                E.IpAddressAllocationMode(nic.get('ip_allocation_mode'))
+        if nic.get('adapter_type') is not None:
+            network_connection.NetworkAdapterType = E.NetworkAdapterType(
+                nic.get('adapter_type'))
+        if nic.get('is_primary'):
+            self.set_primary_nic(nic_section, int(nic_id or 0))
+
     def update_nic(self):
-        vm = self.get_vm()
         nics = self.params.get('nics')
         response = dict()
         response['changed'] = False
         response['msg'] = list()
 
+        nic_section = self.get_vm_nics()
+        nic_index = self.get_nic_index(nic_section)
         for nic in nics:
+            nic_id = nic.get('nic_id')
             try:
-                network = nic.get('network')
-                nic_id = nic.get('nic_id')
-                ip_address = nic.get('ip_address')
-                ip_allocation_mode = nic.get('ip_allocation_mode')
-                adapter_type = nic.get('adapter_type')
-                is_primary = nic.get('is_primary')
-                is_connected = nic.get('is_connected')
-                update_nic_task = vm.update_nic(
-                    network_name=network, nic_id=nic_id,
-                    is_connected=is_connected, is_primary=is_primary,
-                    adapter_type=adapter_type, ip_address=ip_address,
-                    ip_address_mode=ip_allocation_mode)
-                self.execute_task(update_nic_task)
+                self.update_nic_element(nic_section, nic_index, nic)
                 msg = 'Nic {0} has been updated'.format(nic_id)
                 response['changed'] = True
             except EntityNotFoundException as error:
@@ -270,6 +340,9 @@ class VappVMNIC(VcdAnsibleModule):
                 msg = msg.format(nic_id, error.__str__())
             response['msg'].append(msg)
 
+        if response['changed']:
+            self.apply_nic_section(nic_section)
+
         return response
 
     def read_nics(self):
@@ -293,18 +366,32 @@ class VappVMNIC(VcdAnsibleModule):
             msg = "VM {0} is powered on. Cant remove nics in the current state"
             raise OperationNotSupportedException(msg.format(vm_name))
 
+        nic_section = self.get_vm_nics()
+        nic_index = self.get_nic_index(nic_section)
         for nic in nics:
-            try:
-                nic_id = nic.get('nic_id')
-                delete_nic_task = vm.delete_nic(nic_id)
-                self.execute_task(delete_nic_task)
+            nic_id = nic.get('nic_id')
+            network_connection = None
+            if nic_id is not None:
+                network_connection = nic_index.pop(int(nic_id), None)
+            if network_connection is None:
+                error = 'Nic with index \'{0}\' is not found in the VM \'{1}\''
+                msg = 'Nic {0} throws following error: {1}'
+                msg = msg.format(nic_id, error.format(nic_id, vm_name))
+            else:
+                nic_section.remove(network_connection)
                 msg = 'VM nic {0} has been deleted'.format(nic_id)
                 response['changed'] = True
-            except (InvalidParameterException, EntityNotFoundException) as error:
-                msg = 'Nic {0} throws following error: {1}'
-                msg = msg.format(nic_id, error.__str__())
             response['msg'].append(msg)
 
+        if response['changed']:
+            # the primary nic moves to the first remaining nic once removed
+            if nic_index and (
+                    not hasattr(nic_section, 'PrimaryNetworkConnectionIndex') or
+                    int(nic_section.PrimaryNetworkConnectionIndex.text)
+                    not in nic_index):
+                self.set_primary_nic(nic_section, min(nic_index.keys()))
+            self.apply_nic_section(nic_section)
+
         return response
 
 
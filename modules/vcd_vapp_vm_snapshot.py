@@ -70,6 +70,12 @@ options:
         description:
             - operation of virtual machine snapshots (revert)
         required: false
+    workers:
+        description:
+            - Number of VM snapshot tasks submitted concurrently, the
+              tasks of all the VMs are then awaited together
+        required: false
+        default: 8
 author:
     - mtaneja@vmware.com
 '''
@@ -77,19 +83,24 @@ author:
 RETURN = '''
 msg: success/failure message corresponding to vapp vm snapshot state
 changed: true if resource has been changed else false
+results: status (and error) of the snapshot task of each VM
 '''
 
 import math
+from concurrent.futures import ThreadPoolExecutor
 from pyvcloud.vcd.vm import VM
-from pyvcloud.vcd.org import Org
-from pyvcloud.vcd.vdc import VDC
 from pyvcloud.vcd.vapp import VApp
+from pyvcloud.vcd.client import TaskStatus
 from ansible.module_utils.vcd import VcdAnsibleModule
+from pyvcloud.vcd.exceptions import EntityNotFoundException
 from pyvcloud.vcd.exceptions import OperationNotSupportedException
 
 
 VM_SNAPSHOT_OPERATIONS = ['revert', 'list']
 VM_SNAPSHOT_STATES = ['present', 'absent']
+VM_SNAPSHOT_WORKERS = 8
+# statuses of the snapshot tasks of the VMs which have been operated
+SNAPSHOT_TASK_STATUSES = [TaskStatus.SUCCESS.value, 'submitted']
 
 
 def vm_snapshot_argument_spec():
@@ -100,13 +111,16 @@ def vm_snapshot_argument_spec():
         org_name=dict(type='str', required=False, default=None),
         state=dict(choices=VM_SNAPSHOT_STATES, required=False),
         operation=dict(choices=VM_SNAPSHOT_OPERATIONS, required=False),
+        workers=dict(type='int', required=False,
+                     default=VM_SNAPSHOT_WORKERS),
     )
 
 
 class VMSnapShot(VcdAnsibleModule):
     def __init__(self, **kwargs):
         super(VMSnapShot, self).__init__(**kwargs)
-        self.org = self.get_org()
+        self.vapp = None
+        self.vm_resources = None
 
     def manage_states(self):
         state = self.params.get('state')
@@ -124,40 +138,112 @@ class VMSnapShot(VcdAnsibleModule):
         if operation == "list":
             return self.list_snapshots()
 
-    def get_org(self):
-        org_name = self.params.get('org_name')
-        org_resource = self.client.get_org()
-        if org_name:
-            org_resource = self.client.get_org_by_name(org_name)
+    def get_vapp(self):
+        '''
+            The vApp is resolved once, the VMs of every snapshot task are
+            then read from its document.
+        '''
+        if self.vapp is None:
+            vapp_resource = self.get_cached_vapp_resource(
+                self.params.get('org_name'), self.params.get('vdc_name'),
+                self.params.get('vapp_name'))
+            self.vapp = VApp(self.client, resource=vapp_resource)
 
-        return Org(self.client, resource=org_resource)
+        return self.vapp
+
+    def get_vm_resources(self):
+        '''
+            The VMs of the vApp document by name, each VM document holding
+            its SnapshotSection, so no VM is read on its own.
+        '''
+        if self.vm_resources is None:
+            self.vm_resources = dict([
+                (vm.get('name'), vm) for vm in self.get_vapp().get_all_vms()
+            ])
+
+        return self.vm_resources
+
+    def get_vm_resource(self, vm_name):
+        vm_resource = self.get_vm_resources().get(vm_name)
+        if vm_resource is None:
+            raise EntityNotFoundException(
+                'Can\'t find VM \'{0}\''.format(vm_name))
+
+        return vm_resource
 
     def get_vm(self, vm_name):
-        vapp_name = self.params.get('vapp_name')
-        vdc_name = self.params.get('vdc_name')
-        vdc_resource = VDC(
-            self.client, resource=self.org.get_vdc(vdc_name))
-        vapp_resource = vdc_resource.get_vapp(vapp_name)
-        vapp = VApp(self.client, resource=vapp_resource)
+        return VM(self.client, resource=self.get_vm_resource(vm_name))
+
+    def run_snapshot_tasks(self, submit_task):
+        '''
+            Submit the snapshot task of every VM of vms (submit_task(vm,
+            vm_params)) through a pool of at most workers threads, then
+            wait for all the tasks together.
+
+            Returns a result per VM, in the order of vms, with its task
+            status or the error which kept its task from being submitted.
+        '''
+        vms = self.params.get("vms")
+        results = dict()
+        tasks = list()
+        workers = max(self.params.get('workers'), 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            submitted = list()
+            for vm in vms:
+                vm_name = vm.get("name")
+                try:
+                    submitted.append((vm_name, pool.submit(
+                        submit_task, self.get_vm(vm_name), vm)))
+                except Exception as ex:
+                    results[vm_name] = {'status': 'error', 'error': str(ex)}
+
+            for vm_name, future in submitted:
+                try:
+                    tasks.append((vm_name, future.result()))
+                except Exception as ex:
+                    results[vm_name] = {'status': 'error', 'error': str(ex)}
+
+        if self.params.get('async_task'):
+            self.submitted_tasks.extend([task.get('href') for _, task in tasks])
+            task_results = [{'href': task.get('href'), 'status': 'submitted'}
+                            for _, task in tasks]
+        else:
+            task_results = self.wait_for_tasks([task for _, task in tasks])
 
-        return VM(self.client, resource=vapp.get_vm(vm_name))
+        for (vm_name, _), result in zip(tasks, task_results):
+            results[vm_name] = result
+
+        return [dict(vm_name=vm.get("name"), **results[vm.get("name")])
+                for vm in vms]
+
+    def get_operated_vms(self, results):
+        return [result['vm_name'] for result in results
+                if result['status'] in SNAPSHOT_TASK_STATUSES]
+
+    def get_failed_vms(self, results):
+        return [{result['vm_name']: result.get('error') or result['status']}
+                for result in results
+                if result['status'] not in SNAPSHOT_TASK_STATUSES]
 
     def create_snapshot(self):
         response = dict()
         response['changed'] = False
-        vms = self.params.get("vms")
-        for vm in vms:
-            vm_name = vm.get("name")
-            mem_snapshot = vm.get("mem_snapshot")
-            vm_quiesce = vm.get("vm_quiesce")
-            snapshot_name = vm.get("snapshot_name", vm_name)
-            vm = self.get_vm(vm_name)
-            create_task = vm.snapshot_create(
-                memory=mem_snapshot, quiesce=vm_quiesce, name=snapshot_name)
-            self.execute_task(create_task)
+
+        def submit_task(vm, vm_params):
+            vm_name = vm_params.get("name")
+            return vm.snapshot_create(
+                memory=vm_params.get("mem_snapshot"),
+                quiesce=vm_params.get("vm_quiesce"),
+                name=vm_params.get("snapshot_name", vm_name))
+
+        results = self.run_snapshot_tasks(submit_task)
+        failed_vms = self.get_failed_vms(results)
+        if failed_vms:
+            raise Exception(failed_vms)
 
         msg = "Snapshot(s) have been created of VMs {0}"
-        response['msg'] = msg.format([vm.get("name") for vm in vms])
+        response['msg'] = msg.format(self.get_operated_vms(results))
+        response['results'] = results
         response['changed'] = True
 
         return response
@@ -165,48 +251,40 @@ class VMSnapShot(VcdAnsibleModule):
     def delete_snapshot(self):
         response = dict()
         response['changed'] = False
-        vms = self.params.get("vms")
-        warnings = list()
-        operated_vms = list()
-        for vm in vms:
-            try:
-                vm_name = vm.get("name")
-                vm = self.get_vm(vm_name)
-                delete_task = vm.snapshot_remove_all()
-                self.execute_task(delete_task)
-                operated_vms.append(vm_name)
-            except (OperationNotSupportedException, Exception) as ex:
-                warnings.append({vm_name: str(ex)})
+
+        def submit_task(vm, vm_params):
+            return vm.snapshot_remove_all()
+
+        results = self.run_snapshot_tasks(submit_task)
+        operated_vms = self.get_operated_vms(results)
+        warnings = self.get_failed_vms(results)
         if operated_vms:
             msg = "All snapshots for VMs {0} has been deleted"
             response['msg'] = msg.format(operated_vms)
             response['changed'] = True
         if warnings:
             response['warnings'] = str(warnings)
+        response['results'] = results
 
         return response
 
     def revert_snapshot(self):
         response = dict()
         response['changed'] = False
-        vms = self.params.get("vms")
-        warnings = list()
-        operated_vms = list()
-        for vm in vms:
-            try:
-                vm_name = vm.get("name")
-                vm = self.get_vm(vm_name)
-                revert_task = vm.snapshot_revert_to_current()
-                self.execute_task(revert_task)
-                operated_vms.append(vm_name)
-            except (OperationNotSupportedException, Exception) as ex:
-                warnings.append({vm_name: str(ex)})
+
+        def submit_task(vm, vm_params):
+            return vm.snapshot_revert_to_current()
+
+        results = self.run_snapshot_tasks(submit_task)
+        operated_vms = self.get_operated_vms(results)
+        warnings = self.get_failed_vms(results)
         if operated_vms:
             msg = "VMs {0} has been reverted to current snapshot successfully"
             response['msg'] = msg.format(operated_vms)
             response['changed'] = True
         if warnings:
             response['warnings'] = str(warnings)
+        response['results'] = results
 
         return response
 
@@ -234,9 +312,13 @@ class VMSnapShot(VcdAnsibleModule):
         for vm in vms:
             try:
                 vm_name = vm.get("name")
-                vm = self.get_vm(vm_name)
+                vm_resource = self.get_vm_resource(vm_name)
+                if not hasattr(vm_resource, 'SnapshotSection') or \
+                        not hasattr(vm_resource.SnapshotSection, 'Snapshot'):
+                    raise Exception('VM has no snapshot')
+
                 snapshot = dict()
-                for key, value in vm.resource.SnapshotSection.Snapshot.items():
+                for key, value in vm_resource.SnapshotSection.Snapshot.items():
                     if key == "size":
                         value = self.get_formatted_snapshot_size(float(value))
                     snapshot[key] = value
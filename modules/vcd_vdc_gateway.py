@@ -275,8 +275,8 @@ class VdcGW(VcdAnsibleModule):
         super(VdcGW, self).__init__(**kwargs)
         self.vdc_name = self.params.get('vdc_name')
         self.org = self.get_org()
-        vdc_resource = self.org.get_vdc(self.vdc_name)
-        self.vdc = VDC(self.client, name=self.vdc_name, resource=vdc_resource)
+        vdc_href = self.resolver.get_vdc_href(self.org.href, self.vdc_name)
+        self.vdc = VDC(self.client, name=self.vdc_name, href=vdc_href)
 
     def manage_states(self):
         state = self.params.get('state')
@@ -309,14 +309,14 @@ class VdcGW(VcdAnsibleModule):
         return Org(self.client, resource=org_resource)
 
     def get_gateway(self, gateway_name):
-        gateway = self.vdc.get_gateway(gateway_name)
-        if gateway is not None:
-            for key, value in gateway.items():
-                if key == "href":
-                    return Gateway(self.client, name=gateway_name, href=value)
+        try:
+            gateway_href = self.resolver.get_gateway_href(
+                self.vdc.href, gateway_name)
+        except EntityNotFoundException:
+            msg = "Edge gateway {0} is not present"
+            raise EntityNotFoundException(msg.format(gateway_name))
 
-        msg = "Edge gateway {0} is not present"
-        raise EntityNotFoundException(msg.format(gateway_name))
+        return Gateway(self.client, name=gateway_name, href=gateway_href)
 
     def create_gw(self):
         api_version = self.client.get_api_version()
@@ -553,6 +553,7 @@ class VdcGW(VcdAnsibleModule):
             response['warnings'] = ex
         else:
             ip_pool = self.params.get('ext_net_subnet_allocated_ip_pool')
+            networks = list(ip_pool.keys())
             for network, new_ip_range in ip_pool.items():
                 subnet_participation = self._get_subnet_participation(gateway.get_resource(), network)
                 if subnet_participation is None:
@@ -562,7 +563,9 @@ class VdcGW(VcdAnsibleModule):
                 ip_ranges = gateway.get_sub_allocate_ip_ranges_element(subnet_participation)
                 old_ip_range = "{0}-{1}".format(ip_ranges.IpRange.StartAddress, ip_ranges.IpRange.EndAddress)
                 update_task = gateway.edit_sub_allocated_ip_pools(network, old_ip_range, new_ip_range)
-                self.execute_task(update_task)
+                # the gateway is busy till each update is done, only the
+                # last one may be left running with async_task
+                self.execute_task(update_task, wait=network != networks[-1])
             msg = "Ip Pools have been updated on edge gatway {0}"
             response['msg'] = msg.format(gateway_name)
             response['changed'] = True
@@ -583,13 +586,19 @@ class VdcGW(VcdAnsibleModule):
             networks_to_attach = network_settings.keys()
             attached_networks = gateway.list_external_network_ip_allocations().keys()
             networks = list()
+            subnets = list()
             for network in networks_to_attach:
                 if network not in attached_networks:
                     networks.append(network)
                     for ip_settings in network_settings.values():
                         for subnet, ip in ip_settings.items():
-                            add_network_task = gateway.add_external_network(network, [(subnet, ip)])
-                            self.execute_task(add_network_task)
+                            subnets.append((network, subnet, ip))
+            # the gateway is busy till each network is added, only the
+            # last one may be left running with async_task
+            for index, (network, subnet, ip) in enumerate(subnets):
+                add_network_task = gateway.add_external_network(network, [(subnet, ip)])
+                self.execute_task(add_network_task,
+                                  wait=index < len(subnets) - 1)
             if len(networks) == 0:
                 networks = list(networks_to_attach)
                 msg = "Networks {0} are already attached to edge gatway {1}"
@@ -611,9 +620,11 @@ class VdcGW(VcdAnsibleModule):
             response['warnings'] = ex
         else:
             external_networks = self.params.get('external_networks')
-            for network in external_networks:
+            for index, network in enumerate(external_networks):
                 remove_network_task = gateway.remove_external_network(network)
-                self.execute_task(remove_network_task)
+                # only the last removal may be left running with async_task
+                self.execute_task(remove_network_task,
+                                  wait=index < len(external_networks) - 1)
             msg = "Networks {0} have been removed from edge gatway {1}"
             response['msg'] = msg.format(external_networks, gateway_name)
             response['changed'] = True
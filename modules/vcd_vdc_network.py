@@ -219,8 +219,8 @@ class OrgVdcNetwork(VcdAnsibleModule):
         super(OrgVdcNetwork, self).__init__(**kwargs)
         self.vdc_name = self.params.get('vdc_name')
         self.org = self.get_org()
-        vdc_resource = self.org.get_vdc(self.vdc_name)
-        self.vdc = VDC(self.client, name=self.vdc_name, resource=vdc_resource)
+        vdc_href = self.resolver.get_vdc_href(self.org.href, self.vdc_name)
+        self.vdc = VDC(self.client, name=self.vdc_name, href=vdc_href)
 
     def manage_states(self):
         state = self.params.get('state')
@@ -0,0 +1,79 @@
+# Copyright © 2018 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2-Clause OR GPL-3.0-only
+
+import os
+import unittest
+import importlib.util
+
+
+PLUGIN_PATH = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..',
+                           'inventory_plugins', 'vcd.py')
+
+
+def load_plugin():
+    spec = importlib.util.spec_from_file_location('vcd_inventory', PLUGIN_PATH)
+    plugin = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(plugin)
+
+    return plugin
+
+
+def get_vm(org, vdc, vapp, name, vm_id):
+    return {
+        'vcd_org': org,
+        'vcd_vdc': vdc,
+        'vcd_vapp': vapp,
+        'vcd_name': name,
+        'vcd_href': 'https://vcd/api/vApp/vm-{0}'.format(vm_id)
+    }
+
+
+class TestGetHostNames(unittest.TestCase):
+    def setUp(self):
+        self.plugin = load_plugin()
+
+    def test_unique_vm_names_are_kept(self):
+        vms = [get_vm('o', 'v', 'a', 'web', 1), get_vm('o', 'v', 'a', 'db', 2)]
+
+        self.assertEqual(self.plugin.get_host_names(vms), ['web', 'db'])
+
+    def test_shared_vm_names_are_qualified(self):
+        vms = [get_vm('o', 'v1', 'a', 'web', 1),
+               get_vm('o', 'v2', 'a', 'web', 2),
+               get_vm('o', 'v1', 'b', 'web', 3)]
+
+        self.assertEqual(self.plugin.get_host_names(vms),
+                         ['o_v1_a_web', 'o_v2_a_web', 'b_web'])
+
+    def test_qualified_names_do_not_collide(self):
+        # VM a of vApp y and VM y_a would both be named y_a
+        vms = [get_vm('o', 'v', 'y', 'a', 1), get_vm('o', 'v', 'z', 'a', 2),
+               get_vm('o', 'v', 'x', 'y_a', 3)]
+
+        names = self.plugin.get_host_names(vms)
+
+        self.assertEqual(len(set(names)), len(vms))
+        self.assertEqual(names, ['o_v_y_a', 'z_a', 'x_y_a'])
+
+    def test_identical_vms_get_their_id(self):
+        vms = [get_vm('o', 'v', 'a', 'web', 1),
+               get_vm('o', 'v', 'a', 'web', 2)]
+
+        self.assertEqual(self.plugin.get_host_names(vms),
+                         ['o_v_a_web_vm-1', 'o_v_a_web_vm-2'])
+
+    def test_names_do_not_depend_on_order(self):
+        vms = [get_vm('o', 'v', 'y', 'a', 1), get_vm('o', 'v', 'z', 'a', 2),
+               get_vm('o', 'v', 'x', 'y_a', 3), get_vm('p', 'v', 'y', 'a', 4)]
+
+        names = dict(zip([vm['vcd_href'] for vm in vms],
+                         self.plugin.get_host_names(vms)))
+        vms.reverse()
+        reversed_names = dict(zip([vm['vcd_href'] for vm in vms],
+                                  self.plugin.get_host_names(vms)))
+
+        self.assertEqual(names, reversed_names)
+
+
+if __name__ == '__main__':
+    unittest.main()